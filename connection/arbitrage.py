@@ -0,0 +1,292 @@
+"""
+<module AutoTrade.connection.arbitrage>
+Cross-exchange and triangular(cyclic) arbitrage scanner over cached orderbooks.
+Currency graph is built from CCXTConnection.markets once, and only edge rates are refreshed from orderbooks.
+"""
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Libraries
+
+# Standard libraries
+from array import array
+from collections import namedtuple
+from math import log, exp, inf
+
+# External libraries
+
+# Custom libraries
+from connection.orderbook import ArrayOrderbook
+import connection.errors as cerr
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Edges
+#   Market (base, quote) means "1 quote = price base", and each edge takes levels from the best price up to depthBps
+#   of average price slippage(ArrayOrderbook.maxAmountWithin), so
+#       quote -> base: Sell quote to bids; rate = average bid * (1 - fee), capacity = taken bid amount in quote.
+#       base -> quote: Buy quote from asks; rate = (1 / average ask) * (1 - fee), capacity = cost of taken asks in base.
+
+Edge = namedtuple("Edge", ["exchange", "source", "target", "rate", "capacity", "market", "side"])
+Opportunity = namedtuple("Opportunity", ["profit", "size", "edges"])
+
+def depthExecution(orderbook: ArrayOrderbook, side: str, depthBps: float):
+    """
+    <function depthExecution>
+    :return: Execution of taking given side as much as its average price stays within depthBps from the best price,
+        None if the side is empty.
+    """
+    amount = orderbook.maxAmountWithin(side, depthBps)
+    return orderbook.execution(side, amount) if amount > 0 else None
+
+def marketEdges(exchange: str, base: str, quote: str, orderbook, fee: float, depthBps: float = 0.0) -> list:
+    """
+    <function marketEdges>
+    :param orderbook: ArrayOrderbook or CCXTConnection's dict orderbook.
+    :param depthBps: Allowed slippage of average price in basis points. 0 takes the best level only.
+    :return: Executable edges of given market's orderbook within depthBps, including taker fee.
+    """
+    if not isinstance(orderbook, ArrayOrderbook): orderbook = ArrayOrderbook.fromDict(orderbook)
+    edges = []
+    bid, ask = depthExecution(orderbook, "bids", depthBps), depthExecution(orderbook, "asks", depthBps)
+    if bid is not None and bid.averagePrice > 0:
+        edges.append(Edge(exchange, quote, base, bid.averagePrice * (1 - fee), bid.amount, (base, quote), "bids"))
+    if ask is not None and ask.averagePrice > 0:
+        edges.append(Edge(exchange, base, quote, (1 - fee) / ask.averagePrice, ask.cost, (base, quote), "asks"))
+    return edges
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Scanner
+
+class ArbitrageScanner:
+    """
+    <class ArbitrageScanner>
+    Find profitable cycles over all markets of CCXTConnection.
+    Nodes are (exchange, currency). Same currency on different exchanges can be connected by transfer edges,
+    so cycles may cross exchanges. Cycles are found by Bellman-Ford on -log(rate) weights, relaxed in pure Python
+    over flat edge arrays built once per update.
+    """
+
+    def __init__(self, connection, defaultFee: float = 0.0025, transferFees: dict = None, crossExchange: bool = True,
+                 depthBps: float = 0.0):
+        """
+        <method ArbitrageScanner.__init__>
+        :param defaultFee: Taker fee used if market information doesn't have one.
+        :param transferFees: {currency: Ratio lost when moved between exchanges}.
+            Transfers are neither free nor instant, so only currencies given here get transfer edges.
+        :param crossExchange: If True then transfer edges between exchanges are included in cycles.
+        :param depthBps: Allowed slippage of each edge's average price in basis points, passed to marketEdges.
+        """
+        self.connection = connection
+        self.defaultFee = defaultFee
+        self.transferFees = dict(transferFees) if transferFees else {}
+        self.crossExchange = crossExchange
+        self.depthBps = depthBps
+        self.buildGraph()
+
+    def buildGraph(self):
+        """
+        <method ArbitrageScanner.buildGraph>
+        Build node index and market list from connection's markets. Call again when markets change.
+        """
+        self.nodes, self.nodeIndex = [], {} # [(exchange, currency), ..], {(exchange, currency): index}
+        self.fees = {} # {(exchange, base, quote): taker fee}
+        for exchangeName, markets in self.connection.markets.items():
+            for base in markets:
+                for quote, market in markets[base].items():
+                    fee = market.get("taker") if isinstance(market, dict) else None
+                    self.fees[exchangeName, base, quote] = float(fee) if fee is not None else self.defaultFee
+                    for currency in (base, quote):
+                        if (exchangeName, currency) not in self.nodeIndex:
+                            self.nodeIndex[exchangeName, currency] = len(self.nodes)
+                            self.nodes.append((exchangeName, currency))
+        self.edges = [] # [Edge, ..]
+
+    def fee(self, exchange: str, base: str, quote: str) -> float:
+        """
+        <method ArbitrageScanner.fee>
+        :return: Taker fee of given market, trying reversed market if given one is not listed.
+        """
+        return self.fees.get((exchange, base, quote), self.fees.get((exchange, quote, base), self.defaultFee))
+
+    def update(self, orderbooks: dict) -> list:
+        """
+        <method ArbitrageScanner.update>
+        Rebuild edges from given orderbooks.
+        :param orderbooks: {exchange: {base: {quote: orderbook}}}, like result of CCXTConnection.fetchOrderbooks.
+            Reversed orderbooks are fine since edges are directed by currencies.
+        :return: List of edges.
+        """
+        edges = []
+        for exchangeName in orderbooks:
+            for base in orderbooks[exchangeName]:
+                for quote, orderbook in orderbooks[exchangeName][base].items():
+                    if orderbook is None: continue
+                    edges.extend(marketEdges(exchangeName, base, quote, orderbook,
+                                             self.fee(exchangeName, base, quote), self.depthBps))
+        if self.crossExchange:
+            exchangesByCurrency = {}
+            for exchangeName, currency in self.nodes:
+                if currency in self.transferFees: exchangesByCurrency.setdefault(currency, []).append(exchangeName)
+            for currency, exchangeNames in exchangesByCurrency.items():
+                rate = 1 - self.transferFees[currency]
+                for source in exchangeNames:
+                    for target in exchangeNames:
+                        if source != target: edges.append(Edge((source, target), currency, currency, rate, inf, None, None))
+        self.edges = edges
+        return edges
+
+    def __edgeNodes(self, edge: Edge) -> (int, int):
+        if isinstance(edge.exchange, tuple): # Transfer edge
+            return self.nodeIndex[edge.exchange[0], edge.source], self.nodeIndex[edge.exchange[1], edge.target]
+        return self.nodeIndex[edge.exchange, edge.source], self.nodeIndex[edge.exchange, edge.target]
+
+    # ------------------------------------------------------------------------------------------------------------------
+    # Cycle detection
+
+    def findCycles(self, minProfit: float = 0.0) -> list:
+        """
+        <method ArbitrageScanner.findCycles>
+        Find profitable cycles among current edges by Bellman-Ford from virtual source connected to all nodes.
+        Each pass checks every edge in one Python loop over flat arrays; This is not numerically vectorized.
+        :param minProfit: Minimum ratio of profit, e.g. 0.001 for 0.1%.
+        :return: List of Opportunity(profit ratio, max size in first edge's source currency, edges) sorted by profit.
+        """
+        edgeList = [edge for edge in self.edges if isinstance(edge.exchange, tuple) or # Skip markets not in graph
+                    ((edge.exchange, edge.source) in self.nodeIndex and (edge.exchange, edge.target) in self.nodeIndex)]
+        nodeCount = len(self.nodes)
+        sources, targets = array("l"), array("l")
+        for edge in edgeList:
+            source, target = self.__edgeNodes(edge)
+            sources.append(source)
+            targets.append(target)
+        weights = array("d", (-log(edge.rate) for edge in edgeList))
+
+        # Relax all edges nodeCount times; Stop early if nothing is relaxed
+        distance, predecessor = array("d", [0.0]) * nodeCount, array("l", [-1]) * nodeCount
+        relaxed = []
+        for _ in range(nodeCount):
+            relaxed = [index for index in range(len(edgeList))
+                       if distance[sources[index]] + weights[index] < distance[targets[index]] - 1e-12]
+            if not relaxed: return []
+            for index in relaxed:
+                newDistance = distance[sources[index]] + weights[index]
+                if newDistance < distance[targets[index]]:
+                    distance[targets[index]] = newDistance
+                    predecessor[targets[index]] = index
+
+        # Edges still relaxable lead to negative cycles; Walk back predecessors to find each cycle
+        found, seen = [], set()
+        for index in relaxed:
+            node = targets[index]
+            for _ in range(nodeCount): # Move into the cycle
+                if predecessor[node] < 0: break
+                node = sources[predecessor[node]]
+            else:
+                cycle, current = [], node
+                while True:
+                    edgeIndex = predecessor[current]
+                    cycle.append(edgeIndex)
+                    current = sources[edgeIndex]
+                    if current == node or len(cycle) > nodeCount: break
+                if current != node: continue
+                cycle.reverse()
+                key = frozenset(cycle)
+                if key in seen: continue
+                seen.add(key)
+                opportunity = self.evaluate([edgeList[edgeIndex] for edgeIndex in cycle])
+                if opportunity.profit > minProfit: found.append(opportunity)
+        found.sort(key = lambda opportunity: -opportunity.profit)
+        return found
+
+    @staticmethod
+    def evaluate(edges: list) -> Opportunity:
+        """
+        <static method ArbitrageScanner.evaluate>
+        :return: Opportunity of given edge path; Size is the max amount of first source currency executable
+            within every edge's capacity.
+        """
+        logRate, size, carried = 0.0, inf, 1.0 # carried: Amount after previous edges per 1 of start currency
+        for edge in edges:
+            size = min(size, edge.capacity / carried)
+            carried *= edge.rate
+            logRate += log(edge.rate)
+        return Opportunity(exp(logRate) - 1, size, tuple(edges))
+
+    def crossExchangePairs(self, minProfit: float = 0.0) -> list:
+        """
+        <method ArbitrageScanner.crossExchangePairs>
+        Direct scan of same market on different exchanges; Buy quote on one exchange and sell on another.
+        :return: List of Opportunity whose size is in base currency, sorted by profit.
+        """
+        buys, sells = {}, {} # {(base, quote): [Edge, ..]}
+        for edge in self.edges:
+            if edge.side == "asks": buys.setdefault(edge.market, []).append(edge)
+            elif edge.side == "bids": sells.setdefault(edge.market, []).append(edge)
+        found = []
+        for market in buys.keys() & sells.keys():
+            for buy in buys[market]:
+                for sell in sells[market]:
+                    if buy.exchange == sell.exchange: continue
+                    opportunity = ArbitrageScanner.evaluate([buy, sell])
+                    if opportunity.profit > minProfit: found.append(opportunity)
+        found.sort(key = lambda opportunity: -opportunity.profit)
+        return found
+
+    async def scan(self, targets: list, minProfit: float = 0.0, **fetchKwargs) -> dict:
+        """
+        <async method ArbitrageScanner.scan>
+        Fetch orderbooks by CCXTConnection.fetchOrderbooksPartial, then find opportunities.
+        :param targets: [(exchange, base, quote), ..]. Should be chosen explicitly;
+            Fetching every market in the graph costs too much call limit.
+        :param fetchKwargs: Passed to fetchOrderbooksPartial, e.g. deadline.
+        :return: {"cycles": [Opportunity, ..], "pairs": [Opportunity, ..], "status": Fetching status}
+        """
+        if not targets: raise cerr.InvalidValueError("No market to scan")
+        fetchKwargs.setdefault("arrayForm", True)
+        orderbooks, status = await self.connection.fetchOrderbooksPartial(targets, **fetchKwargs)
+        self.update(orderbooks)
+        return {"cycles": self.findCycles(minProfit), "pairs": self.crossExchangePairs(minProfit), "status": status}
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Functionality Testing
+
+if __name__ == "__main__":
+
+    from pprint import pprint
+
+    class FakeConnection:
+        markets = {
+            "A": {"USDT": {"BTC": {"taker": 0.001}, "ETH": {"taker": 0.001}}, "BTC": {"ETH": {"taker": 0.001}}},
+            "B": {"USDT": {"BTC": {"taker": 0.001}}},
+        }
+    book = lambda bid, ask: ArrayOrderbook.fromCCXT({"bids": [[bid, 2]], "asks": [[ask, 2]]})
+    orderbooks = {
+        "A": {"USDT": {"BTC": book(29990, 30000), "ETH": book(2010, 2011)}, "BTC": {"ETH": book(0.0650, 0.0651)}},
+        "B": {"USDT": {"BTC": book(30300, 30310)}},
+    }
+    # Transfers have no cost given, so only same exchange cycles and direct pairs are found
+    scanner = ArbitrageScanner(FakeConnection())
+    scanner.update(orderbooks)
+    assert all(edge.market is not None for edge in scanner.edges)
+    assert all(len({edge.exchange for edge in opportunity.edges}) == 1 for opportunity in scanner.findCycles())
+
+    # Transfer edges only for currencies with explicit cost
+    scanner = ArbitrageScanner(FakeConnection(), transferFees = {"USDT": 0.001, "BTC": 0.0005})
+    scanner.update(orderbooks)
+    assert {edge.source for edge in scanner.edges if edge.market is None} == {"USDT", "BTC"}
+    for opportunity in scanner.findCycles():
+        print("Cycle profit %.4f%%, size %.6f" % (opportunity.profit * 100, opportunity.size))
+        for edge in opportunity.edges: print("   ", edge.exchange, edge.source, "->", edge.target, "%.8f" % edge.rate)
+    for opportunity in scanner.crossExchangePairs():
+        print("Pair profit %.4f%%, size %.6f" % (opportunity.profit * 100, opportunity.size),
+              [(edge.exchange, edge.source, edge.target) for edge in opportunity.edges])
+
+    # Capacity is limited by depth; Best level only by default, deeper levels within depthBps
+    deepBook = ArrayOrderbook.fromCCXT({"bids": [[100, 1], [99.5, 1], [90, 10]], "asks": [[101, 1], [101.5, 1], [110, 10]]})
+    sell, buy = marketEdges("A", "USDT", "X", deepBook, 0.0)
+    assert (sell.source, sell.capacity, sell.rate) == ("X", 1, 100) and (buy.capacity, buy.rate) == (101, 1 / 101)
+    sell, buy = marketEdges("A", "USDT", "X", deepBook, 0.0, depthBps = 30)
+    assert 2 < sell.capacity < 2.1 and 99.7 - 1e-9 <= sell.rate < 100 # Partially takes the 90 level
+    assert 202.5 < buy.capacity < 215 and 1 / 101 > buy.rate >= 1 / (101 * 1.003) - 1e-12
+    assert marketEdges("A", "USDT", "X", deepBook.toDict(), 0.0, depthBps = 30) == [sell, buy]
+    assert marketEdges("A", "USDT", "X", ArrayOrderbook(), 0.0) == []
+    print("All checks passed")
@@ -0,0 +1,248 @@
+"""
+<module AutoTrade.connection.balance_cache>
+Account balances maintained locally from order reservations and fills, with periodic authoritative resync.
+"""
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Libraries
+
+# Standard libraries
+import asyncio
+import time
+from decimal import Decimal
+
+# External libraries
+
+# Custom libraries
+import connection.errors as cerr
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Balance cache
+
+_zero = Decimal(0)
+
+class BalanceCache:
+    """
+    <class BalanceCache>
+    Balances of CCXTConnection kept as {exchange: {currency: {"free": Decimal, "used": Decimal, "total": Decimal}}},
+    the same structure as CCXTConnection.balance, which refers to self.balances.
+    Between resyncs, balances are adjusted by OrderTracker events without any API call:
+        - created: Reserve order cost(buy: price * amount of base, sell: amount of quote); free -> used.
+        - fill: Spend reserved currency and receive the other one at the fill price.
+        - canceled / closed: Release remaining reservation; used -> free.
+    Trading fees are not applied locally, so they are corrected by the next resync.
+    Resync reconciles OrderTracker first, and events whose exchange timestamps are earlier than the time
+    balances were requested are ignored since fetched balances already reflect them. Events without timestamp
+    are always applied, so changes within the resync round-trip on such exchanges may be counted twice.
+    Orders created before balances of their exchange are first set have no local reservation, so their later events
+    are ignored until a resync requested after their creation includes them.
+    """
+
+    def __init__(self, connection, ttl: float = 60.0):
+        """
+        <method BalanceCache.__init__>
+        :param connection: CCXTConnection.
+        :param ttl: Seconds after last resync until balances of an exchange are considered stale.
+        """
+        self.connection = connection
+        self.ttl = ttl
+        self.balances = {} # {exchange: {currency: {"free": ~, "used": ~, "total": ~}}}
+        self.syncedTime = {} # {exchange: time.monotonic() of last resync}
+        self.syncedAt = {} # {exchange: Exchange time in epoch milliseconds when last synchronized balances were requested}
+        self.unreserved = {} # {(exchange, order ID): TrackedOrder} created before balances of the exchange were set
+        self.__resyncer = None
+
+    # ------------------------------------------------------------------------------------------------------------------
+    # Reading
+
+    def free(self, exchange: str, currency: str) -> Decimal:
+        try: return self.balances[exchange][currency]["free"]
+        except KeyError: return _zero
+
+    def used(self, exchange: str, currency: str) -> Decimal:
+        try: return self.balances[exchange][currency]["used"]
+        except KeyError: return _zero
+
+    def total(self, exchange: str, currency: str) -> Decimal:
+        try: return self.balances[exchange][currency]["total"]
+        except KeyError: return _zero
+
+    def isStale(self, exchange: str) -> bool:
+        """
+        <method BalanceCache.isStale>
+        :return: If balances of given exchange are not synchronized within TTL.
+        """
+        return exchange not in self.syncedTime or time.monotonic() - self.syncedTime[exchange] > self.ttl
+
+    # ------------------------------------------------------------------------------------------------------------------
+    # Authoritative synchronization
+
+    def exchangeTime(self, exchange: str) -> int:
+        """
+        <method BalanceCache.exchangeTime>
+        :return: Current time of given exchange in epoch milliseconds, by the exchange object's clock
+            adjusted by ccxt's measured time difference. Local time if the exchange has no clock.
+        """
+        exchangeObject = self.connection.exchanges.get(exchange)
+        if exchangeObject is None or not hasattr(exchangeObject, "milliseconds"): return int(time.time() * 1000)
+        return exchangeObject.milliseconds() - (getattr(exchangeObject, "options", None) or {}).get("timeDifference", 0)
+
+    def set(self, exchange: str, balance: dict, asOf: int = None):
+        """
+        <method BalanceCache.set>
+        Replace balances of given exchange with freshly fetched ones.
+        :param balance: Result of CCXTConnection.fetchBalance.
+        :param asOf: Exchange time in epoch milliseconds when the balance was requested.
+            Order events earlier than this are ignored. If None, all later events are applied.
+        """
+        self.balances[exchange] = balance
+        self.syncedTime[exchange] = time.monotonic()
+        if asOf is None: self.syncedAt.pop(exchange, None)
+        else:
+            self.syncedAt[exchange] = asOf
+            for key, order in tuple(self.unreserved.items()): # Fetched balance includes their reservations
+                if order.exchange == exchange and order.timestamp is not None and order.timestamp < asOf:
+                    del self.unreserved[key]
+
+    async def resync(self, *exchanges):
+        """
+        <async method BalanceCache.resync>
+        Fetch balances of given exchanges(all exchanges with API key if not given) from exchanges.
+        Tracked orders are reconciled first, so fills before the request are not applied again afterwards.
+        """
+        if not exchanges: exchanges = [name for name, exchange in self.connection.exchanges.items() if exchange.apiKey]
+        await asyncio.gather(*(self.__resyncExchange(exchange) for exchange in exchanges))
+
+    async def __resyncExchange(self, exchange: str):
+        await self.connection.orders.reconcile(exchange)
+        asOf = self.exchangeTime(exchange)
+        self.set(exchange, await self.connection.fetchBalance(exchange, True), asOf)
+
+    async def ensureFresh(self, exchange: str):
+        """
+        <async method BalanceCache.ensureFresh>
+        Resync given exchange only if its balances are stale.
+        """
+        if self.isStale(exchange): await self.resync(exchange)
+
+    async def run(self, interval: float = None):
+        """
+        <async method BalanceCache.run>
+        Resync stale exchanges periodically. Failure is printed and retried at next round.
+        :param interval: Seconds between checks. Default to TTL / 2.
+        """
+        interval = interval if interval is not None else self.ttl / 2
+        while True:
+            stale = [name for name, exchange in self.connection.exchanges.items() if exchange.apiKey and self.isStale(name)]
+            if stale:
+                try: await self.resync(*stale)
+                except Exception as err:
+                    print("[Warning] Failed to resync balances of %s: <%s: %s>" % (stale, type(err).__name__, err))
+            await asyncio.sleep(interval)
+
+    def start(self, interval: float = None):
+        """
+        <method BalanceCache.start>
+        Start periodic resync in background. Should be called in running event loop.
+        """
+        if self.__resyncer is not None and not self.__resyncer.done():
+            raise cerr.InvalidError("Balance cache is already running")
+        self.__resyncer = asyncio.ensure_future(self.run(interval))
+
+    async def stop(self):
+        """
+        <async method BalanceCache.stop>
+        Stop periodic resync.
+        """
+        if self.__resyncer is not None:
+            self.__resyncer.cancel()
+            await asyncio.gather(self.__resyncer, return_exceptions = True)
+            self.__resyncer = None
+
+    # ------------------------------------------------------------------------------------------------------------------
+    # Local updates
+
+    def adjust(self, exchange: str, currency: str, free = _zero, used = _zero):
+        """
+        <method BalanceCache.adjust>
+        Add given differences to balance of given currency. Total is free + used.
+        """
+        entry = self.balances.setdefault(exchange, {}).setdefault(currency, {"free": _zero, "used": _zero, "total": _zero})
+        entry["free"] += free
+        entry["used"] += used
+        entry["total"] += free + used
+
+    def onOrderEvent(self, event):
+        """
+        <method BalanceCache.onOrderEvent>
+        Apply OrderTracker's event to local balances. Subscribe this to OrderTracker.
+        """
+        order = event.order
+        key = (order.exchange, order.orderID)
+        if order.exchange not in self.balances: # Not loaded yet; Next resync will include it
+            if event.kind == "created": self.unreserved[key] = order
+            return
+        elif key in self.unreserved: # Reservation was never applied, so fill or release would make used negative
+            if event.kind in ("canceled", "closed"): del self.unreserved[key]
+            return
+        elif event.timestamp is not None and event.timestamp < self.syncedAt.get(order.exchange, float("-inf")):
+            return # Already reflected in fetched balances
+        if order.buy: reservedCurrency, reservedPerAmount = order.base, order.price
+        else: reservedCurrency, reservedPerAmount = order.quote, Decimal(1)
+
+        if event.kind == "created": # free -> used
+            reserved = reservedPerAmount * order.amount
+            self.adjust(order.exchange, reservedCurrency, free = -reserved, used = reserved)
+        elif event.kind == "fill":
+            price, filled = Decimal(event.price), event.filled
+            if order.buy: # Paid price * filled base from reservation at order price, received filled quote
+                self.adjust(order.exchange, order.base, free = (order.price - price) * filled, used = -order.price * filled)
+                self.adjust(order.exchange, order.quote, free = filled)
+            else: # Paid filled quote from reservation, received price * filled base
+                self.adjust(order.exchange, order.quote, used = -filled)
+                self.adjust(order.exchange, order.base, free = price * filled)
+        elif event.kind in ("canceled", "closed"): # Release remaining reservation
+            remaining = reservedPerAmount * order.remaining
+            if remaining > 0: self.adjust(order.exchange, reservedCurrency, free = remaining, used = -remaining)
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Functionality Testing
+
+if __name__ == "__main__":
+
+    import timeit
+    from connection.order_tracker import OrderTracker
+
+    class FakeConnection: exchanges = {}
+    cache = BalanceCache(FakeConnection())
+    cache.set("Fake", {"KRW": {"free": Decimal(1000000), "used": _zero, "total": Decimal(1000000)}})
+    tracker = OrderTracker(FakeConnection())
+    tracker.subscribe(cache.onOrderEvent)
+
+    order = tracker.record("Fake", "A", "KRW", "BTC", 100000, 2, True) # Reserve 200000 KRW
+    print("After order:", cache.balances)
+    assert cache.free("Fake", "KRW") == 800000 and cache.used("Fake", "KRW") == 200000
+    tracker.apply(order, {"filled": 1, "average": 99000, "status": "open"})
+    print("After fill:", cache.balances)
+    assert cache.free("Fake", "KRW") == 801000 and cache.used("Fake", "KRW") == 100000 and cache.free("Fake", "BTC") == 1
+    tracker.apply(order, {"filled": 1, "average": 99000, "status": "canceled"})
+    print("After cancel:", cache.balances)
+    assert cache.free("Fake", "KRW") == 901000 and cache.used("Fake", "KRW") == 0 and cache.total("Fake", "KRW") == 901000
+
+    # Events already reflected in fetched balances are ignored
+    cache.set("Fake", {"KRW": {"free": Decimal(1000000), "used": _zero, "total": Decimal(1000000)}}, asOf = 5000)
+    order = tracker.record("Fake", "B", "KRW", "BTC", 100000, 1, True, timestamp = 4000)
+    assert cache.free("Fake", "KRW") == 1000000
+
+    # Orders created before the first balance set are not reserved, so their events don't make used negative
+    order = tracker.record("Other", "C", "KRW", "BTC", 100000, 1, True, timestamp = 1000)
+    cache.set("Other", {"KRW": {"free": Decimal(900000), "used": Decimal(100000), "total": Decimal(1000000)}})
+    tracker.apply(order, {"filled": 0.5, "average": 100000, "status": "open"})
+    assert cache.used("Other", "KRW") == 100000 and cache.free("Other", "BTC") == 0
+    cache.set("Other", {"KRW": {"free": Decimal(900000), "used": Decimal(50000), "total": Decimal(950000)}}, asOf = 2000)
+    tracker.apply(order, {"filled": 1, "average": 100000, "status": "closed"}) # Now reserved in fetched balance
+    assert cache.used("Other", "KRW") == 0 and cache.free("Other", "BTC") == Decimal("0.5") and not cache.unreserved
+    print("All checks passed")
+
+    number = 1000000
+    print("free() read: %.3f us" % (timeit.timeit(lambda: cache.free("Fake", "KRW"), number = number) / number * 1e6))
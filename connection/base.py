@@ -8,6 +8,10 @@ This module is used to describe the abstraction of all type of connection.
 # Standard libraries
 import time
 import queue
+import asyncio
+import heapq
+from contextlib import asynccontextmanager
+from itertools import count
 from decimal import Decimal
 from datetime import datetime, timedelta
 import atexit
@@ -25,6 +29,9 @@ import utility
 # All exceptions are default to catch in call rate limiter
 _defaultCatching = frozenset([cerr.AutoTradeConnectionError,])
 
+# Arrival order of waitingCall waiters, breaking ties of priority
+_waitingOrder = count()
+
 # ABC for Connection
 class AbstractConnection:
     """
@@ -85,6 +92,8 @@ class AbstractConnection:
             - reserved_weight (numeric): Sum of all reserved weights. Added due to the failure of the process.
             - current_weight (numeric): Sum of all weights in current history.
             - oldest_timestamp (datetime.datetime): Oldest timestamp in history.
+            - waiters (list): Heap of (priority, order) of calls waiting in waitingCall.
+            - turn (asyncio.Event or None): Set when a waiter leaves, so other waiters check their turn again.
         :param callFieldName:   The name of call field.
         :param timeInterval:    Call history saving time in seconds.
         :param maxWeight:       Max call weight capacity for time interval.
@@ -109,7 +118,8 @@ class AbstractConnection:
             raise cerr.InvalidError("Invalid timeInterval type(%s) given for call field" % (type(timeInterval)))
         self.callLimits[callFieldName] = {"time_interval": timeInterval, "max_weight": maxWeight,
                                           "current_weight": 0, "reserved_weight": 0,
-                                          "oldest_timestamp": datetime.min, "history": queue.PriorityQueue()}
+                                          "oldest_timestamp": datetime.min, "history": queue.PriorityQueue(),
+                                          "waiters": [], "turn": None}
 
     def refreshCallField(self, callFieldName: str):
         """
@@ -146,7 +156,8 @@ class AbstractConnection:
 
         # If total weight is not exceeded then the new call is possible
         thisCallLimit = self.callLimits[callFieldName]
-        if thisCallLimit["oldest_time"] != datetime.min and datetime.now() - thisCallLimit["time_interval"] > thisCallLimit["oldest_timestamp"]:
+        if not thisCallLimit["history"].empty() and (thisCallLimit["oldest_timestamp"] == datetime.min or # Not refreshed yet
+                datetime.now() - thisCallLimit["time_interval"] > thisCallLimit["oldest_timestamp"]):
             self.refreshCallField(callFieldName)
         return thisCallLimit["current_weight"] + thisCallLimit["reserved_weight"] + weight <= thisCallLimit["max_weight"]
 
@@ -256,7 +267,7 @@ class AbstractConnection:
             # Concept of reserved weight is from handling concurrency.
             thisCallLimit = self.callLimits[callFieldName]
             thisCallLimit["reserved_weight"] += callWeight
-            try: result = method(self, *args, **kwargs) # Main process
+            try: result = await method(self, *args, **kwargs) # Main process
             except self.__catching_tuple as err: # Cancelled calling so there is no new call history
                 thisCallLimit["reserved_weight"] -= callWeight
                 raise err.with_traceback(exc_info()[2])
@@ -272,6 +283,138 @@ class AbstractConnection:
                 return result
         return decorated
 
+    # ------------------------------------------------------------------------------------------------------------------
+    # Call related; Waiting limiter
+
+    def secondsUntilPossible(self, callFieldName: str, weight: (int, float, Decimal)) -> float:
+        """
+        <method AbstractConnection.secondsUntilPossible>
+        :return: Seconds until the call with given field name and weight becomes possible by expiration of history,
+            0 if possible now. Calls being reserved may make it longer.
+        """
+        if self.isPossibleCall(callFieldName, weight): return 0.0
+        thisCallLimit = self.callLimits[callFieldName]
+        excess = thisCallLimit["current_weight"] + thisCallLimit["reserved_weight"] + weight - thisCallLimit["max_weight"]
+        now = datetime.now()
+        for timestamp, historyWeight in sorted(thisCallLimit["history"].queue):
+            excess -= historyWeight
+            if excess <= 0: return max(0.0, (timestamp + thisCallLimit["time_interval"] - now).total_seconds())
+        return thisCallLimit["time_interval"].total_seconds() # Only reserved weights block this call
+
+    @asynccontextmanager
+    async def waitingCall(self, callFieldName: str, weight: (int, float, Decimal), priority: int = 0):
+        """
+        <async context manager AbstractConnection.waitingCall>
+        Wait until the call with given field name and weight is possible instead of raising, then reserve the weight
+        while the context is running. Weight is put on history when the context exits, unless the exception
+        raised in the context is one of tolerated exceptions(the call is considered as not sent).
+        :param priority: Waiters of same field take weight in priority order(lower value first), then in arrival order;
+            A call never takes weight while more urgent call is waiting for the field.
+        """
+        if not callFieldName or weight == 0:
+            yield
+            return
+        elif callFieldName in self.callLimits and weight > self.callLimits[callFieldName]["max_weight"]:
+            raise cerr.CallLimitExceededError(self.name, callFieldName)
+        elif not self.isPossibleCall(callFieldName, weight) or self.callLimits[callFieldName]["waiters"]:
+            await self.__waitTurn(callFieldName, weight, priority)
+
+        # No await between checking and reserving, so concurrent waiters can't both take the last weight
+        thisCallLimit = self.callLimits[callFieldName]
+        thisCallLimit["reserved_weight"] += weight
+        try: yield
+        except self.__catching_tuple:
+            thisCallLimit["reserved_weight"] -= weight
+            raise
+        except BaseException:
+            thisCallLimit["history"].put((datetime.now(), weight))
+            thisCallLimit["current_weight"] += weight
+            thisCallLimit["reserved_weight"] -= weight
+            raise
+        else:
+            thisCallLimit["history"].put((datetime.now(), weight))
+            thisCallLimit["current_weight"] += weight
+            thisCallLimit["reserved_weight"] -= weight
+
+    async def __waitTurn(self, callFieldName: str, weight: (int, float, Decimal), priority: int):
+        """
+        <async method AbstractConnection.__waitTurn>
+        Wait until given call is the most urgent waiter of the field and its weight is possible.
+        Only the most urgent waiter polls the limit; Others sleep until some waiter leaves.
+        """
+        thisCallLimit = self.callLimits[callFieldName]
+        ticket = (priority, next(_waitingOrder))
+        heapq.heappush(thisCallLimit["waiters"], ticket)
+        try:
+            while True:
+                if thisCallLimit["waiters"][0] != ticket:
+                    if thisCallLimit["turn"] is None: thisCallLimit["turn"] = asyncio.Event()
+                    await thisCallLimit["turn"].wait()
+                elif self.isPossibleCall(callFieldName, weight): return
+                else: await asyncio.sleep(max(self.secondsUntilPossible(callFieldName, weight), 0.001))
+        finally:
+            thisCallLimit["waiters"].remove(ticket)
+            heapq.heapify(thisCallLimit["waiters"])
+            turn, thisCallLimit["turn"] = thisCallLimit["turn"], None
+            if turn is not None: turn.set()
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Priority gate: Limit concurrent calls, letting urgent calls(e.g. orders) go before others(e.g. data fetching)
+
+class PriorityGate:
+    """
+    <class PriorityGate>
+    Asynchronous semaphore whose waiters are woken in priority order(lower value first), then in arrival order.
+    """
+
+    def __init__(self, concurrency: int):
+        if not (isinstance(concurrency, int) and concurrency > 0):
+            raise cerr.InvalidValueError("Concurrency should be positive integer(%s given)" % (concurrency,))
+        self.concurrency = concurrency
+        self.active = 0
+        self.__waiters = [] # Heap of (priority, order, future)
+        self.__order = count()
+
+    def waiting(self) -> int: return sum(1 for _, _, future in self.__waiters if not future.done())
+
+    async def acquire(self, priority: int = 0):
+        """
+        <async method PriorityGate.acquire>
+        Wait until a slot is given to this caller.
+        """
+        if self.active < self.concurrency and not self.waiting():
+            self.active += 1
+            return
+        future = asyncio.get_event_loop().create_future()
+        heapq.heappush(self.__waiters, (priority, next(self.__order), future))
+        try: await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled(): self.release() # Slot was given right before cancellation
+            raise
+
+    def release(self):
+        """
+        <method PriorityGate.release>
+        Return a slot and wake the most urgent waiter.
+        """
+        self.active -= 1
+        while self.__waiters:
+            _, _, future = heapq.heappop(self.__waiters)
+            if not future.done():
+                self.active += 1
+                future.set_result(None)
+                break
+
+    @asynccontextmanager
+    async def slot(self, priority: int = 0):
+        """
+        <async context manager PriorityGate.slot>
+        Hold a slot while the context is running.
+        """
+        await self.acquire(priority)
+        try: yield self
+        finally: self.release()
+
 # ----------------------------------------------------------------------------------------------------------------------
 # Auto termination at exit. It is not guaranteed to work in all situations; This works only for normal termination.
 def terminateSessionAtExit(session: AbstractConnection):
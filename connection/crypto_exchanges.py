@@ -10,18 +10,43 @@ The reason why I made this is to avoid IP ban due to exceed the API call limit.
 # Standard libraries
 import asyncio
 import atexit
+import json
+import os
+import time
+from contextlib import AsyncExitStack
 from decimal import Decimal
 
 # External libraries
 import ccxt.async_support as ccxt
 
 # Custom libraries
-from connection.base import AbstractConnection
+from connection.base import AbstractConnection, PriorityGate
+from connection.orderbook import ArrayOrderbook
+from connection.routes import RouteIndex
+from connection.order_tracker import OrderTracker
+from connection.balance_cache import BalanceCache
+from connection.simulated_exchange import SimulatedExchange
 import connection.errors as cerr
 
 # ----------------------------------------------------------------------------------------------------------------------
 # CCXT binder
 
+# ----------------------------------------------------------------------------------------------------------------------
+# Call weights of exchanges
+#   Weights depending on arguments are given as functions of the ccxt method's arguments.
+
+def _binanceDepthWeight(symbol: str = None, limit: int = None, *args, **kwargs) -> int:
+    if limit is None or limit <= 100: return 5
+    elif limit <= 500: return 25
+    elif limit <= 1000: return 50
+    else: return 250
+
+def _binanceOpenOrdersWeight(symbol: str = None, *args, **kwargs) -> int:
+    return 6 if symbol else 80
+
+def _batchLength(items: (list, tuple), *args, **kwargs) -> int:
+    return len(items) # Batch methods(createOrders, cancelOrders) take list of orders or IDs first
+
 class CCXTConnection(AbstractConnection):
     """
     <class CCXTConnection>
@@ -32,48 +57,223 @@ class CCXTConnection(AbstractConnection):
     supportingExchanges = {
         "Binance": ccxt.binance,
         "Bithumb": ccxt.bithumb,
-        "Upbit": ccxt.upbit
+        "Upbit": ccxt.upbit,
+        "Simulated": SimulatedExchange, # Configured by its key dict; See SimulatedExchange
+    }
+
+    # Call limits of exchanges, from their API documents;
+    #   "fields": {field: (time interval in seconds, max weight)}, registered as "<exchange>.<field>" call fields.
+    #   "weights": {ccxt method: {field: weight or function of arguments}}, "default" for methods not listed.
+    callProfiles = {
+        "Binance": {
+            "fields": {"requestWeight": (60, 6000), "orders": (10, 100)},
+            "weights": {
+                "load_markets": {"requestWeight": 20},
+                "fetch_order_book": {"requestWeight": _binanceDepthWeight},
+                "fetch_balance": {"requestWeight": 20},
+                "fetchOrder": {"requestWeight": 4},
+                "fetchOpenOrders": {"requestWeight": _binanceOpenOrdersWeight},
+                "fetchClosedOrders": {"requestWeight": 20},
+                "createOrder": {"requestWeight": 1, "orders": 1},
+                "cancelOrder": {"requestWeight": 1},
+                "createOrders": {"requestWeight": 5, "orders": _batchLength},
+                "cancelOrders": {"requestWeight": 1},
+                "default": {"requestWeight": 1},
+            },
+        },
+        "Upbit": {
+            "fields": {"quotation": (1, 10), "exchange": (1, 30), "order": (1, 8)},
+            "weights": {
+                "load_markets": {"quotation": 1},
+                "fetch_order_book": {"quotation": 1},
+                "createOrder": {"order": 1},
+                "createOrders": {"order": _batchLength},
+                "cancelOrders": {"exchange": _batchLength},
+                "default": {"exchange": 1},
+            },
+        },
+        "Bithumb": {
+            "fields": {"public": (1, 135), "private": (1, 140)},
+            "weights": {
+                "load_markets": {"public": 3}, # One ticker request per quote market(KRW, BTC, USDT)
+                "fetch_order_book": {"public": 1},
+                "createOrders": {"private": _batchLength},
+                "cancelOrders": {"private": _batchLength},
+                "default": {"private": 1},
+            },
+        },
     }
 
     # ------------------------------------------------------------------------------------------------------------------
     # Constructor
 
-    def __init__(self, keys: dict, connectionName = "CCXT Binder"):
+    def __init__(self, keys: dict, connectionName = "CCXT Binder",
+                 marketCacheDirectory: str = None, marketCacheTTL: float = 60 * 60, lazy: bool = False,
+                 maxConcurrentCalls: int = 8, callLimitRatio: float = 0.9):
+        """
+        <method CCXTConnection.__init__>
+        :param keys: {exchangeName: {"apiKey": ~, "secret": ~}, ...}
+        :param marketCacheDirectory: If given, loaded market information is saved in this directory,
+            and later processes start from saved information instead of loading from exchanges.
+        :param marketCacheTTL: Saved market information older than this seconds is refreshed in background.
+        :param lazy: If True then nothing is loaded in constructor; Markets and balance of each exchange are loaded
+            on first use of that exchange. Use this(or CCXTConnection.makeAsync) inside running event loop.
+        :param maxConcurrentCalls: Max number of concurrent API calls for each exchange. Waiting order calls
+            are served before waiting data calls.
+        :param callLimitRatio: Ratio of exchanges' documented call limits used by this connection.
+            Calls exceeding it wait instead of being sent, so exchanges with call profile don't use ccxt's throttling.
+        """
 
         # Key is passed to CCXT object instead of AbstractConnection
         super().__init__(connectionName = connectionName)
 
+        # Market information cache
+        self.marketCacheDirectory, self.marketCacheTTL = marketCacheDirectory, marketCacheTTL
+        if marketCacheDirectory: os.makedirs(marketCacheDirectory, exist_ok = True)
+        self.marketRefreshTasks = {} # {exchangeName: Background refreshing task}
+
         # Register exchanges; Each exchange should be exist in CCXTConnection.supportingExchanges
-        for exchangeName in keys: keys[exchangeName]["options"] = {"adjustForTimeDifference": True}
+        for exchangeName in keys:
+            keys[exchangeName]["options"] = {"adjustForTimeDifference": True}
+            if exchangeName in CCXTConnection.callProfiles: keys[exchangeName].setdefault("enableRateLimit", False)
         self.exchanges = {exchangeName: CCXTConnection.supportingExchanges[exchangeName](keys[exchangeName]) for exchangeName in keys}
+        self.gates = {exchangeName: PriorityGate(maxConcurrentCalls) for exchangeName in keys}
 
-        # Load markets and account information
-        self.markets = {} # {exchangeName: {base: {quote: {~~}}}, ...}
-        asyncio.get_event_loop().run_until_complete(self.fetchMarkets())
-        self.balance = {} # {exchangeName: {currency: {free: __, total: __, }}}
-        asyncio.get_event_loop().run_until_complete(self.fetchBalances())
+        # Call limits of exchanges having call profile
+        for exchangeName in keys:
+            for field, (timeInterval, maxWeight) in CCXTConnection.callProfiles.get(exchangeName, {"fields": {}})["fields"].items():
+                self.addCallField("%s.%s" % (exchangeName, field), timeInterval, max(1, int(maxWeight * callLimitRatio)))
 
-        # Save market by order ID. {(exchangeName, orderID): ()}
+        # Save market by order ID. {(exchangeName, orderID): (base, quote)}, and track states of created orders
         self.marketByOrderID = {}
+        self.orders = OrderTracker(self)
+
+        # Load markets and account information
+        self.markets = {} # {exchangeName: {base: {quote: {~~}}}, ...}
+        self.routes = RouteIndex() # Conversion routes, updated whenever markets of an exchange are set
+        self.balanceCache = BalanceCache(self) # Updated by order events between resyncs
+        self.orders.subscribe(self.balanceCache.onOrderEvent)
+        self.balance = self.balanceCache.balances # {exchangeName: {currency: {free: __, used: __, total: __}}}
+        self.loadingTasks = {} # {exchangeName: In-flight loading task}, shared by concurrent first users
+        if not lazy:
+            asyncio.get_event_loop().run_until_complete(self.fetchMarkets())
+            asyncio.get_event_loop().run_until_complete(self.fetchBalances())
 
         # Register termination
         atexit.register(self.terminate)
 
     @staticmethod
-    def makeFromFile(**filenames):
+    def makeFromFile(marketCacheDirectory: str = None, lazy: bool = False, **filenames):
         """
         <static method CCXTConnection.makeFromFile>
         Make CCXTConnection from given file names.
+        :param marketCacheDirectory: Passed to CCXTConnection.__init__.
+        :param lazy: Passed to CCXTConnection.__init__.
         :param filenames: {ExchangeName: file, ...}
+            Each file has public and private key in two lines, or a JSON object used as the exchange's key dict,
+            e.g. {"apiKey": "..", "source": "replay.jsonl", "balance": {"KRW": 1000000}} for Simulated.
         :return: CCXTConnection Object
         """
         keys = {}
         for exchangeName in CCXTConnection.supportingExchanges:
             if exchangeName in filenames:
-                with open(filenames[exchangeName]) as keyFile:
-                    publicKey, privateKey = keyFile.read().split("\n")
+                with open(filenames[exchangeName]) as keyFile: content = keyFile.read()
+                if content.lstrip().startswith("{"): keys[exchangeName] = json.loads(content)
+                else:
+                    publicKey, privateKey = content.split("\n")
                     keys[exchangeName] = {"apiKey": publicKey, "secret": privateKey}
-        return CCXTConnection(keys)
+        return CCXTConnection(keys, marketCacheDirectory = marketCacheDirectory, lazy = lazy)
+
+    @staticmethod
+    async def makeAsync(keys: dict, lazy: bool = True, **kwargs):
+        """
+        <static async method CCXTConnection.makeAsync>
+        Make CCXTConnection without blocking running event loop.
+        :param lazy: If False then all exchanges are loaded concurrently before return.
+        :param kwargs: Passed to CCXTConnection.__init__.
+        :return: CCXTConnection Object
+        """
+        connection = CCXTConnection(keys, lazy = True, **kwargs)
+        if not lazy: await asyncio.gather(*(connection.ensureExchange(exchangeName) for exchangeName in connection.exchanges))
+        return connection
+
+    # ------------------------------------------------------------------------------------------------------------------
+    # Lazy initialization
+
+    def isLoaded(self, exchangeName: str) -> bool:
+        """
+        <method CCXTConnection.isLoaded>
+        :return: If markets(and balance, if key is given) of given exchange are loaded.
+        """
+        return exchangeName in self.markets and (exchangeName in self.balance or not self.exchanges[exchangeName].apiKey)
+
+    async def ensureExchange(self, exchangeName: str):
+        """
+        <async method CCXTConnection.ensureExchange>
+        Load markets and balance of given exchange if not loaded yet.
+        Concurrent callers share one in-flight loading, and failed loading is retried by next caller.
+        """
+        if self.isLoaded(exchangeName): return
+        elif exchangeName not in self.exchanges: raise cerr.InvalidError("Exchange %s is not in this connection" % (exchangeName,))
+        if exchangeName not in self.loadingTasks:
+            self.loadingTasks[exchangeName] = asyncio.ensure_future(self.__loadExchange(exchangeName))
+        await asyncio.shield(self.loadingTasks[exchangeName])
+
+    async def __loadExchange(self, exchangeName: str):
+        """
+        <async method CCXTConnection.__loadExchange>
+        Load markets and balance(only if key is given) of given exchange concurrently.
+        """
+        try:
+            if self.exchanges[exchangeName].apiKey:
+                market, balance = await asyncio.gather(
+                    self.fetchMarket(exchangeName), self.fetchBalance(exchangeName, True))
+                self.balanceCache.set(exchangeName, balance)
+            else: market = await self.fetchMarket(exchangeName)
+            self.setMarket(exchangeName, market)
+        finally: del self.loadingTasks[exchangeName]
+
+    # ------------------------------------------------------------------------------------------------------------------
+    # Exchange calls
+
+    orderPriority, dataPriority = 0, 1
+    async def _exchangeCall(self, exchangeName: str, methodName: str, *args, priority: int = dataPriority, **kwargs):
+        """
+        <async method CCXTConnection._exchangeCall>
+        Call given ccxt method of given exchange through the exchange's gate,
+        waiting until the call's weights fit in call limits of the exchange.
+        Weights are waited before taking a gate slot, so calls sleeping on weights never hold slots,
+        and both waits serve more urgent calls first.
+        :param priority: CCXTConnection.orderPriority or CCXTConnection.dataPriority.
+        """
+        async with AsyncExitStack() as stack:
+            for callFieldName, weight in self.callWeights(exchangeName, methodName, *args, **kwargs):
+                await stack.enter_async_context(self.waitingCall(callFieldName, weight, priority))
+            await stack.enter_async_context(self.gates[exchangeName].slot(priority))
+            return await getattr(self.exchanges[exchangeName], methodName)(*args, **kwargs)
+
+    def callWeights(self, exchangeName: str, methodName: str, *args, **kwargs) -> list:
+        """
+        <method CCXTConnection.callWeights>
+        :return: [(call field name, weight), ..] consumed by given ccxt method call, by CCXTConnection.callProfiles.
+            Empty if the exchange has no call profile.
+        """
+        if exchangeName not in CCXTConnection.callProfiles: return []
+        weights = CCXTConnection.callProfiles[exchangeName]["weights"]
+        return [("%s.%s" % (exchangeName, field), weight(*args, **kwargs) if callable(weight) else weight)
+                for field, weight in weights.get(methodName, weights["default"]).items()]
+
+    def _orderArguments(self, exchangeName: str, base: str, quote: str, price, amount, buy: bool,
+                        processReversed: bool = True) -> tuple:
+        """
+        <method CCXTConnection._orderArguments>
+        If given market is not supported then try to find reversed pair, converting price, amount and side.
+        :return: (base, quote, price, amount, buy) of supported market.
+        """
+        if self.isSupported(exchangeName, base, quote): return base, quote, price, amount, buy
+        elif self.isSupported(exchangeName, quote, base) and processReversed:
+            return quote, base, price ** -1, price * amount, not buy
+        else: raise cerr.MarketNotSupported(exchangeName, base, quote)
 
     # ------------------------------------------------------------------------------------------------------------------
     # Termination
@@ -83,6 +283,7 @@ class CCXTConnection(AbstractConnection):
         <async method CCXTConnection.closeExchangeSessions>
         Close all exchange sessions asynchronously. CCXT.async_support requires to close at the end of the program.
         """
+        for task in self.marketRefreshTasks.values(): task.cancel()
         tasks = []
         for exchangeName in self.exchanges:
             tasks.append(asyncio.create_task(self.exchanges[exchangeName].close()))
@@ -123,12 +324,12 @@ class CCXTConnection(AbstractConnection):
     # ------------------------------------------------------------------------------------------------------------------
     # Fetching markets
 
-    async def fetchMarket(self, exchangeName: str):
+    @staticmethod
+    def _groupMarkets(result: dict) -> dict:
         """
-        <async method CCXTConnection.fetchMarket>
-        :return: Market information for given exchange.
+        <static method CCXTConnection._groupMarkets>
+        :return: Given ccxt markets {"QUOTE/BASE": market} grouped as {base: {quote: market}}.
         """
-        result = await self.exchanges[exchangeName].load_markets()
         market = {}
         for currencyPairStr in result:
             quote, base = currencyPairStr.split("/")
@@ -137,20 +338,92 @@ class CCXTConnection(AbstractConnection):
             market[base][quote] = result[currencyPairStr]
         return market
 
+    def marketCachePath(self, exchangeName: str) -> str:
+        """
+        <method CCXTConnection.marketCachePath>
+        :return: Path of market information cache file for given exchange.
+        """
+        return os.path.join(self.marketCacheDirectory, "%s.markets.json" % (exchangeName,))
+
+    async def fetchMarket(self, exchangeName: str, useCache: bool = True):
+        """
+        <async method CCXTConnection.fetchMarket>
+        If market cache is available, market information is loaded from disk instead,
+        and refreshed in background when it's older than TTL.
+        :return: Market information for given exchange.
+        """
+        exchange = self.exchanges[exchangeName]
+
+        # Load from cache
+        if self.marketCacheDirectory and useCache and os.path.exists(self.marketCachePath(exchangeName)):
+            with open(self.marketCachePath(exchangeName)) as cacheFile: cached = json.load(cacheFile)
+            exchange.set_markets(cached["markets"], cached["currencies"])
+            if time.time() - cached["timestamp"] > self.marketCacheTTL and \
+                    (exchangeName not in self.marketRefreshTasks or self.marketRefreshTasks[exchangeName].done()):
+                task = self.marketRefreshTasks[exchangeName] = asyncio.ensure_future(self.refreshMarket(exchangeName))
+                task.add_done_callback(lambda task: CCXTConnection.__reportRefresh(exchangeName, task))
+            return CCXTConnection._groupMarkets(exchange.markets)
+
+        # Load from exchange and save cache
+        result = await self._exchangeCall(exchangeName, "load_markets", reload = not useCache)
+        if self.marketCacheDirectory:
+            temporaryPath = "%s.%d.tmp" % (self.marketCachePath(exchangeName), os.getpid())
+            with open(temporaryPath, "w") as cacheFile:
+                json.dump({"timestamp": time.time(), "markets": exchange.markets, "currencies": exchange.currencies},
+                          cacheFile, default = str)
+            os.replace(temporaryPath, self.marketCachePath(exchangeName))
+        return CCXTConnection._groupMarkets(result)
+
+    async def refreshMarket(self, exchangeName: str):
+        """
+        <async method CCXTConnection.refreshMarket>
+        Reload market information of given exchange from exchange, ignoring cache.
+        """
+        self.setMarket(exchangeName, await self.fetchMarket(exchangeName, useCache = False))
+
+    @staticmethod
+    def __reportRefresh(exchangeName: str, task: asyncio.Future):
+        """
+        <static method CCXTConnection.__reportRefresh>
+        Retrieve the result of background market refreshing, so its failure is reported instead of being lost.
+        Cached market information is kept on failure, and refreshing is tried again by next CCXTConnection.fetchMarket.
+        """
+        if task.cancelled(): return
+        exception = task.exception()
+        if exception is not None:
+            print("[Warning] Refreshing markets of %s failed; Cached markets are kept: %s(%s)" %
+                  (exchangeName, type(exception).__name__, exception))
+
     async def fetchMarkets(self, exchangeNames = ()):
         """
         <async method CCXTConnection.fetchMarkets>
-        Fetch markets and currencies information for given exchange names.
+        Fetch markets and currencies information for given exchange names concurrently.
         :param exchangeNames: If not given then this method will fetch all exchanges in this connection.
         """
-        if not exchangeNames: exchangeNames = self.exchanges.keys()
-        for exchangeName in exchangeNames: self.markets[exchangeName] = await self.fetchMarket(exchangeName)
+        if not exchangeNames: exchangeNames = tuple(self.exchanges.keys())
+        results = await asyncio.gather(*(self.fetchMarket(exchangeName) for exchangeName in exchangeNames))
+        for exchangeName, market in zip(exchangeNames, results): self.setMarket(exchangeName, market)
+
+    def setMarket(self, exchangeName: str, market: dict):
+        """
+        <method CCXTConnection.setMarket>
+        Set market information of given exchange and update conversion routes of that exchange.
+        """
+        self.markets[exchangeName] = market
+        self.routes.updateExchange(exchangeName, market)
+
+    def conversionRoute(self, source: str, target: str, exchangeName: str = None, **kwargs):
+        """
+        <method CCXTConnection.conversionRoute>
+        :return: Cheapest conversion route from source currency to target currency by RouteIndex.route,
+            on given exchange or across exchanges if exchangeName is None.
+        """
+        return self.routes.route(source, target, exchangeName, **kwargs)
 
     # ------------------------------------------------------------------------------------------------------------------
     # Fetching balances
 
     unnecessaryBalanceTags = ("free", "total", "used", "info")
-    #@AbstractConnection._makeCallSync
     async def fetchBalance(self, exchangeName: str, removeZero: bool = False):
         """
         <async method CCXTConnection.fetchBalance>
@@ -159,7 +432,7 @@ class CCXTConnection(AbstractConnection):
         :param removeZero: If this is True then the method will remove unnecessary zero balances.
         :return: Account balance information for given exchange.
         """
-        result = await self.exchanges[exchangeName].fetch_balance() # CCXT fetch
+        result = await self._exchangeCall(exchangeName, "fetch_balance") # CCXT fetch
         for untag in CCXTConnection.unnecessaryBalanceTags: del result[untag] # Remove unnecessary tags
         for currency in (tuple(result.keys()) if removeZero else result):
             allZero = True
@@ -175,8 +448,9 @@ class CCXTConnection(AbstractConnection):
         Fetch account balances for given exchange names. Zero balance will be removed.
         :param exchangeNames: If not given then this method will fetch all exchanges in this connection.
         """
-        if not exchangeNames: exchangeNames = self.exchanges.keys()
-        for exchangeName in exchangeNames: self.balance[exchangeName] = await self.fetchBalance(exchangeName, True)
+        if not exchangeNames: exchangeNames = tuple(self.exchanges.keys())
+        results = await asyncio.gather(*(self.fetchBalance(exchangeName, True) for exchangeName in exchangeNames))
+        for exchangeName, balance in zip(exchangeNames, results): self.balanceCache.set(exchangeName, balance)
 
     # ------------------------------------------------------------------------------------------------------------------
     # Fetching price and orderbooks
@@ -197,22 +471,26 @@ class CCXTConnection(AbstractConnection):
 
     unnecessaryOrderbookTags = ("datetime", "nonce", "timestamp")
     async def fetchOrderbook(self, exchangeName: str, base: str, quote: str,
-                             removeUnnecessaryTags: bool = True, processReversed: bool = False):
+                             removeUnnecessaryTags: bool = True, processReversed: bool = False, arrayForm: bool = False):
         """
         <async method CCXTConnection.fetchOrderbook>
         Fetch orderbook for given exchange name and market.
+        :param arrayForm: If True then return ArrayOrderbook instead, skipping Decimal conversion.
         :return: Orderbook information, formatted as
             {"bids": {price: amount, ..}, "asks": {price: amount, ..}, "reversed": T/F}
         """
 
         # Process if need to support reversed orderbook
+        await self.ensureExchange(exchangeName)
         if processReversed and not self.isSupported(exchangeName, base, quote) and self.isSupported(exchangeName, quote, base):
-            return CCXTConnection.reversedOrderbook(
-                await self.fetchOrderbook(exchangeName, quote, base, removeUnnecessaryTags = removeUnnecessaryTags))
+            result = await self.fetchOrderbook(exchangeName, quote, base,
+                                               removeUnnecessaryTags = removeUnnecessaryTags, arrayForm = arrayForm)
+            return result.reversedBook() if arrayForm else CCXTConnection.reversedOrderbook(result)
 
         # Main processing
         self.raiseIfNotSupported(exchangeName, base, quote)
-        result = await self.exchanges[exchangeName].fetch_order_book("%s/%s" % (quote, base))
+        result = await self._exchangeCall(exchangeName, "fetch_order_book", "%s/%s" % (quote, base))
+        if arrayForm: return ArrayOrderbook.fromCCXT(result)
         if removeUnnecessaryTags:
             for unnecessaryTag in CCXTConnection.unnecessaryOrderbookTags: del result[unnecessaryTag]
         for ask_or_bid in ("asks", "bids"):
@@ -225,12 +503,13 @@ class CCXTConnection(AbstractConnection):
         result["reversed"] = False
         return result
 
-    async def fetchOrderbooks(self, targets: (list, tuple), processReversed: bool = False):
+    async def fetchOrderbooks(self, targets: (list, tuple), processReversed: bool = False, arrayForm: bool = False):
         """
         <async method CCXTConnection.fetchOrderbooks>
         Fetch current order books for given (exchange, base, quote) tuples.
         :param targets: [(exchange, base, quote), ...]
         :param processReversed: If true then try to gather reversed orderbooks if possible.
+        :param arrayForm: If true then orderbooks are given as ArrayOrderbook.
         """
 
         # Create tasks
@@ -240,7 +519,7 @@ class CCXTConnection(AbstractConnection):
             if base not in tasks[exchangeName]: tasks[exchangeName][base] = {}
             if quote in tasks[exchangeName][base]: raise cerr.InvalidError("Duplicated markets")
             tasks[exchangeName][base][quote] = asyncio.create_task(
-                self.fetchOrderbook(exchangeName, base, quote, processReversed = processReversed))
+                self.fetchOrderbook(exchangeName, base, quote, processReversed = processReversed, arrayForm = arrayForm))
 
         # Await tasks
         result = {}
@@ -252,6 +531,72 @@ class CCXTConnection(AbstractConnection):
                     result[exchangeName][base][quote] = await tasks[exchangeName][base][quote]
         return result
 
+    async def fetchOrderbooksPartial(self, targets: (list, tuple), deadline: float = None,
+                                     maxInFlightPerExchange: int = None, processReversed: bool = False,
+                                     arrayForm: bool = False):
+        """
+        <async method CCXTConnection.fetchOrderbooksPartial>
+        Fetch orderbooks like fetchOrderbooks, but never raise or wait for slow markets.
+        Markets not completed before deadline are cancelled, and failure of one market doesn't affect others.
+        :param targets: [(exchange, base, quote), ...]
+        :param deadline: Seconds from now to wait. None means waiting all markets.
+        :param maxInFlightPerExchange: Max number of concurrent requests for each exchange. None means unlimited.
+        :return: (orderbooks, status) where
+            orderbooks = {exchange: {base: {quote: orderbook}}}, only for completed markets,
+            status = {exchange: {base: {quote: {"latency": seconds or None, "error": exception or None}}}}.
+            Markets cancelled by deadline have asyncio.TimeoutError as their error and None latency.
+        """
+
+        # Validate targets before scheduling anything
+        targets = [tuple(target) for target in targets]
+        if len(set(targets)) != len(targets): raise cerr.InvalidError("Duplicated markets")
+
+        # Create tasks; Each task waits for its exchange's slot, and latency is measured from the request start
+        semaphores = {exchangeName: asyncio.Semaphore(maxInFlightPerExchange) if maxInFlightPerExchange else None
+                      for exchangeName, _, _ in targets}
+        latencies = {}
+        async def fetch(exchangeName, base, quote):
+            semaphore = semaphores[exchangeName]
+            if semaphore is not None: await semaphore.acquire()
+            startTime = time.monotonic()
+            try: return await self.fetchOrderbook(exchangeName, base, quote,
+                                                  processReversed = processReversed, arrayForm = arrayForm)
+            finally:
+                latencies[exchangeName, base, quote] = time.monotonic() - startTime
+                if semaphore is not None: semaphore.release()
+        tasks = {target: asyncio.ensure_future(fetch(*target)) for target in targets}
+
+        # Wait until deadline, then cancel the rest; Also cancel them if the caller is cancelled while waiting
+        try:
+            if tasks: await asyncio.wait(tasks.values(), timeout = deadline)
+        finally:
+            for task in tasks.values():
+                if not task.done(): task.cancel()
+        await asyncio.gather(*tasks.values(), return_exceptions = True)
+
+        # Collect results
+        orderbooks, status = {}, {}
+        for (exchangeName, base, quote), task in tasks.items():
+            if task.cancelled():
+                error, latency = asyncio.TimeoutError("Not completed before deadline(%s sec)" % (deadline,)), None
+            else: error, latency = task.exception(), latencies[exchangeName, base, quote]
+            status.setdefault(exchangeName, {}).setdefault(base, {})[quote] = {"latency": latency, "error": error}
+            if error is None: orderbooks.setdefault(exchangeName, {}).setdefault(base, {})[quote] = task.result()
+        return orderbooks, status
+
+    def orderbookScheduler(self, markets = (), **kwargs):
+        """
+        <method CCXTConnection.orderbookScheduler>
+        Make OrderbookScheduler polling this connection. Call start() on it in running event loop.
+        :param markets: [(exchange, base, quote, rate, priority), ...]; rate and priority can be omitted.
+        :param kwargs: Passed to OrderbookScheduler.__init__.
+        :return: OrderbookScheduler Object
+        """
+        from connection.orderbook_scheduler import OrderbookScheduler
+        scheduler = OrderbookScheduler(self, **kwargs)
+        for market in markets: scheduler.schedule(*market)
+        return scheduler
+
     # ------------------------------------------------------------------------------------------------------------------
     # Order
 
@@ -262,7 +607,7 @@ class CCXTConnection(AbstractConnection):
         :param orderID: Order ID.
         :return: Given order's status.
         """
-        result = await self.exchanges[exchangeName].fetchOrder(orderID)
+        result = await self._exchangeCall(exchangeName, "fetchOrder", orderID)
         if clean:
             mandatoryArguments = {"amount", "average", "cost", "datetime", "fee", "id", "side", "status", "symbol"}
             for argument in list(result):
@@ -275,13 +620,14 @@ class CCXTConnection(AbstractConnection):
         <async method CCXTConnection.fetchOpenOrders>
         :return: All fetched open orders for given market.
         """
+        await self.ensureExchange(exchangeName)
         if base and quote:
             if self.isSupported(exchangeName, base, quote): # Specify given symbol is supported
-                return await self.exchanges[exchangeName].fetchOpenOrders(symbol="%s/%s" % (quote, base))
+                return await self._exchangeCall(exchangeName, "fetchOpenOrders", symbol="%s/%s" % (quote, base))
             elif self.isSupported(exchangeName, quote, base) and processReversed: # Fetch open orders in reversed market
                 return await self.fetchOpenOrders(exchangeName, quote, base, processReversed = True)
             else: raise cerr.MarketNotSupported(exchangeName, base, quote) # Given market not found
-        else: return await self.exchanges[exchangeName].fetchOpenOrders()
+        else: return await self._exchangeCall(exchangeName, "fetchOpenOrders")
 
     async def createOrder(self, exchangeName: str, base: str, quote: str,
                           price: (int, float, Decimal), amount: (int, float, Decimal), buy: bool = True,
@@ -296,18 +642,15 @@ class CCXTConnection(AbstractConnection):
 
         # Non positive price error
         if price <= 0: raise cerr.InvalidError("Cannot create orders with non-positive(%s) price" % (price,))
-
-        # If given market is not supported then try to find reversed pair
-        if not self.isSupported(exchangeName, base, quote):
-            if self.isSupported(exchangeName, quote, base) and processReversed:
-                return await self.createOrder(exchangeName, quote, base, price ** -1, price*amount, buy = not buy)
-            else: raise cerr.MarketNotSupported(exchangeName, base, quote)
+        await self.ensureExchange(exchangeName)
+        base, quote, price, amount, buy = self._orderArguments(exchangeName, base, quote, price, amount, buy, processReversed)
 
         # Create order and return order ID
-        result = await self.exchanges[exchangeName].createOrder(
-            "%s/%s" % (quote, base), "limit", "buy" if buy else "sell", amount, price)
+        result = await self._exchangeCall(exchangeName, "createOrder", "%s/%s" % (quote, base), "limit",
+                                          "buy" if buy else "sell", amount, price, priority = CCXTConnection.orderPriority)
         orderID = result["id"]
-        # self.marketByOrderID[exchangeName, orderID] = (base, quote)
+        self.marketByOrderID[exchangeName, orderID] = (base, quote)
+        self.orders.record(exchangeName, orderID, base, quote, price, amount, buy, result.get("timestamp"))
         return orderID
 
     async def cancelOrder(self, exchangeName: str, orderID: str, explicitBase: str = None, explicitQuote: str = None):
@@ -317,13 +660,159 @@ class CCXTConnection(AbstractConnection):
         :return: Exchange response
         """
 
+        symbol = self._orderSymbol(exchangeName, orderID, explicitBase, explicitQuote)
+        if symbol: return await self._exchangeCall(exchangeName, "cancelOrder", orderID, symbol,
+                                                   priority = CCXTConnection.orderPriority)
+        else: # Otherwise just cancel with only orderID
+            return await self._exchangeCall(exchangeName, "cancelOrder", orderID, priority = CCXTConnection.orderPriority)
+
+    def _orderSymbol(self, exchangeName: str, orderID: str, explicitBase: str = None, explicitQuote: str = None) -> str:
+        """
+        <method CCXTConnection._orderSymbol>
+        :return: ccxt symbol of given order from explicit pair or marketByOrderID, None if unknown.
+        """
         if explicitBase and explicitQuote: # If the pair is explicitly provided then use it
-            return await self.exchanges[exchangeName].cancelOrder(orderID, "%s/%s" % (explicitQuote, explicitBase))
+            return "%s/%s" % (explicitQuote, explicitBase)
         elif (exchangeName, orderID) in self.marketByOrderID: # If the pair by orderID is available then use it
             base, quote = self.marketByOrderID[exchangeName, orderID]
-            return await self.exchanges[exchangeName].cancelOrder(orderID, "%s/%s" % (quote, base))
-        else: # Otherwise just cancel with only orderID
-            return await self.exchanges[exchangeName].cancelOrder(orderID)
+            return "%s/%s" % (quote, base)
+        return None
+
+    # ------------------------------------------------------------------------------------------------------------------
+    # Batch order
+
+    # Exchanges whose ccxt createOrders / cancelOrders work only for contract markets
+    contractOnlyBatches = ("Binance",)
+
+    def _isNativeBatch(self, exchangeName: str, methodName: str, symbol: str) -> bool:
+        """
+        <method CCXTConnection._isNativeBatch>
+        :return: If given ccxt batch method can be used for given symbol of given exchange.
+        """
+        exchange = self.exchanges[exchangeName]
+        if not exchange.has.get(methodName): return False
+        elif exchangeName in CCXTConnection.contractOnlyBatches:
+            return bool((exchange.markets or {}).get(symbol, {}).get("contract"))
+        return True
+
+    @staticmethod
+    def _taskOutcome(task: asyncio.Task):
+        """
+        <static method CCXTConnection._taskOutcome>
+        :return: Result of given finished task, or the exception raised(including cancellation) in it.
+        """
+        if task.cancelled(): return asyncio.CancelledError()
+        return task.exception() or task.result()
+
+    # Errors of native batch calls meaning the batch is not supported for the market, so orders are sent one by one
+    _unsupportedBatchErrors = (ccxt.NotSupported, ccxt.BadRequest)
+
+    async def createOrders(self, orders: (list, tuple), processReversed: bool = True, nativeBatchSize: int = 5) -> list:
+        """
+        <async method CCXTConnection.createOrders>
+        Create many orders at once. Markets supporting ccxt createOrders get native batch requests
+        of at most nativeBatchSize orders, and other markets get concurrent createOrder calls.
+        Native batches rejected as unsupported fall back to concurrent createOrder calls.
+        All calls have priority over data calls on the exchange's gate.
+        :param orders: [(exchangeName, base, quote, price, amount, buy), ...], same arguments as createOrder.
+        :return: Per-order outcome in given order; Order ID, or the exception raised for that order.
+        """
+        results = [None] * len(orders)
+        nativeGroups, tasks = {}, {} # {exchangeName: [(index, base, quote, buy, amount, price), ..]}, {index: task}
+        for index, (exchangeName, base, quote, price, amount, buy) in enumerate(orders):
+            try:
+                if price <= 0: raise cerr.InvalidError("Cannot create orders with non-positive(%s) price" % (price,))
+                await self.ensureExchange(exchangeName)
+                actualBase, actualQuote, actualPrice, actualAmount, actualBuy = \
+                    self._orderArguments(exchangeName, base, quote, price, amount, buy, processReversed)
+                if self._isNativeBatch(exchangeName, "createOrders", "%s/%s" % (actualQuote, actualBase)):
+                    nativeGroups.setdefault(exchangeName, []).append(
+                        (index, actualBase, actualQuote, actualBuy, actualAmount, actualPrice))
+                else: tasks[index] = asyncio.ensure_future(
+                    self.createOrder(exchangeName, base, quote, price, amount, buy, processReversed))
+            except Exception as err: results[index] = err
+
+        # Native batches
+        async def createBatch(exchangeName, batch):
+            try:
+                created = await self._exchangeCall(exchangeName, "createOrders", [
+                    {"symbol": "%s/%s" % (quote, base), "type": "limit", "side": "buy" if buy else "sell",
+                     "amount": amount, "price": price}
+                    for _, base, quote, buy, amount, price in batch], priority = CCXTConnection.orderPriority)
+            except CCXTConnection._unsupportedBatchErrors: # Send one by one
+                fallbacks = [asyncio.ensure_future(self.createOrder(exchangeName, base, quote, price, amount, buy, False))
+                             for _, base, quote, buy, amount, price in batch]
+                await asyncio.gather(*fallbacks, return_exceptions = True)
+                for (index, *_), task in zip(batch, fallbacks): results[index] = CCXTConnection._taskOutcome(task)
+                return
+            except Exception as err:
+                for index, *_ in batch: results[index] = err
+                return
+            for position, (index, base, quote, buy, amount, price) in enumerate(batch):
+                order = created[position] if position < len(created) else {"info": "Missing in batch response"}
+                if order.get("id") and order.get("status") != "rejected":
+                    results[index] = order["id"]
+                    self.marketByOrderID[exchangeName, order["id"]] = (base, quote)
+                    self.orders.record(exchangeName, order["id"], base, quote, price, amount, buy, order.get("timestamp"))
+                else: results[index] = cerr.AutoTradeConnectionError("Order rejected: %s" % (order.get("info"),))
+        batches = [createBatch(exchangeName, group[start:start + nativeBatchSize])
+                   for exchangeName, group in nativeGroups.items() for start in range(0, len(group), nativeBatchSize)]
+
+        # Await all
+        await asyncio.gather(*batches, *tasks.values(), return_exceptions = True)
+        for index, task in tasks.items(): results[index] = CCXTConnection._taskOutcome(task)
+        return results
+
+    async def cancelOrders(self, orders: (list, tuple)) -> list:
+        """
+        <async method CCXTConnection.cancelOrders>
+        Cancel many orders at once. Orders with known symbol on markets supporting ccxt cancelOrders are cancelled
+        by one native request per symbol, and others are cancelled by concurrent cancelOrder calls.
+        Native batches rejected as unsupported fall back to concurrent cancelOrder calls.
+        :param orders: [(exchangeName, orderID) or (exchangeName, orderID, base, quote), ...]
+        :return: Per-order outcome in given order; Exchange response of that order, or the exception raised for it.
+        """
+        results = [None] * len(orders)
+        nativeGroups, tasks = {}, {} # {(exchangeName, symbol): [(index, orderID), ..]}, {index: task}
+        for index, (exchangeName, orderID, *pair) in enumerate(orders):
+            symbol = self._orderSymbol(exchangeName, orderID, *pair)
+            if symbol and exchangeName in self.exchanges and self._isNativeBatch(exchangeName, "cancelOrders", symbol):
+                nativeGroups.setdefault((exchangeName, symbol), []).append((index, orderID))
+            else: tasks[index] = asyncio.ensure_future(self.cancelOrder(exchangeName, orderID, *pair))
+
+        async def cancelBatch(exchangeName, symbol, batch):
+            try:
+                response = await self._exchangeCall(exchangeName, "cancelOrders", [orderID for _, orderID in batch],
+                                                    symbol, priority = CCXTConnection.orderPriority)
+            except CCXTConnection._unsupportedBatchErrors: # Send one by one
+                fallbacks = [asyncio.ensure_future(self._exchangeCall(
+                    exchangeName, "cancelOrder", orderID, symbol, priority = CCXTConnection.orderPriority))
+                    for _, orderID in batch]
+                await asyncio.gather(*fallbacks, return_exceptions = True)
+                for (index, _), task in zip(batch, fallbacks): results[index] = CCXTConnection._taskOutcome(task)
+                return
+            except Exception as err:
+                for index, _ in batch: results[index] = err
+                return
+
+            # Map responses back by order ID; Entries without ID are matched by position if the lengths are same
+            response = [entry if isinstance(entry, dict) else {"info": entry} for entry in response or ()]
+            byID = {str(entry["id"]): entry for entry in response if entry.get("id") is not None}
+            for position, (index, orderID) in enumerate(batch):
+                entry = byID.get(str(orderID))
+                if entry is None and len(response) == len(batch) and response[position].get("id") is None:
+                    entry = response[position]
+                if entry is None:
+                    results[index] = cerr.AutoTradeConnectionError("Order %s is missing in cancel response" % (orderID,))
+                elif entry.get("id") is None or entry.get("status") == "rejected":
+                    results[index] = cerr.AutoTradeConnectionError(
+                        "Cancelling order %s rejected: %s" % (orderID, entry.get("info")))
+                else: results[index] = entry
+
+        await asyncio.gather(*(cancelBatch(exchangeName, symbol, batch) for (exchangeName, symbol), batch in nativeGroups.items()),
+                             *tasks.values(), return_exceptions = True)
+        for index, task in tasks.items(): results[index] = CCXTConnection._taskOutcome(task)
+        return results
 
 # ----------------------------------------------------------------------------------------------------------------------
 # Functionality Testing
@@ -332,6 +821,25 @@ from pprint import pprint
 
 if __name__ == "__main__":
 
+    # Order priority under call limit pressure; Data calls saturate both call weight and gate slots
+    from connection.simulated_exchange import SimulationClock
+    CCXTConnection.callProfiles["Simulated"] = {"fields": {"calls": (0.2, 2)}, "weights": {"default": {"calls": 1}}}
+    async def checkOrderPriority():
+        simulated = CCXTConnection({"Simulated": {"symbols": ["BTC/KRW"], "latency": 0.02,
+                                                  "clock": SimulationClock(0, manual = True)}},
+                                   lazy = True, maxConcurrentCalls = 2, callLimitRatio = 1)
+        finished = []
+        async def call(name, priority):
+            await simulated._exchangeCall("Simulated", "fetch_order_book", "BTC/KRW", priority = priority)
+            finished.append(name)
+        dataCalls = [asyncio.ensure_future(call("data%d" % (index,), CCXTConnection.dataPriority)) for index in range(6)]
+        await asyncio.sleep(0.01)
+        await asyncio.gather(call("order", CCXTConnection.orderPriority), *dataCalls)
+        print("Completion order:", finished)
+        assert finished.index("order") == 2, "Order call should go right after the calls already holding weight"
+    asyncio.run(checkOrderPriority())
+    del CCXTConnection.callProfiles["Simulated"]
+
     ccxtcon = CCXTConnection.makeFromFile(
         Upbit = "upbit_jo.authkey")
 
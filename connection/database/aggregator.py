@@ -0,0 +1,247 @@
+"""
+<module AutoTrade.database.aggregator>
+Streaming aggregation of tick data into OHLCV candles.
+"""
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Libraries
+
+# Standard libraries
+from bisect import insort
+from datetime import datetime, timedelta, timezone
+
+# External libraries
+
+# Custom libraries
+from .pricebase_async import PriceBaseClass
+import connection.errors as cerr
+
+# ----------------------------------------------------------------------------------------------------------------------
+# OHLCV aggregator
+
+class OHLCVAggregator:
+    """
+    <class OHLCVAggregator>
+    Incremental tick to OHLCV aggregator.
+    Open candles are kept for every configured interval, and updated in O(1) per tick.
+    A candle is closed when the newest tick of its market passes (end of candle + grace period),
+    so ticks arriving late within grace period are still applied. Ticks later than that are dropped and counted.
+    Closed candles are passed to onClose callback and written to PriceBaseClass by OHLCVAggregator.flush.
+    """
+
+    def __init__(self, intervals = (timedelta(minutes = 1),), gracePeriod: timedelta = timedelta(),
+                 pricebase: PriceBaseClass = None, onClose = None, override: bool = True):
+        """
+        <method OHLCVAggregator.__init__>
+        :param intervals: Intervals of candles to build. Tick interval is not allowed.
+        :param gracePeriod: How long each candle waits for late ticks after its end.
+        :param pricebase: If given, closed candles are written to it by OHLCVAggregator.flush.
+        :param onClose: Callback called as onClose((exchange, base, quote), interval, timestamp, OHLCV) for closed candles.
+        :param override: Passed to PriceBaseClass.appendOHLCVs.
+        """
+
+        # Validation
+        self.intervals = tuple(PriceBaseClass.interval(interval) for interval in intervals)
+        if not self.intervals: raise cerr.InvalidValueError("No interval given")
+        elif PriceBaseClass.tickInterval in self.intervals: raise cerr.InvalidValueError("Tick interval can't be aggregated")
+        elif len(set(self.intervals)) != len(self.intervals): raise cerr.InvalidValueError("Duplicated intervals given")
+        if not isinstance(gracePeriod, timedelta) or gracePeriod < timedelta():
+            raise cerr.InvalidValueError("Invalid grace period(%s) given" % (gracePeriod,))
+
+        # Attributes
+        self.pricebase, self.onClose, self.override = pricebase, onClose, override
+        self.__seconds = tuple(round(interval.total_seconds()) for interval in self.intervals)
+        self.__grace = gracePeriod.total_seconds()
+        self.__states = {} # {market: [watermark, [{start: candle}, ...], [[start, ...], ...], [closed until, ...]]}
+        self.pending = {} # {(market, interval): [(timestamp, O, H, L, C, V), ...]}, closed but not written candles
+        self.lateTickCount = 0 # Number of ticks dropped from at least one interval's candle for being late
+
+    # ------------------------------------------------------------------------------------------------------------------
+    # Feeding
+
+    def feed(self, exchange: str, base: str, quote: str, timestamp: datetime, price, volume):
+        """
+        <method OHLCVAggregator.feed>
+        Apply single tick into open candles, and close candles which passed grace period.
+        """
+
+        # Market state
+        market = (exchange, base, quote)
+        state = self.__states.get(market)
+        if state is None:
+            state = self.__states[market] = [float("-inf"), [{} for _ in self.__seconds],
+                                             [[] for _ in self.__seconds], [float("-inf") for _ in self.__seconds]]
+        epoch = timestamp.timestamp()
+
+        # Update candles; candle = [open, high, low, close, volume, first tick epoch, last tick epoch]
+        late = False
+        for index, seconds in enumerate(self.__seconds):
+            start = int(epoch // seconds) * seconds
+            if start < state[3][index]: # Candle is already closed
+                late = True
+                continue
+            candle = state[1][index].get(start)
+            if candle is None:
+                state[1][index][start] = [price, price, price, price, volume, epoch, epoch]
+                starts = state[2][index]
+                if not starts or starts[-1] < start: starts.append(start)
+                else: insort(starts, start) # Late tick opened older candle
+            else:
+                if price > candle[1]: candle[1] = price
+                if price < candle[2]: candle[2] = price
+                if epoch < candle[5]: candle[0], candle[5] = price, epoch
+                if epoch >= candle[6]: candle[3], candle[6] = price, epoch
+                candle[4] += volume
+        if late: self.lateTickCount += 1
+
+        # Close candles
+        if epoch > state[0]:
+            state[0] = epoch
+            self.__closeCandles(market, state)
+
+    def advance(self, timestamp: datetime):
+        """
+        <method OHLCVAggregator.advance>
+        Move every market's watermark to given timestamp, to close candles of quiet markets.
+        """
+        epoch = timestamp.timestamp()
+        for market, state in self.__states.items():
+            if epoch > state[0]:
+                state[0] = epoch
+                self.__closeCandles(market, state)
+
+    def closeAll(self):
+        """
+        <method OHLCVAggregator.closeAll>
+        Close all open candles regardless of watermark and grace period. Used at the end of finite feed.
+        """
+        for market, state in self.__states.items(): self.__closeCandles(market, state, force = True)
+
+    def __closeCandles(self, market: tuple, state: list, force: bool = False):
+        """
+        <method OHLCVAggregator.__closeCandles>
+        Close and emit candles of given market which are finished.
+        """
+        watermark = state[0]
+        for index, seconds in enumerate(self.__seconds):
+            starts, candles = state[2][index], state[1][index]
+            closed = 0
+            while closed < len(starts) and (force or starts[closed] + seconds + self.__grace <= watermark):
+                start = starts[closed]
+                candle = candles.pop(start)
+                self.__emit(market, self.intervals[index], start, candle)
+                state[3][index] = start + seconds
+                closed += 1
+            if closed: del starts[:closed]
+
+    def __emit(self, market: tuple, interval: timedelta, start: int, candle: list):
+        """
+        <method OHLCVAggregator.__emit>
+        Pass closed candle to callback and pending writes.
+        """
+        timestamp = datetime.fromtimestamp(start, timezone.utc)
+        if self.onClose is not None:
+            self.onClose(market, interval, timestamp, PriceBaseClass.ohlcvType(*candle[:5]))
+        if self.pricebase is not None:
+            key = (market, interval)
+            if key not in self.pending: self.pending[key] = []
+            self.pending[key].append((timestamp, *candle[:5]))
+
+    # ------------------------------------------------------------------------------------------------------------------
+    # Consuming and writing
+
+    async def flush(self, timeout: float = None) -> int:
+        """
+        <async method OHLCVAggregator.flush>
+        Write all closed candles through PriceBaseClass.appendOHLCVs.
+        Candles closed while writing are kept for next flush, and candles failed to write are put back.
+        :return: Number of written candles.
+        """
+        written = 0
+        for key in tuple(self.pending):
+            (exchange, base, quote), interval = key
+            candles = self.pending.pop(key)
+            try: written += await self.pricebase.appendOHLCVs(exchange, base, quote, interval, candles,
+                                                              override = self.override, timeout = timeout)
+            except BaseException: # Put back before candles closed while writing
+                self.pending[key] = candles + self.pending.get(key, [])
+                raise
+        return written
+
+    async def consume(self, feed, flushEvery: int = 1000):
+        """
+        <async method OHLCVAggregator.consume>
+        Consume live feed until it's exhausted.
+        :param feed: Async iterable of (exchange, base, quote, timestamp, price, volume).
+        :param flushEvery: Flush closed candles after this number of ticks. Ignored if pricebase is not given.
+        """
+        count = 0
+        async for exchange, base, quote, timestamp, price, volume in feed:
+            self.feed(exchange, base, quote, timestamp, price, volume)
+            count += 1
+            if self.pricebase is not None and count % flushEvery == 0: await self.flush()
+        if self.pricebase is not None: await self.flush()
+
+    async def consumeTable(self, source: PriceBaseClass, exchange: str, base: str, quote: str,
+                           beginTime: datetime, endTime: datetime = None, closeAll: bool = True):
+        """
+        <async method OHLCVAggregator.consumeTable>
+        Consume stored ticks of given market from tick table.
+        :param closeAll: If True then close all remaining candles after consuming.
+        """
+        for timestamp, _, _, price, volume in await source.selectTicks(exchange, base, quote, beginTime, endTime):
+            self.feed(exchange, base, quote, timestamp, price, volume)
+        if closeAll: self.closeAll()
+        if self.pricebase is not None: await self.flush()
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Testing
+
+if __name__ == "__main__":
+
+    import asyncio
+    from decimal import Decimal
+
+    aggregator = OHLCVAggregator(intervals = (60, 300), gracePeriod = timedelta(seconds = 5),
+                                 onClose = lambda *args: print(*args))
+    begin = datetime(2019, 6, 1, tzinfo = timezone.utc)
+    for second in range(0, 700, 7):
+        aggregator.feed("Upbit", "KRW", "BTC", begin + timedelta(seconds = second), Decimal(second), Decimal(1))
+    aggregator.closeAll()
+
+    # Watermark, grace period and late ticks
+    closedCandles = []
+    aggregator = OHLCVAggregator(intervals = (60, 300), gracePeriod = timedelta(seconds = 5),
+                                 onClose = lambda market, interval, timestamp, ohlcv: closedCandles.append(
+                                     (round(interval.total_seconds()), round(timestamp.timestamp() - begin.timestamp()), ohlcv)))
+    tick = lambda second, price: aggregator.feed("Upbit", "KRW", "BTC", begin + timedelta(seconds = second), price, 1)
+    tick(10, 100)
+    tick(50, 110)
+    tick(64, 120) # Watermark 64 < 60 + 5, so first minute is still open
+    assert not closedCandles
+    tick(30, 90) # Late within grace period; Applied to first minute
+    tick(65, 130) # Watermark reaches 65, first minute is closed
+    assert closedCandles == [(60, 0, (100, 110, 90, 110, 3))], closedCandles
+    tick(20, 80) # Too late for 1 minute candle, but 5 minutes candle is still open
+    assert aggregator.lateTickCount == 1
+    aggregator.closeAll()
+    assert closedCandles[1:] == [(60, 60, (120, 130, 120, 130, 2)), (300, 0, (100, 130, 80, 130, 6))], closedCandles
+
+    # Candles closed while flushing are kept for next flush
+    class SlowPriceBase:
+        def __init__(self): self.written = []
+        async def appendOHLCVs(self, exchange, base, quote, interval, rows, override = True, timeout = None):
+            await asyncio.sleep(0.01)
+            self.written.extend(rows)
+            return len(rows)
+    async def checkFlush():
+        aggregator = OHLCVAggregator(pricebase = SlowPriceBase())
+        aggregator.feed("Upbit", "KRW", "BTC", begin, 1, 1)
+        aggregator.feed("Upbit", "KRW", "BTC", begin + timedelta(seconds = 60), 2, 1)
+        flushing = asyncio.ensure_future(aggregator.flush())
+        await asyncio.sleep(0)
+        aggregator.feed("Upbit", "KRW", "BTC", begin + timedelta(seconds = 120), 3, 1) # Closes second minute
+        assert await flushing == 1
+        assert await aggregator.flush() == 1 and len(aggregator.pricebase.written) == 2
+    asyncio.run(checkFlush())
+    print("All checks passed")
@@ -19,6 +19,16 @@ import connection.errors as cerr
 # ----------------------------------------------------------------------------------------------------------------------
 # Base database
 
+def _connectionFactory(host: str, port: int, userName: str, password: str, DBname: str):
+    """
+    <function _connectionFactory>
+    :return: Coroutine function opening new asyncpg connection with given arguments.
+        Password is captured only by the closure, so it's not kept as an attribute of connection objects.
+    """
+    async def connect() -> asyncpg.Connection:
+        return await asyncpg.connect(host = host, port = port, user = userName, password = password, database = DBname)
+    return connect
+
 class AbstractPGDBConnectionClass(AbstractConnection):
     """
     <class AbstractPGDBConnectionClass> derived from AbstractConnection
@@ -54,14 +64,23 @@ class AbstractPGDBConnectionClass(AbstractConnection):
         self.__initialized_async = True
 
         # Init async PostgreSQL connection
-        self.connection = await asyncpg.connect(host = host, port = port, user = userName,
-                                                password = password, database = DBname)
+        self.__connect = _connectionFactory(host, port, userName, password, DBname)
+        del password
+        self.connection = await self.newConnection()
 
         # Exact server version
         exactServerVersion = self.connection.get_server_version()
         self.serverVersion = f"{exactServerVersion.major}.{exactServerVersion.minor}.{exactServerVersion.micro}"
         self.PID = self.connection.get_server_pid()
 
+    async def newConnection(self) -> asyncpg.Connection:
+        """
+        <async method AbstractPGDBConnectionClass.newConnection>
+        Open new asyncpg connection to same database. Used for dedicated connections like LISTEN.
+        Closing returned connection is caller's responsibility.
+        """
+        return await self.__connect()
+
     # ------------------------------------------------------------------------------------------------------------------
     # Representation
 
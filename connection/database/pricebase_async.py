@@ -9,9 +9,10 @@ Abstract base of all async database connection.
 # Standard libraries
 from copy import deepcopy
 from decimal import Decimal
-from datetime import datetime, timedelta
-from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+from collections import namedtuple, deque
 import asyncio
+import json
 
 # External libraries
 import asyncpg, asyncpg.exceptions
@@ -20,6 +21,16 @@ import asyncpg, asyncpg.exceptions
 from .base import AbstractPGDBConnectionClass
 import connection.errors as cerr
 
+# Errors which imply lost or unavailable connection
+_connectionErrors = (OSError, asyncio.TimeoutError, asyncpg.exceptions.InterfaceError, asyncpg.exceptions.PostgresError)
+
+# Timestamps given by callers are naive UTC, while rows fetched from TIMESTAMPTZ columns are aware UTC.
+def _naiveUTC(timestamp: datetime) -> datetime:
+    return timestamp.astimezone(timezone.utc).replace(tzinfo = None) if timestamp.tzinfo is not None else timestamp
+
+def _awareUTC(timestamp: datetime) -> datetime:
+    return timestamp.replace(tzinfo = timezone.utc) if timestamp.tzinfo is None else timestamp
+
 # ----------------------------------------------------------------------------------------------------------------------
 # Pricebase
 
@@ -37,6 +48,17 @@ class PriceBaseClass(AbstractPGDBConnectionClass):
     baseMinuteIntervals = {timedelta(seconds = 60), } # Base minute intervals to handle
     tickInterval = timedelta()
 
+    # Row types of fetched data
+    tickType = namedtuple("TICK", ["price", "volume"])
+    ohlcvType = namedtuple("OHLCV", ["open", "high", "low", "close", "volume"])
+
+    # Latest bars
+    latestRingSize = 1024 # Number of recent rows kept per market by PriceBaseClass.latest
+
+    # Change feed
+    changeChannel = "pricebase_changes"
+    changeEventType = namedtuple("CandleEvent", ["market", "interval", "lastTimestamp", "firstTimestamp"])
+
     # ------------------------------------------------------------------------------------------------------------------
     # Constructors / Initializing
 
@@ -49,6 +71,11 @@ class PriceBaseClass(AbstractPGDBConnectionClass):
         super().__init__(userName, password, DBname, host = host, port = port,
                          connectionName = connectionName, callLimits = callLimits)
 
+        # Recent rows served by PriceBaseClass.latest; {(exchange, base, quote, interval): deque([(timestamp, OHLCV), ...])}
+        self.__latestRings = {}
+        self.__completeRings = set() # Keys of rings which contain all rows of its table
+        self.__ringsLive = False # True while PriceBaseClass.keepLatestWarm is listening; Rings are used only then
+
         # Migrate markets
         self.markets = {}
         if isinstance(additionalMarkets, dict):
@@ -128,18 +155,23 @@ class PriceBaseClass(AbstractPGDBConnectionClass):
                             tableName = self.tableName(exchange, base, quote, interval)
                             print("tableName = %s, interval = %s" % (tableName, interval))
                             interval = PriceBaseClass.interval(interval)
-                            if interval != timedelta(minutes = 1):
+                            if interval not in (timedelta(minutes = 1), PriceBaseClass.tickInterval):
                                 print("yuck!")
                                 continue
                             totalSeconds = round(interval.total_seconds())
                             if interval == PriceBaseClass.tickInterval: # Tick data table initialization
+                                # Append-only layout; Trades in same timestamp are distinguished by sequence.
                                 await self.execute("""
                                     CREATE TABLE IF NOT EXISTS {T} (
-                                        timestamp TIMESTAMPTZ PRIMARY KEY,
-                                        price NUMERIC(24, 8) NOT NULL,
-                                        volume NUMERIC(24, 8) NOT NULL,
+                                        timestamp   TIMESTAMPTZ NOT NULL,
+                                        sequence    BIGINT GENERATED BY DEFAULT AS IDENTITY,
+                                        trade_id    TEXT,
+                                        price       NUMERIC(24, 8) NOT NULL,
+                                        volume      NUMERIC(24, 8) NOT NULL,
+                                        PRIMARY KEY (timestamp, sequence),
                                         CHECK(volume > 0)
                                     )""", (tableName,))
+                                await self.migrateTickTable(tableName)
                             else: # OHLCV table initialization
                                 await self.execute("""
                                     CREATE TABLE IF NOT EXISTS {T} (
@@ -153,6 +185,26 @@ class PriceBaseClass(AbstractPGDBConnectionClass):
                                         CHECK(CAST(ROUND(EXTRACT(epoch from timestamp)) AS BIGINT) %% CAST(%d AS BIGINT) = CAST(0 AS BIGINT))
                                     )""" % (totalSeconds,), (tableName,))
 
+    async def migrateTickTable(self, tableName: str):
+        """
+        <async method PriceBaseClass.migrateTickTable>
+        Upgrade tick table of old layout(primary key on timestamp only) to append-only layout;
+        Add sequence and trade_id columns, and make (timestamp, sequence) primary key. Existing rows get sequences.
+        Nothing is changed for tables already in new layout.
+        """
+        async with self.connection.transaction():
+            await self.execute("""
+                ALTER TABLE {T}
+                    ADD COLUMN IF NOT EXISTS sequence BIGINT GENERATED BY DEFAULT AS IDENTITY,
+                    ADD COLUMN IF NOT EXISTS trade_id TEXT""", (tableName,))
+            if set(await self.getPrimaryKeys(tableName)) != {"timestamp", "sequence"}:
+                constraintNames = await self.execute(
+                    "SELECT conname FROM pg_constraint WHERE conrelid = {vT}::regclass AND contype = 'p'",
+                    (tableName,), fetch = True)
+                for row in constraintNames or ():
+                    await self.execute("ALTER TABLE {T} DROP CONSTRAINT {T}", (tableName, row[0]))
+                await self.execute("ALTER TABLE {T} ADD PRIMARY KEY (timestamp, sequence)", (tableName,))
+
     # ------------------------------------------------------------------------------------------------------------------
     # Termination
 
@@ -216,6 +268,15 @@ class PriceBaseClass(AbstractPGDBConnectionClass):
         if minuteInterval not in self.availableIntervals(exchange, base, quote):
             raise cerr.MarketNotSupported(exchange, base, quote)
 
+    @staticmethod
+    def columnNames(interval: timedelta) -> str:
+        """
+        <static method PriceBaseClass.columnNames>
+        :return: Comma separated data column names(including timestamp) of table for given interval.
+        """
+        if PriceBaseClass.interval(interval) == PriceBaseClass.tickInterval: return "timestamp, price, volume"
+        else: return "timestamp, open, high, low, close, volume"
+
     # ------------------------------------------------------------------------------------------------------------------
     # Fetch
 
@@ -239,7 +300,8 @@ class PriceBaseClass(AbstractPGDBConnectionClass):
         tableName = self.tableName(exchange, base, quote, interval)
 
         # Execute query; Expected result = [row, row, ...] or None
-        data = await self.execute("SELECT * FROM {T} WHERE timestamp BETWEEN $1 AND $2 " +
+        data = await self.execute("SELECT " + PriceBaseClass.columnNames(interval) +
+                                  " FROM {T} WHERE timestamp BETWEEN $1 AND $2 " +
                                   ("LIMIT %d" % (limit,) if limit else ""),
                                   (tableName,), beginTime, endTime, timeout = timeout, fetch = True)
 
@@ -247,34 +309,531 @@ class PriceBaseClass(AbstractPGDBConnectionClass):
         result = {}
         if data: # If data was successfully returned
             if interval == PriceBaseClass.tickInterval: # [(timestamp, price, volume), ...]
-                datatype = namedtuple("TICK", ["price", "volume"])
+                datatype = PriceBaseClass.tickType
                 for row in data:
                     timestamp, price, volume = row[0], row[1], row[2]
                     result[timestamp] = datatype(price, volume) # {timestamp: (price, volume), ...}
             else: # [(timestamp, O, H, L, C, V), ...]
-                datatype = namedtuple("OHLCV", ["open", "high", "low", "close", "volume"])
+                datatype = PriceBaseClass.ohlcvType
                 for row in data:
                     timestamp, ohlcv = row[0], row[1:]
                     result[timestamp] = datatype(*ohlcv) # {timestamp: (O, H, L, C, V), ...}
         return result
 
+    async def selectMany(self, markets, interval: timedelta, beginTime: datetime, endTime: datetime = None,
+                         timeout: float = None) -> dict:
+        """
+        <async method PriceBaseClass.selectMany>
+        Select price data of several markets between given timestamps in one round-trip.
+        All tables are read by single UNION ALL query, so there is only one transaction for all markets.
+        :param markets: Iterable of (exchange, base, quote).
+        :return: Data aligned on common timestamp index, ordered by timestamp, formatted as
+            {timestamp: (row of markets[0], row of markets[1], ...), ...}
+            Each row is None if the market has no data at that timestamp. If no data was available, return empty dict.
+        """
+
+        # Validation
+        markets = tuple(tuple(market) for market in markets)
+        if endTime is None: endTime = datetime.now() # Automatically converted if not given
+        if beginTime > endTime: raise cerr.InvalidValueError("Given time begin point(%s) is later than end point(%s)" %
+                                                             (beginTime, endTime))
+        elif not markets: return {}
+        interval = PriceBaseClass.interval(interval)
+        tableNames = []
+        for exchange, base, quote in markets:
+            self.raiseIfNotSupported(exchange, base, quote, interval)
+            tableNames.append(self.tableName(exchange, base, quote, interval))
+
+        # Execute query; Each row is tagged by the index of its market. Expected result = [(index, row...), ...]
+        columns = PriceBaseClass.columnNames(interval)
+        query = " UNION ALL ".join("(SELECT %d AS market_index, %s FROM {T} WHERE timestamp BETWEEN $1 AND $2)" %
+                                   (index, columns) for index in range(len(markets)))
+        data = await self.execute(query + " ORDER BY timestamp", tuple(tableNames), beginTime, endTime,
+                                  timeout = timeout, fetch = True)
+
+        # Post-process data; Align rows of all markets on same timestamp
+        result = {}
+        if data:
+            datatype = PriceBaseClass.tickType if interval == PriceBaseClass.tickInterval else PriceBaseClass.ohlcvType
+            for row in data:
+                index, timestamp = row[0], row[1]
+                if timestamp not in result: result[timestamp] = [None] * len(markets)
+                result[timestamp][index] = datatype(*row[2:])
+        return {timestamp: tuple(rows) for timestamp, rows in result.items()}
+
+    alignModes = ("inner", "outer", "asof")
+    async def align(self, markets, interval: timedelta, beginTime: datetime, endTime: datetime = None,
+                    mode: str = "inner", fillLimit: int = None, timeout: float = None) -> dict:
+        """
+        <async method PriceBaseClass.align>
+        Align OHLCV rows of several markets on common timestamps. All markets are fetched in one query by
+        PriceBaseClass.selectMany, and aligned by single pass over rows ordered by timestamp.
+            - inner: Only timestamps where all markets have rows.
+            - outer: Timestamps where any market has row.
+            - asof: Every interval step between beginTime and endTime.
+        In outer and asof mode, missing rows are forward-filled from the last row of the market as flat bar
+        (open = high = low = close = last close, volume = 0), up to fillLimit intervals after the last row.
+        :param fillLimit: Maximum number of intervals to forward-fill. 0 for no filling, None for unlimited.
+            If fillLimit is given, rows before beginTime are looked back as much as fillLimit intervals.
+        :return: {timestamp: (row of markets[0], row of markets[1], ...), ...} ordered by timestamp.
+            Missing row which is not filled is None.
+        """
+
+        # Validation
+        if mode not in PriceBaseClass.alignModes: raise cerr.InvalidValueError("Invalid align mode(%s) given" % (mode,))
+        elif fillLimit is not None and (not isinstance(fillLimit, int) or fillLimit < 0):
+            raise cerr.InvalidValueError("Invalid fillLimit(%s) given" % (fillLimit,))
+        interval = PriceBaseClass.interval(interval)
+        if interval == PriceBaseClass.tickInterval: raise cerr.InvalidValueError("Tick data can't be aligned")
+        markets = tuple(tuple(market) for market in markets)
+        beginTime = _naiveUTC(beginTime)
+        endTime = _naiveUTC(endTime) if endTime is not None else datetime.now(timezone.utc).replace(tzinfo = None)
+
+        # Inner join doesn't need filling
+        if mode == "inner":
+            data = await self.selectMany(markets, interval, beginTime, endTime, timeout = timeout)
+            return {timestamp: rows for timestamp, rows in data.items() if None not in rows}
+
+        # Fetch rows, including rows to fill from before beginTime
+        lookbackTime = beginTime - interval * fillLimit if fillLimit else beginTime
+        data = await self.selectMany(markets, interval, lookbackTime, endTime, timeout = timeout)
+        seconds = interval.total_seconds()
+        beginEpoch = _awareUTC(beginTime).timestamp()
+        if mode == "outer": timeline = [(_awareUTC(timestamp).timestamp(), timestamp) for timestamp in data]
+        else:
+            rowsByEpoch = {_awareUTC(timestamp).timestamp(): rows for timestamp, rows in data.items()}
+            firstEpoch = -(-_awareUTC(lookbackTime).timestamp() // seconds) * seconds # Round up to interval
+            endEpoch = _awareUTC(endTime).timestamp()
+            timeline = [(epoch, datetime.fromtimestamp(epoch, timezone.utc)) for epoch in
+                        (firstEpoch + step * seconds for step in range(int((endEpoch - firstEpoch) // seconds) + 1))]
+
+        # Forward-fill; lastRows[i] = (epoch of last row, flat bar from it) for markets[i]
+        result = {}
+        lastRows = [None] * len(markets)
+        maxGap = float("inf") if fillLimit is None else fillLimit * seconds
+        for epoch, timestamp in timeline:
+            rows = data.get(timestamp) if mode == "outer" else rowsByEpoch.get(epoch)
+            aligned = []
+            for index in range(len(markets)):
+                row = rows[index] if rows else None
+                if row is not None:
+                    lastRows[index] = (epoch, PriceBaseClass.ohlcvType(row.close, row.close, row.close, row.close, Decimal(0)))
+                elif lastRows[index] is not None and epoch - lastRows[index][0] <= maxGap: row = lastRows[index][1]
+                aligned.append(row)
+            if epoch >= beginEpoch: result[timestamp] = tuple(aligned)
+        return result
+
+    async def selectTicks(self, exchange: str, base: str, quote: str, beginTime: datetime, endTime: datetime = None,
+                          timeout: float = None) -> list:
+        """
+        <async method PriceBaseClass.selectTicks>
+        Select all ticks between given timestamps, including ticks which share same timestamp.
+        :return: List of (timestamp, sequence, tradeID, price, volume) ordered by (timestamp, sequence).
+        """
+
+        # Validation
+        if endTime is None: endTime = datetime.now() # Automatically converted if not given
+        if beginTime > endTime: raise cerr.InvalidValueError("Given time begin point(%s) is later than end point(%s)" %
+                                                             (beginTime, endTime))
+        self.raiseIfNotSupported(exchange, base, quote, PriceBaseClass.tickInterval)
+        tableName = self.tableName(exchange, base, quote, PriceBaseClass.tickInterval)
+
+        # Execute query
+        data = await self.execute("""
+            SELECT timestamp, sequence, trade_id, price, volume FROM {T}
+            WHERE timestamp BETWEEN $1 AND $2 ORDER BY timestamp, sequence""",
+                                  (tableName,), beginTime, endTime, timeout = timeout, fetch = True)
+        return [tuple(row) for row in data] if data else []
+
+    async def latest(self, exchange: str, base: str, quote: str, interval: timedelta, n: int,
+                     timeout: float = None) -> dict:
+        """
+        <async method PriceBaseClass.latest>
+        Get last n OHLCV rows by descending index scan.
+        While PriceBaseClass.keepLatestWarm is listening to change notifications, first call for each market reads
+        PriceBaseClass.latestRingSize rows, and later calls are served from memory kept warm by appends and notifications.
+        Otherwise rows written by other processes can't be noticed, so every call queries the database.
+        :return: {timestamp: OHLCV, ...} of last n rows, ordered by timestamp.
+        """
+
+        # Validation
+        if not isinstance(n, int): raise cerr.InvalidTypeError("Given n has invalid type(%s)" % (type(n),))
+        elif n <= 0: raise cerr.InvalidValueError("Non-positive n(%d) given" % (n,))
+        interval = PriceBaseClass.interval(interval)
+        if interval == PriceBaseClass.tickInterval: raise cerr.InvalidValueError("Tick interval is not supported")
+        self.raiseIfNotSupported(exchange, base, quote, interval)
+        key = (exchange, base, quote, interval)
+
+        # Too many rows for ring, or no one keeps rings fresh
+        if n > PriceBaseClass.latestRingSize or not self.__ringsLive:
+            return dict(await self.__fetchLatest(self.connection, key, n, timeout = timeout))
+
+        # Fill ring if it's cold
+        ring = self.__latestRings.get(key)
+        if ring is None:
+            rows = await self.__fetchLatest(self.connection, key, PriceBaseClass.latestRingSize, timeout = timeout)
+            ring = self.__latestRings[key] = deque(rows, maxlen = PriceBaseClass.latestRingSize)
+            if len(rows) < PriceBaseClass.latestRingSize: self.__completeRings.add(key)
+        return dict(ring[index] for index in range(-min(n, len(ring)), 0))
+
+    async def firstTimestamp(self, exchange: str, base: str, quote: str, interval: timedelta,
+                             timeout: float = None) -> datetime:
+        """
+        <async method PriceBaseClass.firstTimestamp>
+        :return: Timestamp of the oldest row of given market and interval, None if the table is empty.
+        """
+        interval = PriceBaseClass.interval(interval)
+        self.raiseIfNotSupported(exchange, base, quote, interval)
+        data = await self.execute("SELECT timestamp FROM {T} ORDER BY timestamp ASC LIMIT 1",
+                                  (self.tableName(exchange, base, quote, interval),), timeout = timeout, fetch = True)
+        return data[0][0] if data else None
+
+    async def __fetchLatest(self, queryConnection: asyncpg.Connection, key: tuple, n: int,
+                            afterTime: datetime = None, timeout: float = None) -> list:
+        """
+        <async method PriceBaseClass.__fetchLatest>
+        :return: Last n rows(at or after afterTime if given) of given key as [(timestamp, OHLCV), ...] ordered by timestamp.
+        """
+        query = "SELECT %s FROM {T} %s ORDER BY timestamp DESC LIMIT $1" % \
+                (PriceBaseClass.columnNames(key[3]), "WHERE timestamp >= $2" if afterTime is not None else "")
+        args = (n,) if afterTime is None else (n, afterTime)
+        data = await queryConnection.fetch(self.RN(query, self.tableName(*key)), *args, timeout = timeout)
+        return [(row[0], PriceBaseClass.ohlcvType(*row[1:])) for row in reversed(data)]
+
+    def __mergeLatest(self, key: tuple, rows, override: bool = True):
+        """
+        <method PriceBaseClass.__mergeLatest>
+        Merge written or fetched rows [(timestamp, OHLCV), ...] into ring of given key, if the ring exists.
+        Ring is dropped when rows can't be merged cheaply; It's refilled on next PriceBaseClass.latest call.
+        Naive timestamps are regarded as UTC, and stored as aware ones like fetched rows.
+        """
+        ring = self.__latestRings.get(key)
+        if ring is None: return
+        for timestamp, ohlcv in sorted(((_awareUTC(timestamp), ohlcv) for timestamp, ohlcv in rows), key = lambda row: row[0]):
+            if not ring or timestamp > ring[-1][0]: # Newest row
+                if len(ring) == ring.maxlen: self.__completeRings.discard(key)
+                ring.append((timestamp, ohlcv))
+            elif timestamp >= ring[0][0]: # Row in ring window; Search from newest side
+                index = next(index for index in range(-1, -len(ring) - 1, -1) if ring[index][0] <= timestamp)
+                if ring[index][0] == timestamp: # Update of existing row
+                    if override: ring[index] = (timestamp, ohlcv)
+                else: # Insertion in the middle of ring
+                    del self.__latestRings[key]
+                    self.__completeRings.discard(key)
+                    return
+            elif key in self.__completeRings and len(ring) < ring.maxlen: ring.appendleft((timestamp, ohlcv))
+            elif key in self.__completeRings: self.__completeRings.discard(key) # Ring window is full now
+
+    async def keepLatestWarm(self, **subscribeKwargs):
+        """
+        <async method PriceBaseClass.keepLatestWarm>
+        Run forever, refreshing rings of PriceBaseClass.latest from change notifications of other writers.
+        Rings are served only while the LISTEN connection is alive, and dropped whenever it's (re)connected or lost,
+        since notifications sent meanwhile are missed. Loss is noticed within healthCheckInterval of subscribe.
+        Dedicated connection is used for refreshing, so it doesn't disturb queries on PriceBaseClass.connection.
+        :param subscribeKwargs: Passed to PriceBaseClass.subscribe.
+        """
+        def connectionChanged(connected: bool):
+            self.__ringsLive = connected
+            self.__latestRings.clear()
+            self.__completeRings.clear()
+
+        refreshConnection = None
+        try:
+            async for event in self.subscribe(onConnectionChange = connectionChanged, **subscribeKwargs):
+                key = (*event.market, event.interval)
+                ring = self.__latestRings.get(key)
+                if ring is None: continue
+                elif ring and event.lastTimestamp < ring[0][0]: continue # Change out of ring window
+                try:
+                    # Refetch from the first written row, so overwritten rows in ring window are refreshed too
+                    afterTime = max(min(event.firstTimestamp, ring[-1][0]), ring[0][0]) if ring else None
+                    if refreshConnection is None: refreshConnection = await self.newConnection()
+                    self.__mergeLatest(key, await self.__fetchLatest(
+                        refreshConnection, key, PriceBaseClass.latestRingSize, afterTime))
+                except _connectionErrors: # Can't refresh; Drop the ring to avoid serving stale rows
+                    self.__latestRings.pop(key, None)
+                    self.__completeRings.discard(key)
+                    if refreshConnection is not None: refreshConnection.terminate()
+                    refreshConnection = None
+        finally:
+            connectionChanged(False)
+            if refreshConnection is not None and not refreshConnection.is_closed(): await refreshConnection.close()
+
     # ------------------------------------------------------------------------------------------------------------------
     # Insert and update
 
+    tickCopyColumns = ("timestamp", "trade_id", "price", "volume")
+    async def appendTicks(self, exchange: str, base: str, quote: str, records: list, timeout: float = None,
+                          queryConnection: asyncpg.Connection = None) -> int:
+        """
+        <async method PriceBaseClass.appendTicks>
+        Append ticks to tick table using binary COPY. Ticks are never overwritten;
+        Sequence is assigned by database, so many trades can share the same timestamp.
+        :param records: List of (timestamp, tradeID, price, volume). tradeID can be None.
+        :param queryConnection: Connection to copy through. Default to self.connection.
+        :return: Number of appended ticks.
+        """
+
+        # Validation
+        self.raiseIfNotSupported(exchange, base, quote, PriceBaseClass.tickInterval)
+        if not records: return 0
+        tableName = self.tableName(exchange, base, quote, PriceBaseClass.tickInterval)
+
+        # Copy records
+        if queryConnection is None: queryConnection = self.connection
+        async with queryConnection.transaction():
+            await queryConnection.copy_records_to_table(
+                tableName, records = records, columns = PriceBaseClass.tickCopyColumns, timeout = timeout)
+            await self._notifyChange(exchange, base, quote, PriceBaseClass.tickInterval,
+                                     max(record[0] for record in records), min(record[0] for record in records),
+                                     queryConnection = queryConnection)
+        return len(records)
+
+    async def appendOHLCVs(self, exchange: str, base: str, quote: str, interval: timedelta, rows: list,
+                           override: bool = True, timeout: float = None) -> int:
+        """
+        <async method PriceBaseClass.appendOHLCVs>
+        Insert or update many OHLCV rows in one transaction.
+        :param rows: List of (timestamp, open, high, low, close, volume).
+        :param override: Decide to override conflicted data or not.
+        :return: Number of given rows.
+        """
+
+        # Validation
+        interval = PriceBaseClass.interval(interval)
+        if interval == PriceBaseClass.tickInterval:
+            raise cerr.InvalidValueError("Tick interval given; Use PriceBaseClass.appendTicks instead")
+        self.raiseIfNotSupported(exchange, base, quote, interval)
+        totalSeconds = round(interval.total_seconds())
+        for row in rows:
+            if round(row[0].timestamp()) % totalSeconds: # Timestamp should be divisible by interval
+                raise cerr.InvalidValueError("Given timestamp(%s) is not fit to given interval(%s)" % (row[0], interval))
+        if not rows: return 0
+        tableName = self.tableName(exchange, base, quote, interval)
+
+        # Execute query
+        query = self.RN("""
+            INSERT INTO {T} (timestamp, open, high, low, close, volume) VALUES ($1, $2, $3, $4, $5, $6)
+            ON CONFLICT (timestamp) DO """ + ("""UPDATE SET (open, high, low, close, volume) =
+            (EXCLUDED.open, EXCLUDED.high, EXCLUDED.low, EXCLUDED.close, EXCLUDED.volume)""" if override else "NOTHING"),
+                        tableName)
+        async with self.connection.transaction():
+            await self.connection.executemany(query, rows, timeout = timeout)
+            await self._notifyChange(exchange, base, quote, interval,
+                                     max(row[0] for row in rows), min(row[0] for row in rows))
+        self.__mergeLatest((exchange, base, quote, interval),
+                           [(row[0], PriceBaseClass.ohlcvType(*row[1:6])) for row in rows], override = override)
+        return len(rows)
+
     async def append(self, exchange: str, base: str, quote: str, interval: timedelta, timestamp: datetime,
                      open: Decimal = None, high: Decimal = None, low: Decimal = None, close: Decimal = None,
-                     volume: Decimal = None, price: Decimal = None):
+                     volume: Decimal = None, price: Decimal = None, override: bool = True):
         """
         <async method PriceBaseClass.append>
-        Append new price data to table.
+        Append new price data to table. Give 'price' and 'volume' for tick data, otherwise give OHLCV.
         """
 
         # Validation
+        interval = PriceBaseClass.interval(interval)
+        if interval == PriceBaseClass.tickInterval:
+            if price is None or volume is None: raise cerr.InvalidValueError("Price and volume should be given for tick")
+            await self.appendTicks(exchange, base, quote, [(timestamp, None, price, volume)])
+        else:
+            if None in (open, high, low, close, volume):
+                raise cerr.InvalidValueError("All of OHLCV should be given for interval %s" % (interval,))
+            await self.appendOHLCVs(exchange, base, quote, interval, [(timestamp, open, high, low, close, volume)],
+                                    override = override)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    # Change feed
+
+    async def _notifyChange(self, exchange: str, base: str, quote: str, interval: timedelta,
+                            lastTimestamp: datetime, firstTimestamp: datetime = None,
+                            queryConnection: asyncpg.Connection = None):
+        """
+        <async method PriceBaseClass._notifyChange>
+        Send NOTIFY about written rows. Notification is delivered when current transaction is committed.
+        :param firstTimestamp: Oldest timestamp of written rows. Default to lastTimestamp.
+        :param queryConnection: Connection running the writing transaction. Default to self.connection.
+        """
+        if firstTimestamp is None: firstTimestamp = lastTimestamp
+        payload = json.dumps([exchange, base, quote, round(interval.total_seconds()),
+                              _awareUTC(lastTimestamp).timestamp(), _awareUTC(firstTimestamp).timestamp()])
+        await (queryConnection or self.connection).execute("SELECT pg_notify($1, $2)", PriceBaseClass.changeChannel, payload)
+
+    @staticmethod
+    def parseChange(payload: str):
+        """
+        <static method PriceBaseClass.parseChange>
+        :return: CandleEvent((exchange, base, quote), interval, lastTimestamp, firstTimestamp) parsed from NOTIFY payload.
+            firstTimestamp is same as lastTimestamp for payloads without it.
+        """
+        exchange, base, quote, seconds, epoch, *firstEpoch = json.loads(payload)
+        return PriceBaseClass.changeEventType((exchange, base, quote), timedelta(seconds = seconds),
+                                              datetime.fromtimestamp(epoch, timezone.utc),
+                                              datetime.fromtimestamp(firstEpoch[0] if firstEpoch else epoch, timezone.utc))
+
+    async def subscribe(self, markets = None, reconnectDelay: float = 1.0, healthCheckInterval: float = 10.0,
+                        onConnectionChange = None):
+        """
+        <async generator PriceBaseClass.subscribe>
+        Async iterator of CandleEvent((exchange, base, quote), interval, lastTimestamp, firstTimestamp) for rows written by
+        PriceBaseClass.appendOHLCVs or PriceBaseClass.appendTicks from any process.
+        Dedicated LISTEN connection is used, and it's reconnected automatically when lost.
+        Note that events sent while reconnecting are not delivered.
+        :param markets: If given, only events of these (exchange, base, quote) markets are yielded.
+        :param reconnectDelay: Waiting time in seconds before reconnecting.
+        :param healthCheckInterval: If no event arrived for this seconds, check if the connection is still alive.
+        :param onConnectionChange: If given, called as onConnectionChange(connected) when LISTEN connection is
+            established or found lost.
+        """
+        markets = None if markets is None else set(tuple(market) for market in markets)
+        payloads = asyncio.Queue()
+        def listener(listenConnection, pid, channel, payload): payloads.put_nowait(payload)
+
+        listenConnection = None
+        try:
+            while True:
+
+                # (Re)connect
+                if listenConnection is None:
+                    try:
+                        listenConnection = await self.newConnection()
+                        await listenConnection.add_listener(PriceBaseClass.changeChannel, listener)
+                        if onConnectionChange is not None: onConnectionChange(True)
+                    except _connectionErrors:
+                        if listenConnection is not None: listenConnection.terminate()
+                        listenConnection = None
+                        await asyncio.sleep(reconnectDelay)
+                        continue
+
+                # Wait for event; Check connection if it's quiet for long time
+                try: payload = await asyncio.wait_for(payloads.get(), timeout = healthCheckInterval)
+                except asyncio.TimeoutError:
+                    try: await listenConnection.execute("SELECT 1", timeout = healthCheckInterval)
+                    except _connectionErrors:
+                        listenConnection.terminate()
+                        listenConnection = None
+                        if onConnectionChange is not None: onConnectionChange(False)
+                    continue
+                event = PriceBaseClass.parseChange(payload)
+                if markets is None or event.market in markets: yield event
+        finally:
+            if listenConnection is not None and not listenConnection.is_closed(): await listenConnection.close()
 
 # ----------------------------------------------------------------------------------------------------------------------
-# Extra
+# Tick ingestion
+
+class TickIngestBuffer:
+    """
+    <class TickIngestBuffer>
+    High-rate tick ingestion buffer for PriceBaseClass.
+    Ticks are accumulated per market in memory, and flushed by COPY when flushSize ticks are buffered
+    or flushInterval seconds passed. Pushing a tick never waits for the database.
+    Flushes run on the buffer's own connection, so queries on PriceBaseClass.connection are never interleaved with them.
+    """
+
+    def __init__(self, pricebase: PriceBaseClass, flushSize: int = 20000, flushInterval: float = 1.0,
+                 timeout: float = None):
+        """
+        <method TickIngestBuffer.__init__>
+        :param pricebase: Target PriceBaseClass.
+        :param flushSize: Number of buffered ticks which triggers flush.
+        :param flushInterval: Maximum time in seconds a tick waits in buffer while TickIngestBuffer.run is running.
+        :param timeout: Timeout of each COPY query.
+        """
+        if not isinstance(flushSize, int) or flushSize <= 0:
+            raise cerr.InvalidValueError("Invalid flushSize(%s) given" % (flushSize,))
+        elif flushInterval <= 0: raise cerr.InvalidValueError("Non-positive flushInterval(%s) given" % (flushInterval,))
+        self.pricebase = pricebase
+        self.flushSize, self.flushInterval, self.timeout = flushSize, flushInterval, timeout
+        self.buffers = {} # {(exchange, base, quote): [(timestamp, tradeID, price, volume), ...]}
+        self.bufferedCount = 0
+        self.flushedCount = 0
+        self.connection = None # Dedicated connection for COPY, opened on first flush
+        self.__flushLock = asyncio.Lock()
+        self.__flushTask = None
+        self.__running = False
+
+    async def __aenter__(self): return self
+    async def __aexit__(self, exc_type, exc_val, exc_tb): await self.close()
+
+    def push(self, exchange: str, base: str, quote: str, timestamp: datetime,
+             price: Decimal, volume: Decimal, tradeID = None):
+        """
+        <method TickIngestBuffer.push>
+        Push single tick into buffer. Flush is scheduled in background when the buffer is full.
+        """
+        market = (exchange, base, quote)
+        if market not in self.buffers:
+            self.pricebase.raiseIfNotSupported(exchange, base, quote, PriceBaseClass.tickInterval)
+            self.buffers[market] = []
+        if not isinstance(price, Decimal): price = Decimal(str(price))
+        if not isinstance(volume, Decimal): volume = Decimal(str(volume))
+        self.buffers[market].append((timestamp, None if tradeID is None else str(tradeID), price, volume))
+        self.bufferedCount += 1
+        if self.bufferedCount >= self.flushSize and (self.__flushTask is None or self.__flushTask.done()):
+            if self.__flushTask is not None: self.__reportFlushError(self.__flushTask)
+            self.__flushTask = asyncio.ensure_future(self.flush())
 
-pass
+    @staticmethod
+    def __reportFlushError(task: asyncio.Future):
+        """
+        <static method TickIngestBuffer.__reportFlushError>
+        Retrieve and report exception of finished background flush. Its ticks are already back in buffer.
+        """
+        if not task.cancelled() and task.exception() is not None:
+            print("[Warning] Background tick flush failed: <%s> %s" % (type(task.exception()).__name__, task.exception()))
+
+    async def flush(self) -> int:
+        """
+        <async method TickIngestBuffer.flush>
+        Copy all buffered ticks into database. If copy fails, failed ticks are returned to buffer.
+        :return: Number of flushed ticks.
+        """
+        async with self.__flushLock:
+            buffers, self.buffers, self.bufferedCount = self.buffers, {}, 0
+            flushed = 0
+            try:
+                if self.connection is None or self.connection.is_closed():
+                    self.connection = await self.pricebase.newConnection()
+                for market in tuple(buffers):
+                    flushed += await self.pricebase.appendTicks(*market, buffers[market], timeout = self.timeout,
+                                                                queryConnection = self.connection)
+                    del buffers[market]
+            finally: # Put not flushed ticks back before newer ticks
+                for market in buffers:
+                    self.buffers[market] = buffers[market] + self.buffers.get(market, [])
+                    self.bufferedCount += len(buffers[market])
+                self.flushedCount += flushed
+            return flushed
+
+    async def run(self):
+        """
+        <async method TickIngestBuffer.run>
+        Flush periodically until TickIngestBuffer.close is called.
+        """
+        self.__running = True
+        while self.__running:
+            await asyncio.sleep(self.flushInterval)
+            if self.bufferedCount: await self.flush()
+
+    async def close(self):
+        """
+        <async method TickIngestBuffer.close>
+        Stop periodic flushing, flush remaining ticks and close the dedicated connection.
+        Failure of background flush is reported, and its ticks are flushed again here.
+        """
+        self.__running = False
+        if self.__flushTask is not None:
+            await asyncio.wait([self.__flushTask])
+            self.__reportFlushError(self.__flushTask)
+            self.__flushTask = None
+        try: await self.flush()
+        finally:
+            if self.connection is not None and not self.connection.is_closed(): await self.connection.close()
+            self.connection = None
 
 # ----------------------------------------------------------------------------------------------------------------------
 # Async initializer
@@ -10,11 +10,19 @@ Abstract base of all database connection.
 from copy import deepcopy
 from decimal import Decimal
 from datetime import datetime, timedelta
+from itertools import count
+from contextlib import contextmanager
 import atexit
+import io
+import json
+import os
+import threading
 
 # External libraries
 import psycopg2
 from psycopg2.sql import SQL, Identifier, Literal # Advanced querying
+from psycopg2.extras import execute_values
+from psycopg2.pool import ThreadedConnectionPool
 
 # Custom libraries
 from connection.base import AbstractConnection
@@ -23,13 +31,45 @@ import connection.errors as cerr
 # ----------------------------------------------------------------------------------------------------------------------
 # Pricebase
 
+def _connectionFactory(**connectArguments):
+    """
+    <function _connectionFactory>
+    :return: Function opening new psycopg2 connection with given arguments.
+        Password is captured only by the closure, so it's not kept as an attribute of PriceBaseSync.
+    """
+    def connect(): return psycopg2.connect(**connectArguments)
+    return connect
+
+class _FactoryConnectionPool(ThreadedConnectionPool):
+    """
+    <class _FactoryConnectionPool> inherited from ThreadedConnectionPool
+    ThreadedConnectionPool opening connections by given function instead of keeping connection arguments,
+    so the password is not kept by the pool either.
+    """
+
+    def __init__(self, minconn: int, maxconn: int, connect):
+        self.__connect = connect # Used by ThreadedConnectionPool.__init__, so set first
+        super().__init__(minconn, maxconn)
+
+    def _connect(self, key = None):
+        connection = self.__connect()
+        if key is not None:
+            self._used[key] = connection
+            self._rused[id(connection)] = key
+        else: self._pool.append(connection)
+        return connection
+
 class PriceBaseSync(AbstractConnection):
     """
     <class PriceBaseSync> inherited from AbstractConnection
     Base database object to store price data(OHLCV and tick data).
 
     Keep in mind that this object don't support asynchronous querying yet.
-    Multithreading is possible, but since psycopg2 only supports revoking transaction at connection-object level, I don't recommend it.
+    By default single connection is shared, and since psycopg2 only supports revoking transaction at connection-object level,
+    multithreading is not recommended. Give poolSize to use thread-pooled mode instead; In that mode every method
+    checks out its own connection from ThreadedConnectionPool, so methods can be called from many threads at once.
+    A thread can hold at most poolSize connections at once(e.g. calling other methods while iterating iterMultiOHLCV
+    holds two); Borrowing more raises cerr.InvalidError instead of waiting for itself forever.
 
     All query-related method should contain 'exchange', 'base', 'quote', 'minuteInterval' as first 4 arguments.
     Those are decorated by validity checking method.
@@ -38,21 +78,32 @@ class PriceBaseSync(AbstractConnection):
     defaultDBname = "PriceBaseSync"
     defaultPortNumber = 5432 # Default port number for PostgreSQL
     baseMinuteIntervals = {1,} # Base minute intervals to handle
+    _cursorNumbers = count() # Used to make unique names of server-side cursors
 
     # ------------------------------------------------------------------------------------------------------------------
     # Constructors
 
     def __init__(self, username: str, password: str, dbname: str = defaultDBname,
                  host: str = "localhost", port: int = defaultPortNumber,
-                 additionalMarkets: dict = None, callLimits: dict = None):
+                 additionalMarkets: dict = None, callLimits: dict = None, poolSize: int = None):
 
         # Parent class initialization; Key is not given to parent class because it's handled by db connection
         super().__init__(connectionName = "PostgreSQL %s/%s Connection" % (dbname, username), callLimits = callLimits)
 
-        # Create DB connection
-        self.connection = psycopg2.connect(user = username, password = password, dbname = dbname,
-                                           host = host, port = port)
+        # Create DB connection; In pooled mode there is no shared connection
+        self.__connect = _connectionFactory(user = username, password = password, dbname = dbname,
+                                            host = host, port = port) # For dedicated and pooled connections
         del username, password
+        self.poolSize = poolSize
+        if poolSize is None:
+            self.pool = None
+            self.connection = self.__connect()
+        elif isinstance(poolSize, int) and poolSize > 0:
+            self.pool = _FactoryConnectionPool(1, poolSize, self.__connect)
+            self.__poolSlots = threading.BoundedSemaphore(poolSize) # getconn raises instead of waiting when exhausted
+            self.__borrowed = threading.local() # Number of pooled connections held by each thread
+            self.connection = None
+        else: raise cerr.InvalidError("Invalid poolSize(%s) given" % (poolSize,))
 
         # Migrate markets
         self.markets = {}
@@ -67,7 +118,7 @@ class PriceBaseSync(AbstractConnection):
                             self.markets[exchange][base][quote].add(minuteInterval)
 
         # Search already existing markets and add in self.markets
-        with self.connection.cursor() as cursor:
+        with self.borrowConnection() as connection, connection.cursor() as cursor:
             cursor.execute("""
                 SELECT table_name
                 FROM information_schema.tables
@@ -93,7 +144,48 @@ class PriceBaseSync(AbstractConnection):
 
     def terminate(self):
         super().terminate()
-        if not self.connection.closed: self.connection.close()
+        if self.pool is not None:
+            if not self.pool.closed: self.pool.closeall()
+        elif not self.connection.closed: self.connection.close()
+
+    # ------------------------------------------------------------------------------------------------------------------
+    # Connection
+
+    @contextmanager
+    def borrowConnection(self):
+        """
+        <method PriceBaseSync.borrowConnection>
+        Context manager giving connection to use. In pooled mode, the connection is checked out from pool
+        and returned at the end; Unfinished transaction is rolled back by pool when returned.
+        If all pooled connections are in use, wait until one is returned.
+        If all of them are held by the calling thread, raise cerr.InvalidError since no one would return them.
+        """
+        if self.pool is None: yield self.connection
+        else:
+            borrowed = getattr(self.__borrowed, "count", 0)
+            if borrowed >= self.poolSize:
+                raise cerr.InvalidError("All %d pooled connections are already held by this thread" % (self.poolSize,))
+            with self.__poolSlots:
+                connection = self.pool.getconn()
+                self.__borrowed.count = borrowed + 1
+                try: yield connection
+                finally:
+                    self.__borrowed.count -= 1
+                    self.pool.putconn(connection)
+
+    @contextmanager
+    def dedicatedConnection(self):
+        """
+        <method PriceBaseSync.dedicatedConnection>
+        Context manager giving connection not used by any other method while the context is running.
+        In pooled mode it's same as PriceBaseSync.borrowConnection, otherwise new connection is opened and closed at the end.
+        """
+        if self.pool is not None:
+            with self.borrowConnection() as connection: yield connection
+        else:
+            connection = self.__connect()
+            try: yield connection
+            finally: connection.close()
 
     # ------------------------------------------------------------------------------------------------------------------
     # Helper
@@ -134,37 +226,38 @@ class PriceBaseSync(AbstractConnection):
         <method PriceBaseSync.addMarketTables>
         Add database tables for currently supporting markets.
         """
-        with self.connection.cursor() as cursor:
-            for exchange in self.markets:
-                for base in self.markets[exchange]:
-                    for quote in self.markets[exchange][base]:
-                        for minuteInterval in self.markets[exchange][base][quote]:
-
-                            # Tick
-                            if minuteInterval == 0: cursor.execute(SQL("""
-                                CREATE TABLE IF NOT EXISTS {} (
-                                timestamp TIMESTAMPTZ PRIMARY KEY,
-                                price NUMERIC(24, 8) NOT NULL,
-                                volume NUMERIC(24, 8) NOT NULL,
-                                CHECK(volume > 0),
-                                CHECK(timestamp <= NOW())
-                            );""").format(Identifier(PriceBaseSync.tableName(exchange, base, quote, 0))))
-
-                            # OHLCV
-                            else: cursor.execute(SQL("""
-                                CREATE TABLE IF NOT EXISTS {0} (
-                                timestamp TIMESTAMPTZ PRIMARY KEY,
-                                open NUMERIC(24, 8) NOT NULL,
-                                high NUMERIC(24, 8) NOT NULL,
-                                low NUMERIC(24, 8) NOT NULL,
-                                close NUMERIC(24, 8) NOT NULL,
-                                volume NUMERIC(24, 8) NOT NULL,
-                                CHECK(volume > 0), 
-                                CHECK(timestamp <= NOW()),
-                                CHECK(CAST(ROUND(EXTRACT(epoch from timestamp)) AS BIGINT) % {1} == 0)
-                            );""").format(Identifier(PriceBaseSync.tableName(exchange, base, quote, minuteInterval)),
-                                          Literal(60 * minuteInterval)))
-        self.connection.commit()
+        with self.borrowConnection() as connection:
+            with connection.cursor() as cursor:
+                for exchange in self.markets:
+                    for base in self.markets[exchange]:
+                        for quote in self.markets[exchange][base]:
+                            for minuteInterval in self.markets[exchange][base][quote]:
+
+                                # Tick
+                                if minuteInterval == 0: cursor.execute(SQL("""
+                                    CREATE TABLE IF NOT EXISTS {} (
+                                    timestamp TIMESTAMPTZ PRIMARY KEY,
+                                    price NUMERIC(24, 8) NOT NULL,
+                                    volume NUMERIC(24, 8) NOT NULL,
+                                    CHECK(volume > 0),
+                                    CHECK(timestamp <= NOW())
+                                );""").format(Identifier(PriceBaseSync.tableName(exchange, base, quote, 0))))
+
+                                # OHLCV
+                                else: cursor.execute(SQL("""
+                                    CREATE TABLE IF NOT EXISTS {0} (
+                                    timestamp TIMESTAMPTZ PRIMARY KEY,
+                                    open NUMERIC(24, 8) NOT NULL,
+                                    high NUMERIC(24, 8) NOT NULL,
+                                    low NUMERIC(24, 8) NOT NULL,
+                                    close NUMERIC(24, 8) NOT NULL,
+                                    volume NUMERIC(24, 8) NOT NULL,
+                                    CHECK(volume > 0), 
+                                    CHECK(timestamp <= NOW()),
+                                    CHECK(CAST(ROUND(EXTRACT(epoch from timestamp)) AS BIGINT) % {1} == 0)
+                                );""").format(Identifier(PriceBaseSync.tableName(exchange, base, quote, minuteInterval)),
+                                              Literal(60 * minuteInterval)))
+            connection.commit()
 
     # ------------------------------------------------------------------------------------------------------------------
     # Grant privileges
@@ -176,20 +269,21 @@ class PriceBaseSync(AbstractConnection):
         if privilege not in ("SELECT", "INSERT", "UPDATE", "DELETE", "RULE", "ALL"):
             raise cerr.InvalidError("Given privilege(%s) is invalid" % (privilege,))
 
-        try: # Try grantTable query
-            with self.connection.cursor() as cursor:
-                for exchange in self.markets:
-                    for base in self.markets[exchange]:
-                        for quote in self.markets[exchange][base]:
-                            for minuteInterval in self.markets[exchange][base][quote]:
-                                IDtuple = (psycopg2.sql.Identifier(self.tableName(exchange, base, quote, minuteInterval)),
-                                           psycopg2.sql.Identifier(username))
-                                if give: cursor.execute(SQL("GRANT %s ON {0} TO {1}" % (privilege,)).format(*IDtuple))
-                                else: cursor.execute(SQL("REVOKE %s ON {0} FROM {1}" % (privilege,)).format(*IDtuple))
-            self.connection.commit()
-        except psycopg2.Error as err: # If error occurred then cancel everything
-            print("Error (%s) occured while doing grantTable query <%s>" % (err, str(cursor.query)))
-            self.connection.rollback()
+        with self.borrowConnection() as connection:
+            try: # Try grantTable query
+                with connection.cursor() as cursor:
+                    for exchange in self.markets:
+                        for base in self.markets[exchange]:
+                            for quote in self.markets[exchange][base]:
+                                for minuteInterval in self.markets[exchange][base][quote]:
+                                    IDtuple = (psycopg2.sql.Identifier(self.tableName(exchange, base, quote, minuteInterval)),
+                                               psycopg2.sql.Identifier(username))
+                                    if give: cursor.execute(SQL("GRANT %s ON {0} TO {1}" % (privilege,)).format(*IDtuple))
+                                    else: cursor.execute(SQL("REVOKE %s ON {0} FROM {1}" % (privilege,)).format(*IDtuple))
+                connection.commit()
+            except psycopg2.Error as err: # If error occurred then cancel everything
+                print("Error (%s) occured while doing grantTable query <%s>" % (err, str(cursor.query)))
+                connection.rollback()
 
     # ------------------------------------------------------------------------------------------------------------------
     # Search data
@@ -210,18 +304,19 @@ class PriceBaseSync(AbstractConnection):
         elif timestamp.timestamp() % (minuteInterval * 60) != 0: # Timestamp should be divisible by minute interval
             raise cerr.InvalidError("Given timestamp(%s) is not fit to given interval(%d minutes)" % (timestamp, minuteInterval))
 
-        try: # Try selection
-            with self.connection.cursor() as cursor:
-                cursor.execute(SQL('SELECT "open", "high", "low", "close", "volume" FROM {} WHERE "timestamp" = %s;').format(
-                    Identifier(self.tableName(exchange, base, quote, minuteInterval))), (timestamp,))
-                result = cursor.fetchall()
-                self.connection.commit()
-                assert len(result) < 2 # Result should be unique
-                return result[0][1:6] if result else None
-        except psycopg2.Error as err:
-            self.connection.rollback()
-            print("Error occured while getting single OHLCV: <%s> // query: <%s>" % (err, cursor.query))
-            return None
+        with self.borrowConnection() as connection:
+            try: # Try selection
+                with connection.cursor() as cursor:
+                    cursor.execute(SQL('SELECT "open", "high", "low", "close", "volume" FROM {} WHERE "timestamp" = %s;').format(
+                        Identifier(self.tableName(exchange, base, quote, minuteInterval))), (timestamp,))
+                    result = cursor.fetchall()
+                    connection.commit()
+                    assert len(result) < 2 # Result should be unique
+                    return result[0][1:6] if result else None
+            except psycopg2.Error as err:
+                connection.rollback()
+                print("Error occured while getting single OHLCV: <%s> // query: <%s>" % (err, cursor.query))
+                return None
 
     def getMultiOHLCV(self, exchange: str, base: str, quote: str, minuteInterval: int,
                       startTime: datetime, endTime = datetime):
@@ -234,17 +329,57 @@ class PriceBaseSync(AbstractConnection):
         self.raiseIfNotSupported(exchange, base, quote, minuteInterval) # Data table should be available
 
         # Try selection
-        try:
-            with self.connection.cursor() as cursor:
-                cursor.execute(SQL('SELECT * FROM {} WHERE timestamp BETWEEN %s AND %s ORDER BY timestamp ASC;').format(
-                    Identifier(PriceBaseSync.tableName(exchange, base, quote, minuteInterval))), (startTime, endTime))
-                self.connection.commit()
-                result = {timestamp: (O, H, L, C, V) for (timestamp, O, H, L, C, V) in cursor}
-                return result
-        except psycopg2.Error as err:
-            self.connection.rollback()
-            print("Error occured in getBetweenTimestamps: <%s> // query: <%s>" % (err, cursor.query))
-            return {}
+        with self.borrowConnection() as connection:
+            try:
+                with connection.cursor() as cursor:
+                    cursor.execute(SQL('SELECT * FROM {} WHERE timestamp BETWEEN %s AND %s ORDER BY timestamp ASC;').format(
+                        Identifier(PriceBaseSync.tableName(exchange, base, quote, minuteInterval))), (startTime, endTime))
+                    connection.commit()
+                    result = {timestamp: (O, H, L, C, V) for (timestamp, O, H, L, C, V) in cursor}
+                    return result
+            except psycopg2.Error as err:
+                connection.rollback()
+                print("Error occured in getBetweenTimestamps: <%s> // query: <%s>" % (err, cursor.query))
+                return {}
+
+    def iterMultiOHLCV(self, exchange: str, base: str, quote: str, minuteInterval: int,
+                       startTime: datetime, endTime: datetime, batchSize: int = 10000, itersize: int = None):
+        """
+        <method PriceBaseSync.iterMultiOHLCV>
+        Streaming version of PriceBaseSync.getMultiOHLCV. Rows are read through named(server-side) cursor,
+        so only a few batches are kept in client memory no matter how long the range is.
+        The cursor lives on its own connection from PriceBaseSync.dedicatedConnection, so commits of other methods
+        during iteration don't close it.
+        :param batchSize: Number of rows in each yielded batch.
+        :param itersize: Number of rows fetched from server per round-trip. Default to batchSize.
+        :return: Generator of batches [(timestamp, (O, H, L, C, V)), ...] in timestamp order.
+        :raise psycopg2.Error: If the query fails while streaming; Batches yielded before it don't cover the whole range.
+        """
+
+        # Validity checking
+        self.raiseIfNotSupported(exchange, base, quote, minuteInterval) # Data table should be available
+        if not isinstance(batchSize, int) or batchSize <= 0: raise cerr.InvalidError("Invalid batchSize(%s) given" % (batchSize,))
+
+        # Try selection; Server-side cursor lives until the transaction ends
+        with self.dedicatedConnection() as connection:
+            cursor = None
+            try:
+                with connection.cursor(name = "PriceBaseSync_stream_%d" % (next(PriceBaseSync._cursorNumbers),)) as cursor:
+                    cursor.itersize = itersize if itersize else batchSize
+                    cursor.execute(SQL('SELECT * FROM {} WHERE timestamp BETWEEN %s AND %s ORDER BY timestamp ASC;').format(
+                        Identifier(PriceBaseSync.tableName(exchange, base, quote, minuteInterval))), (startTime, endTime))
+                    batch = []
+                    for timestamp, O, H, L, C, V in cursor:
+                        batch.append((timestamp, (O, H, L, C, V)))
+                        if len(batch) >= batchSize:
+                            yield batch
+                            batch = []
+                    if batch: yield batch
+            except psycopg2.Error as err: # Never end the stream normally with partial result
+                print("Error occured in iterMultiOHLCV: <%s> // query: <%s>" % (err, cursor.query if cursor else None))
+                raise
+            finally: # Nothing was written, so just end the transaction; Done before the error reaches the caller
+                connection.rollback()
 
     # ------------------------------------------------------------------------------------------------------------------
     # Insert or Update OHLCV data
@@ -265,83 +400,214 @@ class PriceBaseSync(AbstractConnection):
 
         # Try insertion
         tableName = self.tableName(exchange, base, quote, minuteInterval)
-        try:
-            with self.connection.cursor() as cursor:
-                if override:
-                    cursor.execute(SQL("""
-                        INSERT INTO {} ("timestamp", "open", "high", "low", "close", "volume")
-                        VALUES (%s, %s, %s, %s, %s, %s) ON CONFLICT ("timestamp")
-                        DO UPDATE SET ("open", "high", "low", "close", "volume") = 
-                        (EXCLUDED."open", EXCLUDED."high", EXCLUDED."low", EXCLUDED."close", EXCLUDED."volume");
-                    """).format(Identifier(tableName)), (timestamp, O, H, L, C, V))
-                else:
-                    cursor.execute(SQL("""
-                        INSERT INTO {} ("timestamp", "open", "high", "low", "close", "volume")
-                        VALUES (%s, %s, %s, %s, %s, %s) ON CONFLICT DO NOTHING;
-                    """).format(Identifier(tableName)), (timestamp, O, H, L, C, V))
-                self.connection.commit()
-            return True
-        except psycopg2.Error as err: # If error occured then rollback
-            if showDetailedProgress:
-                print("psycopg2.Error <%s> raised while inserting single row in PriceBaseSync.addSingleOHLCV (query = %s)" %
-                      (err, str(cursor.query)))
-            self.connection.rollback()
-            return False
-
-    def fastCopyOHLCV(self, exchange: str, base: str, quote: str, minuteInterval: int, filename: str,
+        with self.borrowConnection() as connection:
+            try:
+                with connection.cursor() as cursor:
+                    if override:
+                        cursor.execute(SQL("""
+                            INSERT INTO {} ("timestamp", "open", "high", "low", "close", "volume")
+                            VALUES (%s, %s, %s, %s, %s, %s) ON CONFLICT ("timestamp")
+                            DO UPDATE SET ("open", "high", "low", "close", "volume") = 
+                            (EXCLUDED."open", EXCLUDED."high", EXCLUDED."low", EXCLUDED."close", EXCLUDED."volume");
+                        """).format(Identifier(tableName)), (timestamp, O, H, L, C, V))
+                    else:
+                        cursor.execute(SQL("""
+                            INSERT INTO {} ("timestamp", "open", "high", "low", "close", "volume")
+                            VALUES (%s, %s, %s, %s, %s, %s) ON CONFLICT DO NOTHING;
+                        """).format(Identifier(tableName)), (timestamp, O, H, L, C, V))
+                    connection.commit()
+                return True
+            except psycopg2.Error as err: # If error occured then rollback
+                if showDetailedProgress:
+                    print("psycopg2.Error <%s> raised while inserting single row in PriceBaseSync.addSingleOHLCV (query = %s)" %
+                          (err, str(cursor.query)))
+                connection.rollback()
+                return False
+
+    def addManyOHLCV(self, exchange: str, base: str, quote: str, minuteInterval: int, rows,
+                     override: bool = True, batchSize: int = 1000, showDetailedProgress: bool = False) -> list:
+        """
+        <method PriceBaseSync.addManyOHLCV>
+        Insert or update many (timestamp, O, H, L, C, V) rows into database.
+        Each batch is sent by single multi-row INSERT query and committed once.
+        If the same timestamp appears several times in a batch, the last row is used when override is True,
+        otherwise the first row is used, same as rows already stored are kept.
+        :return: List of (inserted, updated, skipped) counts per batch. Skipped rows are not written,
+            either by conflict without override or by duplicated timestamp in the batch.
+            Failed batch is rolled back and reported as None.
+        """
+
+        # Validity checking
+        self.raiseIfNotSupported(exchange, base, quote, minuteInterval) # Data table should be available
+        if not isinstance(batchSize, int) or batchSize <= 0: raise cerr.InvalidError("Invalid batchSize(%s) given" % (batchSize,))
+        rows = list(rows)
+        for row in rows:
+            if row[0].timestamp() % (minuteInterval * 60) != 0: # Timestamp should be divisible by minute interval
+                raise cerr.InvalidError("Given timestamp(%s) is not fit to given interval(%d minutes)" % (row[0], minuteInterval))
+
+        # Build query; (xmax = 0) is true only for newly inserted rows
+        tableName = self.tableName(exchange, base, quote, minuteInterval)
+        if override: conflictAction = SQL("""DO UPDATE SET ("open", "high", "low", "close", "volume") =
+            (EXCLUDED."open", EXCLUDED."high", EXCLUDED."low", EXCLUDED."close", EXCLUDED."volume")""")
+        else: conflictAction = SQL("DO NOTHING")
+        query = SQL("""
+            INSERT INTO {} ("timestamp", "open", "high", "low", "close", "volume") VALUES %s
+            ON CONFLICT ("timestamp") {} RETURNING (xmax = 0);""").format(Identifier(tableName), conflictAction)
+
+        # Try insertion per batch
+        results = []
+        with self.borrowConnection() as connection:
+            for begin in range(0, len(rows), batchSize):
+                chunk, batch = rows[begin:begin + batchSize], {}
+                for row in chunk:
+                    if override or row[0] not in batch: batch[row[0]] = tuple(row[:6])
+                batch = list(batch.values())
+                try:
+                    with connection.cursor() as cursor:
+                        returned = execute_values(cursor, query, batch, page_size = len(batch), fetch = True)
+                    connection.commit()
+                    inserted = sum(1 for (isInserted,) in returned if isInserted)
+                    results.append((inserted, len(returned) - inserted, len(chunk) - len(returned)))
+                except psycopg2.Error as err: # If error occured then rollback this batch
+                    if showDetailedProgress:
+                        print("psycopg2.Error <%s> raised while inserting rows in PriceBaseSync.addManyOHLCV (query = %s)" %
+                              (err, str(cursor.query)))
+                    connection.rollback()
+                    results.append(None)
+        return results
+
+    @staticmethod
+    def _copyLine(row, separate: str):
+        """
+        <static method PriceBaseSync._copyLine>
+        :return: Given line or row encoded as single COPY text line. None for blank line.
+            None values of row are written as NULL(\\N).
+        """
+        if isinstance(row, bytes): line = row
+        elif isinstance(row, str): line = row.encode()
+        else: line = separate.join("\\N" if value is None else str(value) for value in row).encode()
+        line = line.rstrip(b"\r\n")
+        return line + b"\n" if line.strip() else None
+
+    def fastCopyOHLCV(self, exchange: str, base: str, quote: str, minuteInterval: int, source,
                       separate: str = ",", tempTableName: str = "PriceDataTemp",
-                      override: bool = True, showDetailedProgress: bool = True) -> bool:
+                      override: bool = True, showDetailedProgress: bool = True,
+                      chunkRows: int = 100000, progress = None, resumeFile: str = None) -> bool:
         """
         <method PriceBaseSync.fastCopyOHLCV>
-        Fast bulk insertion using COPY query with given file. The given file should matches like csv, described below:
+        Fast bulk insertion using COPY query with given source. Each row should matches like csv, described below:
             <timestamp> <sep> <open> <sep> <high> <sep> <low> <sep> <close> <sep> <volume> [\n ... (repeat)]
+        Rows are copied into session-private temporary table and moved to target table chunk by chunk,
+        and each chunk is committed separately. So concurrent callers don't interfere with each other,
+        and interrupted import can be continued by giving same resumeFile again.
+        :param source: File name, file-like object(text or binary), or iterable of lines or (timestamp, O, H, L, C, V) rows.
+        :param chunkRows: Number of rows committed at once.
+        :param progress: Callback called as progress(committed rows, resume offset) after each chunk.
+            Resume offset is position in source if it's seekable file, otherwise None.
+        :param resumeFile: If given, position of last committed chunk is saved in this file, and skipped on next call.
+            Target table and source(path and size, if known) are saved together, and resuming with different ones
+            raises cerr.InvalidValueError. The file is removed after successful completion.
         :return: If the query was successful.
         """
 
         # Validity checking
         self.raiseIfNotSupported(exchange, base, quote, minuteInterval)  # Data table should be available
-
-        # Try copy
+        if not isinstance(chunkRows, int) or chunkRows <= 0: raise cerr.InvalidError("Invalid chunkRows(%s) given" % (chunkRows,))
         tableName = self.tableName(exchange, base, quote, minuteInterval)
-        with self.connection.cursor() as cursor, open(filename) as datafile:
-            try:
-                if showDetailedProgress:
-                    print("Fast copying %s into (%s, %s, %s, %d)" % (filename, exchange, base, quote, minuteInterval))
-                # 1. Create temporary table
-                cursor.execute(SQL("CREATE TABLE IF NOT EXISTS {0} (LIKE {1});").format(Identifier(tempTableName), Identifier(tableName)))
-                if showDetailedProgress: print("Temp table created(or already exist)")
-                # 2. Delete all rows from temp table using truncate
-                cursor.execute(SQL("TRUNCATE {}").format(Identifier(tempTableName)))
-                if showDetailedProgress: print("Truncated temp table")
-                # 3. Copy
-                cursor.copy_expert(SQL("COPY {0} FROM STDIN (DELIMITER {1})").format(Identifier(tempTableName), Literal(separate)), datafile)
-                if showDetailedProgress: print("Copied original data to temp table")
-                # 4. Move all data from PriceDataTemp to target table
-                if override:
-                    cursor.execute(SQL("""
+        tempTable = Identifier("pg_temp", tempTableName)
+
+        # Prepare source
+        closeSource = isinstance(source, str)
+        if closeSource: source = open(source, "rb")
+        try:
+
+            # Load saved position; It's valid only for same target and source
+            identity = {"table": tableName, "source": None, "size": None}
+            if isinstance(getattr(source, "name", None), str): identity["source"] = os.path.abspath(source.name)
+            if hasattr(source, "fileno"):
+                try: identity["size"] = os.fstat(source.fileno()).st_size
+                except (OSError, ValueError, io.UnsupportedOperation): pass
+            committedRows, offset = 0, None
+            if resumeFile and os.path.exists(resumeFile):
+                with open(resumeFile) as savedFile: saved = json.load(savedFile)
+                for key in identity:
+                    if saved.get(key) != identity[key]:
+                        raise cerr.InvalidValueError("Resume file %s was saved with %s %s, but %s given" %
+                                                     (resumeFile, key, saved.get(key), identity[key]))
+                committedRows, offset = saved["rows"], saved["offset"]
+
+            # Seek to saved offset if possible, otherwise skip committed rows
+            seekable = hasattr(source, "readline") and hasattr(source, "seekable") and source.seekable()
+            if hasattr(source, "readline"): lines = iter(source.readline, source.read(0))
+            else: lines = iter(source)
+            if seekable and offset is not None: source.seek(offset)
+            else:
+                skipped = 0
+                while skipped < committedRows:
+                    row = next(lines, None)
+                    if row is None: break
+                    elif PriceBaseSync._copyLine(row, separate) is not None: skipped += 1
+
+            # Try copy
+            with self.borrowConnection() as connection, connection.cursor() as cursor:
+                try:
+                    if showDetailedProgress:
+                        print("Fast copying into (%s, %s, %s, %d) from row %d" % (exchange, base, quote, minuteInterval, committedRows))
+
+                    # 1. Create temporary table, which is emptied on each commit
+                    cursor.execute(SQL("DROP TABLE IF EXISTS {0}; CREATE TEMPORARY TABLE {0} (LIKE {1}) ON COMMIT DELETE ROWS;")
+                                   .format(tempTable, Identifier(tableName)))
+                    connection.commit()
+                    copyQuery = SQL("COPY {0} FROM STDIN (DELIMITER {1})").format(tempTable, Literal(separate))
+                    if override: moveQuery = SQL("""
                         INSERT INTO {0} (SELECT * FROM {1}) ON CONFLICT ("timestamp")
                         DO UPDATE SET   ("open", "high", "low", "close", "volume") = 
                         (EXCLUDED."open", EXCLUDED."high", EXCLUDED."low", EXCLUDED."close", EXCLUDED."volume");
-                    """).format(Identifier(tableName), Identifier(tempTableName)))
-                    if showDetailedProgress: print("Moved data to actual table with conflict override action")
-                else:
-                    cursor.execute(SQL("INSERT INTO {0} (SELECT * FROM {1}) ON CONFLICT (\"timestamp\") DO NOTHING;").format(
-                        Identifier(tableName), Identifier(tempTableName)))
-                    if showDetailedProgress: print("Moved data to actual table without conflict override action")
-                # 5. Drop
-                cursor.execute(SQL("DROP TABLE {};").format(Identifier(tempTableName)))
-                if showDetailedProgress: print("Dropped temp table")
-            except psycopg2.Error as err:
-                self.connection.rollback()
-                if showDetailedProgress: print("psycopg2.Error <%s> occured while doing query <%s>" % (err, str(cursor.query)))
-                return False
-            else: self.connection.commit()
+                    """).format(Identifier(tableName), tempTable)
+                    else: moveQuery = SQL("INSERT INTO {0} (SELECT * FROM {1}) ON CONFLICT (\"timestamp\") DO NOTHING;").format(
+                        Identifier(tableName), tempTable)
+
+                    # 2. Copy and move chunk by chunk
+                    while True:
+                        chunk, chunkSize = io.BytesIO(), 0
+                        for row in lines:
+                            line = PriceBaseSync._copyLine(row, separate)
+                            if line is None: continue
+                            chunk.write(line)
+                            chunkSize += 1
+                            if chunkSize >= chunkRows: break
+                        if not chunkSize: break
+                        chunk.seek(0)
+                        cursor.copy_expert(copyQuery, chunk)
+                        cursor.execute(moveQuery)
+                        connection.commit()
+                        committedRows += chunkSize
+                        offset = source.tell() if seekable else None
+                        if resumeFile:
+                            with open(resumeFile + ".tmp", "w") as savingFile:
+                                json.dump(dict(identity, rows = committedRows, offset = offset), savingFile)
+                            os.replace(resumeFile + ".tmp", resumeFile)
+                        if progress is not None: progress(committedRows, offset)
+                        if showDetailedProgress: print("Committed %d rows" % (committedRows,))
+
+                    # 3. Drop
+                    cursor.execute(SQL("DROP TABLE {};").format(tempTable))
+                    connection.commit()
+                    if showDetailedProgress: print("Dropped temp table")
+                except psycopg2.Error as err:
+                    connection.rollback()
+                    if showDetailedProgress: print("psycopg2.Error <%s> occured while doing query <%s>" % (err, str(cursor.query)))
+                    return False
+        finally:
+            if closeSource: source.close()
+
+        if resumeFile and os.path.exists(resumeFile): os.remove(resumeFile)
         return True
 
 # ----------------------------------------------------------------------------------------------------------------------
 # Extra
 
-def openFromFile(filepath, markets = None):
+def openFromFile(filepath, markets = None, poolSize: int = None):
     """
     <function openFromFile>
     Get (username, password, host, port, dbname) from given file. This file should have syntax with
@@ -358,7 +624,37 @@ def openFromFile(filepath, markets = None):
         if not port or not port.isdigit(): port = PriceBaseSync.defaultPortNumber
         else: port = int(port)
         if not dbname: dbname = PriceBaseSync.defaultDBname
-    return PriceBaseSync(username, password, host = host, port = port, dbname = dbname, additionalMarkets = markets)
+    return PriceBaseSync(username, password, host = host, port = port, dbname = dbname, additionalMarkets = markets,
+                         poolSize = poolSize)
+
+def benchmarkFastCopyOHLCV(PDB: PriceBaseSync, exchange: str, base: str, quote: str, minuteInterval: int,
+                           filenames: list, threadCounts = (1, 4, 8)) -> dict:
+    """
+    <function benchmarkFastCopyOHLCV>
+    Measure PriceBaseSync.fastCopyOHLCV throughput for each number of threads. Each file is copied by one call,
+    and calls are distributed to threads. PDB should be in pooled mode with poolSize >= max(threadCounts).
+    Note that target table is upserted several times by same data.
+    No reference numbers are recorded here; Scaling depends on the server(cores, disks, WAL settings), so measure there.
+    :return: {thread count: rows per second, ...}
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from utility import TimeMeasure
+
+    totalRows = 0
+    for filename in filenames:
+        with open(filename) as datafile: totalRows += sum(1 for line in datafile if line.strip())
+    result = {}
+    for threadCount in threadCounts:
+        measure = TimeMeasure()
+        with ThreadPoolExecutor(max_workers = threadCount) as executor:
+            succeeded = list(executor.map(
+                lambda filename: PDB.fastCopyOHLCV(exchange, base, quote, minuteInterval, filename,
+                                                   showDetailedProgress = False), filenames))
+        usedTime = measure.update()
+        if not all(succeeded): print("[Warning] Some copies failed with %d threads" % (threadCount,))
+        result[threadCount] = totalRows / usedTime
+        print("%d threads: %d rows in %.3f sec (%.1f rows/sec)" % (threadCount, totalRows, usedTime, result[threadCount]))
+    return result
 
 # ----------------------------------------------------------------------------------------------------------------------
 # Testing
@@ -389,6 +685,12 @@ if __name__ == "__main__":
        print("%s -> %s / %s / %s / %s / %s" % (timestamp, o, h, l, c, v))
     '''
 
+    # Multi-threaded fast copy benchmark
+    '''
+    PDB = openFromFile("awsdb.authkey", poolSize = 8)
+    benchmarkFastCopyOHLCV(PDB, "Bitflyer", "USD", "BTC", 1, ["copy_test_%d.csv" % (i,) for i in range(16)])
+    '''
+
     # CSV copyfile format test
     '''
     data = PDB.getBetweenTimestamps("Bitflyer", "USD", "BTC", 1, datetime.min, datetime.max)
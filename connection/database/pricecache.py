@@ -0,0 +1,276 @@
+"""
+<module AutoTrade.database.pricecache>
+Local memory-mapped columnar cache of PriceBase OHLCV data, mainly for backtests.
+"""
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Libraries
+
+# Standard libraries
+import os
+import mmap
+import struct
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta, timezone
+
+# External libraries
+
+# Custom libraries
+from .pricebase_async import PriceBaseClass, _awareUTC
+import connection.errors as cerr
+
+# ----------------------------------------------------------------------------------------------------------------------
+# File layout
+#   Header (64 bytes): magic(8s), version(q), interval seconds(q), row count(q), capacity(q), padding
+#   Columns: timestamp(int64 epoch seconds) * capacity, then open, high, low, close, volume(float64) * capacity each.
+# Row count is written after column data, so readers always see fully written prefix of rows.
+
+_magic = b"ATPCACHE"
+_version = 1
+_headerFormat = "<8sqqqq"
+_headerSize = 64
+_rowCountOffset = struct.calcsize("<8sqq")
+_columnNames = ("timestamps", "opens", "highs", "lows", "closes", "volumes")
+_initialCapacity = 1 << 12
+
+def _columnOffset(columnIndex: int, capacity: int) -> int: return _headerSize + 8 * capacity * columnIndex
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Reader
+
+class CachedSeries:
+    """
+    <class CachedSeries>
+    Read-only memory-mapped view of single cache file.
+    Columns(timestamps, opens, highs, lows, closes, volumes) are exposed as memoryview without copying,
+    so many processes can read same file at once while sharing page cache.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.__file, self.__mmap = None, None
+        self.refresh()
+
+    def __enter__(self): return self
+    def __exit__(self, exc_type, exc_val, exc_tb): self.close()
+    def __len__(self): return self.rowCount
+
+    def close(self):
+        """
+        <method CachedSeries.close>
+        Release memory map and file. Memoryviews taken from this object are released too.
+        """
+        for columnName in _columnNames:
+            column = getattr(self, columnName, None)
+            if column is not None: column.release()
+            setattr(self, columnName, None)
+        if self.__mmap is not None: self.__mmap.close()
+        if self.__file is not None: self.__file.close()
+        self.__file, self.__mmap = None, None
+
+    def refresh(self):
+        """
+        <method CachedSeries.refresh>
+        Catch up rows appended after opening. Remap if the file was replaced due to growth.
+        """
+        if self.__file is not None and os.stat(self.path).st_ino == os.fstat(self.__file.fileno()).st_ino:
+            self.rowCount = struct.unpack_from("<q", self.__mmap, _rowCountOffset)[0]
+        else:
+            self.close()
+            self.__file = open(self.path, "rb")
+            self.__mmap = mmap.mmap(self.__file.fileno(), 0, access = mmap.ACCESS_READ)
+            magic, version, intervalSeconds, self.rowCount, capacity = struct.unpack_from(_headerFormat, self.__mmap)
+            if magic != _magic or version != _version:
+                self.close()
+                raise cerr.InvalidValueError("Given file(%s) is not a valid price cache" % (self.path,))
+            self.interval = timedelta(seconds = intervalSeconds)
+            view = memoryview(self.__mmap)
+            for columnIndex, columnName in enumerate(_columnNames):
+                offset = _columnOffset(columnIndex, capacity)
+                setattr(self, columnName, view[offset:offset + 8 * capacity].cast("q" if columnIndex == 0 else "d"))
+            view.release()
+        return self
+
+    def lastTimestamp(self):
+        """
+        <method CachedSeries.lastTimestamp>
+        :return: Epoch seconds of last row, None if there is no row.
+        """
+        return self.timestamps[self.rowCount - 1] if self.rowCount else None
+
+    def indexRange(self, beginTime: datetime, endTime: datetime) -> range:
+        """
+        <method CachedSeries.indexRange>
+        :return: Range of row indices whose timestamps are between given timestamps(inclusive), found by binary search.
+        """
+        return range(bisect_left(self.timestamps, round(beginTime.timestamp()), 0, self.rowCount),
+                     bisect_right(self.timestamps, round(endTime.timestamp()), 0, self.rowCount))
+
+    def row(self, index: int) -> tuple:
+        """
+        <method CachedSeries.row>
+        :return: (timestamp in epoch seconds, open, high, low, close, volume) of given row index.
+        """
+        if not -self.rowCount <= index < self.rowCount: raise IndexError("Row index %d out of range" % (index,))
+        index %= self.rowCount
+        return tuple(getattr(self, columnName)[index] for columnName in _columnNames)
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Cache directory
+
+class PriceCache:
+    """
+    <class PriceCache>
+    On-disk columnar cache of PriceBase OHLCV data. One file per market and interval.
+    Files are only appended by single writer process, and read by CachedSeries from any number of processes.
+    Note that prices are stored as float64, and rows overridden in database after being cached are not updated.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok = True)
+
+    def path(self, exchange: str, base: str, quote: str, interval: timedelta) -> str:
+        """
+        <method PriceCache.path>
+        :return: Cache file path of given market and interval.
+        """
+        interval = PriceBaseClass.interval(interval)
+        if interval == PriceBaseClass.tickInterval: raise cerr.InvalidValueError("Tick data can't be cached")
+        return os.path.join(self.directory, PriceBaseClass.tableName(exchange, base, quote, interval) + ".cache")
+
+    def open(self, exchange: str, base: str, quote: str, interval: timedelta) -> CachedSeries:
+        """
+        <method PriceCache.open>
+        :return: CachedSeries of given market and interval. Empty file is created if not exists.
+        """
+        path = self.path(exchange, base, quote, interval)
+        if not os.path.exists(path): self.__create(path, PriceBaseClass.interval(interval), _initialCapacity)
+        return CachedSeries(path)
+
+    @staticmethod
+    def __create(path: str, interval: timedelta, capacity: int, source: CachedSeries = None):
+        """
+        <static method PriceCache.__create>
+        Create new cache file with given capacity atomically, copying rows of source if given.
+        """
+        rowCount = source.rowCount if source is not None else 0
+        temporaryPath = "%s.%d.tmp" % (path, os.getpid())
+        with open(temporaryPath, "wb") as file:
+            file.truncate(_columnOffset(len(_columnNames), capacity))
+            file.write(struct.pack(_headerFormat, _magic, _version, round(interval.total_seconds()), rowCount, capacity))
+            for columnIndex, columnName in enumerate(_columnNames):
+                if rowCount:
+                    file.seek(_columnOffset(columnIndex, capacity))
+                    file.write(getattr(source, columnName)[:rowCount])
+        os.replace(temporaryPath, path)
+
+    def append(self, exchange: str, base: str, quote: str, interval: timedelta, rows) -> int:
+        """
+        <method PriceCache.append>
+        Append rows newer than last cached row. Older or duplicated rows are ignored.
+        :param rows: Iterable of (timestamp, O, H, L, C, V) ordered by timestamp.
+        :return: Number of appended rows.
+        """
+
+        # Collect new rows as columns
+        path = self.path(exchange, base, quote, interval)
+        with self.open(exchange, base, quote, interval) as series:
+            last = series.lastTimestamp()
+            columns = [array("q")] + [array("d") for _ in _columnNames[1:]]
+            for timestamp, *ohlcv in rows:
+                epoch = round(timestamp.timestamp())
+                if last is not None and epoch <= last: continue
+                columns[0].append(epoch)
+                for column, value in zip(columns[1:], ohlcv): column.append(float(value))
+                last = epoch
+            newRows = len(columns[0])
+            if not newRows: return 0
+
+            # Grow file if needed
+            rowCount, capacity = series.rowCount, len(series.timestamps)
+            if rowCount + newRows > capacity:
+                while rowCount + newRows > capacity: capacity *= 2
+                PriceCache.__create(path, series.interval, capacity, series)
+
+        # Write columns first, then row count
+        with open(path, "r+b") as file, mmap.mmap(file.fileno(), 0) as target:
+            for columnIndex, column in enumerate(columns):
+                offset = _columnOffset(columnIndex, capacity) + 8 * rowCount
+                target[offset:offset + 8 * newRows] = column.tobytes()
+            struct.pack_into("<q", target, _rowCountOffset, rowCount + newRows)
+            target.flush()
+        return newRows
+
+    async def update(self, pricebase: PriceBaseClass, exchange: str, base: str, quote: str, interval: timedelta,
+                     beginTime: datetime = None, chunk: timedelta = timedelta(days = 7)) -> int:
+        """
+        <async method PriceCache.update>
+        Populate or refresh cache of given market from PriceBaseClass, fetching only rows after the last cached row.
+        :param beginTime: Start point used when the cache is empty. Default to the first row stored in database.
+        :param chunk: Time range fetched per query.
+        :return: Number of appended rows.
+        """
+        interval = PriceBaseClass.interval(interval)
+        with self.open(exchange, base, quote, interval) as series: last = series.lastTimestamp()
+        if last is not None: beginTime = datetime.fromtimestamp(last, timezone.utc) + interval
+        elif beginTime is None:
+            beginTime = await pricebase.firstTimestamp(exchange, base, quote, interval)
+            if beginTime is None: return 0 # Nothing stored
+        beginTime = _awareUTC(beginTime)
+        endTime = datetime.now(timezone.utc)
+
+        # Chunks share their boundaries; Rows at a boundary are fetched twice but appended once
+        appended = 0
+        while beginTime <= endTime:
+            chunkEnd = min(beginTime + chunk, endTime)
+            data = await pricebase.select(exchange, base, quote, interval, beginTime, chunkEnd)
+            appended += self.append(exchange, base, quote, interval,
+                                    ((timestamp, *data[timestamp]) for timestamp in sorted(data)))
+            if chunkEnd >= endTime: break
+            beginTime = chunkEnd
+        return appended
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Functionality Testing
+
+if __name__ == "__main__":
+
+    import asyncio
+    import shutil
+    import tempfile
+
+    directory = tempfile.mkdtemp()
+    try:
+        cache = PriceCache(directory)
+        begin = datetime(2019, 6, 1, tzinfo = timezone.utc)
+        minute = timedelta(minutes = 1)
+        rows = [(begin + minute * index, index, index + 1, index - 1, index + 0.5, 10.0) for index in range(5000)]
+
+        # Round trip with growth over initial capacity; Reader opened before growth catches up by refresh
+        reader = cache.open("Upbit", "KRW", "BTC", minute)
+        assert cache.append("Upbit", "KRW", "BTC", minute, rows[:100]) == 100
+        assert len(reader.refresh()) == 100
+        assert cache.append("Upbit", "KRW", "BTC", minute, rows[50:]) == 4900 # Rows up to cached ones are ignored
+        assert len(reader.refresh()) == 5000 and len(reader.timestamps) == 2 * _initialCapacity
+        assert reader.row(4999) == (round(rows[-1][0].timestamp()), *map(float, rows[-1][1:]))
+        assert reader.indexRange(begin + minute * 10, begin + minute * 19) == range(10, 20)
+        reader.close()
+
+        # Update from database fetches only rows after the last cached one, without skipping chunk boundaries
+        class FakePriceBase:
+            def __init__(self, rows): self.rows, self.queries = rows, 0
+            async def firstTimestamp(self, exchange, base, quote, interval, timeout = None): return self.rows[0][0]
+            async def select(self, exchange, base, quote, interval, beginTime, endTime):
+                self.queries += 1
+                return {row[0]: row[1:] for row in self.rows if beginTime <= row[0] <= endTime}
+        storedRows = [(begin + timedelta(hours = index), index, index, index, index, 1.0) for index in range(100)]
+        pricebase = FakePriceBase(storedRows)
+        assert asyncio.run(cache.update(pricebase, "Upbit", "KRW", "ETH", timedelta(hours = 1),
+                                        chunk = timedelta(hours = 10))) == 100
+        assert asyncio.run(cache.update(pricebase, "Upbit", "KRW", "ETH", timedelta(hours = 1))) == 0
+        with cache.open("Upbit", "KRW", "ETH", timedelta(hours = 1)) as series:
+            assert [series.row(index)[1] for index in range(len(series))] == list(range(100))
+        print("All checks passed")
+    finally: shutil.rmtree(directory)
@@ -61,6 +61,15 @@ class MarketNotSupported(AutoTradeConnectionError):
     def __init__(self, exchange: str, base: str, quote: str):
         super().__init__("Market (%s, %s <-> %s) not supported" % (exchange, base, quote))
 
+class SequenceGapError(AutoTradeConnectionError):
+    """
+    <class SequenceGapError> inherited from AutoTradeConnectionError
+    Used when some updates of sequenced stream are missing.
+    """
+    def __init__(self, expected: int, given: int):
+        super().__init__("Sequence gap detected; Expected %s but %s given" % (expected, given))
+        self.expected, self.given = expected, given
+
 # ----------------------------------------------------------------------------------------------------------------------
 # __all__
 
@@ -0,0 +1,281 @@
+"""
+<module AutoTrade.connection.local_orderbook>
+Local orderbooks maintained by applying sequenced delta updates on top of snapshot.
+Feed sources are pluggable; ReplayFeed reads recorded JSON lines so it can stand in for exchange stream.
+"""
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Libraries
+
+# Standard libraries
+import asyncio
+import json
+
+# External libraries
+
+# Custom libraries
+from connection.orderbook import ArrayOrderbook
+import connection.errors as cerr
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Feed sources
+#   Snapshot: {"sequence": n, "asks": [[price, amount], ..], "bids": [[price, amount], ..], "timestamp": ms}
+#   Delta: {"firstSequence": U, "sequence": u, "asks": [[price, amount], ..], "bids": [..], "timestamp": ms}
+#       Delta covers updates from U to u inclusive, and zero amount removes the level.
+#       "firstSequence" can be omitted if each delta has single sequence number.
+#   Prices and amounts follow market orientation of the orderbook, same as CCXTConnection.fetchOrderbook.
+
+class OrderbookFeed:
+    """
+    <class OrderbookFeed>
+    Abstract source of orderbook snapshots and delta streams.
+    """
+
+    async def snapshot(self, exchange: str, base: str, quote: str) -> dict:
+        """
+        <async method OrderbookFeed.snapshot>
+        :return: Snapshot of given market, taken at or after the moment of call.
+        """
+        raise NotImplementedError
+
+    def deltas(self, exchange: str, base: str, quote: str):
+        """
+        <method OrderbookFeed.deltas>
+        :return: Async iterator of deltas of given market from now on. Iteration ends if the stream is closed.
+        """
+        raise NotImplementedError
+
+class ReplayFeed(OrderbookFeed):
+    """
+    <class ReplayFeed> inherited from OrderbookFeed
+    Replay recorded snapshots and deltas from JSON lines file, one record per line like
+        {"type": "snapshot" or "delta", "exchange": ~, "base": ~, "quote": ~, <snapshot or delta fields>}
+    Deltas of each market are replayed in recorded order, and snapshot() returns the earliest recorded snapshot
+    covering all deltas delivered so far, like real exchange whose snapshot is taken after stream is opened.
+    """
+
+    def __init__(self, path: str, interval: float = 0.0):
+        """
+        <method ReplayFeed.__init__>
+        :param interval: Seconds to sleep between replayed deltas.
+        """
+        self.path = path
+        self.interval = interval
+        self.records = {} # {(exchange, base, quote): [record, ..]}
+        with open(path) as replayFile:
+            for line in replayFile:
+                if not line.strip(): continue
+                record = json.loads(line)
+                self.records.setdefault((record["exchange"], record["base"], record["quote"]), []).append(record)
+        self.positions = {market: 0 for market in self.records} # {market: Index of next record}
+        self.delivered = {} # {market: Last delivered delta's sequence}
+
+    async def snapshot(self, exchange: str, base: str, quote: str) -> dict:
+        market = (exchange, base, quote)
+        snapshots = [record for record in self.records.get(market, []) if record["type"] == "snapshot"]
+        if not snapshots: raise cerr.MarketNotSupported(exchange, base, quote)
+        delivered = self.delivered.get(market)
+        covering = [record for record in snapshots if delivered is None or record["sequence"] >= delivered]
+        return min(covering, key = lambda record: record["sequence"]) if covering else \
+            max(snapshots, key = lambda record: record["sequence"])
+
+    async def deltas(self, exchange: str, base: str, quote: str):
+        market = (exchange, base, quote)
+        records = self.records.get(market, [])
+        while self.positions.get(market, 0) < len(records):
+            record = records[self.positions[market]]
+            self.positions[market] += 1
+            if record["type"] == "delta":
+                self.delivered[market] = record["sequence"]
+                yield record
+                await asyncio.sleep(self.interval)
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Local orderbook
+
+class LocalOrderbook:
+    """
+    <class LocalOrderbook>
+    Single market's orderbook kept up to date from OrderbookFeed.
+    self.book is mutated in place, so readers can hold it without copying; It is consistent between awaits.
+    """
+
+    def __init__(self, feed: OrderbookFeed, exchange: str, base: str, quote: str, onUpdate = None):
+        """
+        <method LocalOrderbook.__init__>
+        :param onUpdate: Called with this object after snapshot or each delta is applied.
+        """
+        self.feed = feed
+        self.exchange, self.base, self.quote = exchange, base, quote
+        self.onUpdate = onUpdate
+        self.book = ArrayOrderbook()
+        self.sequence = None # Last applied sequence number
+        self.synced = asyncio.Event()
+        self.resyncCount = 0
+
+    def __apply(self, update: dict):
+        """
+        <method LocalOrderbook.__apply>
+        Apply levels of given snapshot or delta to self.book.
+        """
+        for side in ArrayOrderbook.sides:
+            for price, amount, *_ in update[side]: self.book.applyLevel(side, float(price), float(amount))
+        self.book.timestamp = update.get("timestamp", self.book.timestamp)
+        self.book.nonce = self.sequence = update["sequence"]
+        if self.onUpdate is not None: self.onUpdate(self)
+
+    def applySnapshot(self, snapshot: dict):
+        """
+        <method LocalOrderbook.applySnapshot>
+        Replace whole book with given snapshot.
+        """
+        sequence = snapshot.get("sequence", snapshot.get("nonce"))
+        if sequence is None: raise cerr.InvalidValueError("Snapshot without sequence number can't be synchronized")
+        self.book.assign(ArrayOrderbook.fromCCXT(snapshot, assumeSorted = False))
+        self.book.nonce = self.sequence = sequence
+        self.synced.set()
+        if self.onUpdate is not None: self.onUpdate(self)
+
+    def applyDelta(self, delta: dict) -> bool:
+        """
+        <method LocalOrderbook.applyDelta>
+        Apply given delta if it continues current sequence.
+        :return: True if applied, False if ignored since it is already covered by the book.
+        :raise cerr.SequenceGapError: If some updates between current book and given delta are missing.
+        """
+        lastSequence = delta["sequence"]
+        firstSequence = delta.get("firstSequence", lastSequence)
+        if lastSequence <= self.sequence: return False
+        elif firstSequence > self.sequence + 1:
+            self.synced.clear()
+            raise cerr.SequenceGapError(self.sequence + 1, firstSequence)
+        self.__apply(delta)
+        return True
+
+    async def run(self, maxResyncs: int = None):
+        """
+        <async method LocalOrderbook.run>
+        Keep the book synchronized until the feed's delta stream ends.
+        Delta stream is opened before snapshot is requested, and deltas received meanwhile are buffered,
+        so no update is missed between snapshot and stream. Sequence gaps trigger automatic resync.
+        :param maxResyncs: If given, raise cerr.SequenceGapError after this number of resyncs.
+        """
+        while True:
+
+            # Open stream first and buffer deltas while fetching snapshot
+            buffer = asyncio.Queue()
+            async def receive(deltas):
+                try:
+                    async for delta in deltas: await buffer.put(delta)
+                finally: await buffer.put(None)
+            receiver = asyncio.ensure_future(receive(self.feed.deltas(self.exchange, self.base, self.quote)))
+            try:
+                await asyncio.sleep(0) # Let receiver subscribe before snapshot is taken
+                self.applySnapshot(await self.feed.snapshot(self.exchange, self.base, self.quote))
+                while True:
+                    delta = await buffer.get()
+                    if delta is None: break
+                    self.applyDelta(delta)
+                return
+            except cerr.SequenceGapError:
+                self.resyncCount += 1
+                if maxResyncs is not None and self.resyncCount > maxResyncs: raise
+            finally:
+                receiver.cancel()
+                await asyncio.gather(receiver, return_exceptions = True)
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Manager
+
+class LocalOrderbookManager:
+    """
+    <class LocalOrderbookManager>
+    Maintain LocalOrderbooks of many markets from single OrderbookFeed, each in its own task.
+    """
+
+    def __init__(self, feed: OrderbookFeed, onUpdate = None):
+        self.feed = feed
+        self.onUpdate = onUpdate
+        self.orderbooks = {} # {(exchange, base, quote): LocalOrderbook}
+        self.tasks = {} # {(exchange, base, quote): Running task}
+
+    def track(self, exchange: str, base: str, quote: str, maxResyncs: int = None) -> LocalOrderbook:
+        """
+        <method LocalOrderbookManager.track>
+        Start maintaining given market's orderbook if not tracked yet.
+        :return: LocalOrderbook of given market.
+        """
+        market = (exchange, base, quote)
+        if market not in self.orderbooks:
+            self.orderbooks[market] = LocalOrderbook(self.feed, exchange, base, quote, onUpdate = self.onUpdate)
+            self.tasks[market] = asyncio.ensure_future(self.orderbooks[market].run(maxResyncs = maxResyncs))
+        return self.orderbooks[market]
+
+    def get(self, exchange: str, base: str, quote: str) -> ArrayOrderbook:
+        """
+        <method LocalOrderbookManager.get>
+        :return: Current book of given market without copying, None if not synchronized yet.
+        """
+        orderbook = self.orderbooks.get((exchange, base, quote))
+        return orderbook.book if orderbook is not None and orderbook.synced.is_set() else None
+
+    async def waitSynced(self, exchange: str, base: str, quote: str) -> ArrayOrderbook:
+        """
+        <async method LocalOrderbookManager.waitSynced>
+        :return: Book of given market after it is synchronized.
+        """
+        orderbook = self.track(exchange, base, quote)
+        await orderbook.synced.wait()
+        return orderbook.book
+
+    async def untrack(self, exchange: str, base: str, quote: str):
+        """
+        <async method LocalOrderbookManager.untrack>
+        Stop maintaining given market's orderbook.
+        """
+        market = (exchange, base, quote)
+        task = self.tasks.pop(market, None)
+        self.orderbooks.pop(market, None)
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions = True)
+
+    async def close(self):
+        """
+        <async method LocalOrderbookManager.close>
+        Stop all tasks.
+        """
+        for market in list(self.tasks): await self.untrack(*market)
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Functionality Testing
+
+if __name__ == "__main__":
+
+    import os
+    import tempfile
+
+    # Record snapshot, deltas, gap, and second snapshot used for resync
+    market = {"exchange": "Replay", "base": "KRW", "quote": "BTC"}
+    records = [
+        dict(market, type = "snapshot", sequence = 10, asks = [[101, 1], [102, 2]], bids = [[99, 1], [98, 3]]),
+        dict(market, type = "delta", firstSequence = 9, sequence = 10, asks = [[101, 5]], bids = []), # Stale
+        dict(market, type = "delta", firstSequence = 11, sequence = 12, asks = [[101, 0], [100.5, 1]], bids = []),
+        dict(market, type = "delta", sequence = 13, asks = [], bids = [[99.5, 2]]),
+        dict(market, type = "delta", sequence = 16, asks = [[103, 1]], bids = []), # Gap
+        dict(market, type = "snapshot", sequence = 17, asks = [[100.5, 1], [103, 1]], bids = [[99.5, 2], [99, 4]]),
+        dict(market, type = "delta", sequence = 18, asks = [], bids = [[99, 0]]),
+    ]
+    with tempfile.NamedTemporaryFile("w", suffix = ".jsonl", delete = False) as replayFile:
+        for record in records: replayFile.write(json.dumps(record) + "\n")
+
+    async def main():
+        manager = LocalOrderbookManager(ReplayFeed(replayFile.name),
+                                        onUpdate = lambda orderbook: print(orderbook.sequence, orderbook.book))
+        orderbook = manager.track("Replay", "KRW", "BTC")
+        await manager.tasks[("Replay", "KRW", "BTC")]
+        print("Final:", manager.get("Replay", "KRW", "BTC"), "resyncs:", orderbook.resyncCount)
+        await manager.close()
+
+    try: asyncio.run(main())
+    finally: os.remove(replayFile.name)
@@ -0,0 +1,307 @@
+"""
+<module AutoTrade.connection.order_tracker>
+In-memory state of orders created by CCXTConnection.
+Statuses are reconciled by one fetchOpenOrders sweep per market instead of one fetchOrder call per order.
+"""
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Libraries
+
+# Standard libraries
+import asyncio
+import time
+from collections import namedtuple, deque
+from decimal import Decimal
+from itertools import count
+
+# External libraries
+
+# Custom libraries
+import connection.errors as cerr
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Tracked order and events
+
+class TrackedOrder:
+    """
+    <class TrackedOrder>
+    Local state of single order. Price and amounts follow the market orientation of CCXTConnection;
+    [1 quote = price base], and amount and filled are in quote.
+    """
+
+    def __init__(self, exchange: str, orderID: str, base: str, quote: str, price, amount, buy: bool,
+                 timestamp: int = None):
+        self.exchange, self.orderID, self.base, self.quote = exchange, orderID, base, quote
+        self.price, self.amount, self.buy = Decimal(str(price)), Decimal(str(amount)), buy
+        self.filled = Decimal(0)
+        self.average = None # Average fill price if known
+        self.status = "open" # "open", "closed" or "canceled"
+        self.createdTime = self.updatedTime = time.time()
+        self.timestamp = timestamp # Creation time given by exchange in epoch milliseconds, None if not given
+
+    @property
+    def remaining(self) -> Decimal: return self.amount - self.filled
+
+    @property
+    def symbol(self) -> str: return "%s/%s" % (self.quote, self.base)
+
+    def __repr__(self):
+        return "<TrackedOrder %s %s %s %s %s at %s, filled %s/%s>" % (
+            self.exchange, self.orderID, self.status, "buy" if self.buy else "sell", self.symbol,
+            self.price, self.filled, self.amount)
+
+# kind: "created" when recorded, "fill" for newly filled amount(filled > 0) at price of that fill,
+#       "closed" when fully filled, "canceled" when cancelled.
+# timestamp: Exchange time of the change in epoch milliseconds, None if exchange didn't provide it.
+OrderEvent = namedtuple("OrderEvent", ["kind", "order", "filled", "price", "timestamp"])
+
+class ReconcileError(cerr.AutoTradeConnectionError):
+    """
+    <class ReconcileError> inherited from AutoTradeConnectionError
+    Used when tracked orders of some markets failed to be reconciled.
+    """
+    def __init__(self, failures: dict):
+        super().__init__("Failed to reconcile orders of %s" % (", ".join(
+            "%s(<%s: %s>)" % (market, type(err).__name__, err) for market, err in failures.items()),))
+        self.failures = failures # {(exchange, base, quote): Exception}
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Tracker
+
+class OrderTracker:
+    """
+    <class OrderTracker>
+    Record every order created by CCXTConnection and reconcile their statuses in batches:
+        1. One fetchOpenOrders per market having open tracked orders; Updates filled amounts of open orders.
+        2. Orders disappeared from open orders are resolved by one fetchClosedOrders per market if supported,
+           and the rest by fetchOrder.
+    Creation, fill, close and cancel events are published to subscribers.
+    Markets failed to reconcile raise ReconcileError to the caller of OrderTracker.reconcile after the others are done.
+    """
+
+    def __init__(self, connection, historySize: int = 1000, sinceMargin: float = 60.0):
+        """
+        <method OrderTracker.__init__>
+        :param connection: CCXTConnection.
+        :param historySize: Number of finished orders kept in self.history.
+        :param sinceMargin: Seconds subtracted from the earliest creation time for fetchClosedOrders' since,
+            to cover clock differences between exchanges and this process.
+        """
+        self.connection = connection
+        self.sinceMargin = sinceMargin
+        self.orders = {} # {(exchange, orderID): TrackedOrder} of open orders
+        self.history = deque(maxlen = historySize) # Finished TrackedOrders
+        self.subscribers = {} # {token: callback}
+        self.__counter = count()
+        self.__sweeper = None
+
+    def __len__(self): return len(self.orders)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    # Recording
+
+    def record(self, exchange: str, orderID: str, base: str, quote: str, price, amount, buy: bool,
+               timestamp: int = None) -> TrackedOrder:
+        """
+        <method OrderTracker.record>
+        Start tracking created order. Given market should be the actual market, not reversed one.
+        :param timestamp: Creation time given by exchange in epoch milliseconds, if available.
+        """
+        order = TrackedOrder(exchange, orderID, base, quote, price, amount, buy, timestamp)
+        self.orders[exchange, orderID] = order
+        self.__emit("created", order, timestamp = timestamp)
+        return order
+
+    def get(self, exchange: str, orderID: str) -> TrackedOrder:
+        """
+        <method OrderTracker.get>
+        :return: Tracked order of given ID, including finished orders in history. None if not found.
+        """
+        if (exchange, orderID) in self.orders: return self.orders[exchange, orderID]
+        for order in self.history:
+            if order.exchange == exchange and order.orderID == orderID: return order
+        return None
+
+    def openOrders(self, exchange: str = None, base: str = None, quote: str = None) -> list:
+        """
+        <method OrderTracker.openOrders>
+        :return: Open tracked orders matching given filters, without any API call.
+        """
+        return [order for order in self.orders.values() if exchange in (None, order.exchange)
+                and base in (None, order.base) and quote in (None, order.quote)]
+
+    # ------------------------------------------------------------------------------------------------------------------
+    # Events
+
+    def subscribe(self, callback) -> int:
+        """
+        <method OrderTracker.subscribe>
+        :param callback: Called as callback(OrderEvent). Coroutine functions are scheduled as tasks.
+        :return: Token for unsubscribe.
+        """
+        token = next(self.__counter)
+        self.subscribers[token] = callback
+        return token
+
+    def unsubscribe(self, token: int): self.subscribers.pop(token, None)
+
+    def __emit(self, kind: str, order: TrackedOrder, filled: Decimal = Decimal(0), price: Decimal = None,
+               timestamp: int = None):
+        event = OrderEvent(kind, order, filled, price if price is not None else order.price, timestamp)
+        for callback in tuple(self.subscribers.values()):
+            try:
+                result = callback(event)
+                if asyncio.iscoroutine(result): asyncio.ensure_future(result)
+            except Exception as err:
+                print("[Warning] Order event subscriber raised <%s: %s>" % (type(err).__name__, err))
+
+    def apply(self, order: TrackedOrder, fetched: dict):
+        """
+        <method OrderTracker.apply>
+        Update tracked order from ccxt order structure and emit events for changes.
+        """
+        filled = Decimal(str(fetched.get("filled") or 0))
+        average = fetched.get("average")
+        if filled > order.filled:
+            delta, fillPrice = filled - order.filled, order.price
+            if average: # Price of this fill from change of total cost
+                average = Decimal(str(average))
+                fillPrice = (average * filled - (order.average or order.price) * order.filled) / delta
+                order.average = average
+            order.filled = filled
+            order.updatedTime = time.time()
+            self.__emit("fill", order, delta, fillPrice, fetched.get("lastTradeTimestamp"))
+        status = fetched.get("status")
+        if status in ("closed", "canceled", "cancelled", "expired", "rejected"):
+            order.status = "closed" if status == "closed" else "canceled"
+            order.updatedTime = time.time()
+            self.orders.pop((order.exchange, order.orderID), None)
+            self.history.append(order)
+            self.__emit(order.status, order, timestamp = fetched.get("lastUpdateTimestamp") or
+                        (fetched.get("lastTradeTimestamp") if status == "closed" else None))
+
+    # ------------------------------------------------------------------------------------------------------------------
+    # Reconciliation
+
+    async def reconcile(self, exchange: str = None):
+        """
+        <async method OrderTracker.reconcile>
+        Synchronize all open tracked orders(only of given exchange if given) with exchanges by batched sweeps.
+        Failure of one market doesn't stop other markets.
+        :raise ReconcileError: If any market failed, after all markets are tried.
+        """
+        markets = {}
+        for order in self.orders.values():
+            if exchange in (None, order.exchange):
+                markets.setdefault((order.exchange, order.base, order.quote), []).append(order)
+        results = await asyncio.gather(*(self.__reconcileMarket(*market, orders) for market, orders in markets.items()),
+                                       return_exceptions = True)
+        failures = {market: result for market, result in zip(markets, results) if isinstance(result, Exception)}
+        if failures: raise ReconcileError(failures)
+
+    async def __reconcileMarket(self, exchange: str, base: str, quote: str, orders: list):
+        """
+        <async method OrderTracker.__reconcileMarket>
+        Reconcile tracked orders of single market.
+        """
+        connection = self.connection
+        openOrders = {fetched["id"]: fetched for fetched in await connection.fetchOpenOrders(exchange, base, quote)}
+        missing = []
+        for order in orders:
+            if order.orderID in openOrders: self.apply(order, openOrders[order.orderID])
+            else: missing.append(order)
+        if not missing: return
+
+        # Orders no more open; Resolve by closed orders sweep, then individual fetch
+        if connection.exchanges[exchange].has.get("fetchClosedOrders"):
+            since = min(order.timestamp if order.timestamp is not None else int(order.createdTime * 1000)
+                        for order in missing) - int(self.sinceMargin * 1000)
+            closedOrders = {fetched["id"]: fetched for fetched in await connection._exchangeCall(
+                exchange, "fetchClosedOrders", missing[0].symbol, since)}
+            unresolved = []
+            for order in missing:
+                if order.orderID in closedOrders: self.apply(order, closedOrders[order.orderID])
+                else: unresolved.append(order)
+            missing = unresolved
+        for order in missing:
+            self.apply(order, await connection._exchangeCall(exchange, "fetchOrder", order.orderID, order.symbol))
+
+    async def run(self, interval: float = 5.0):
+        """
+        <async method OrderTracker.run>
+        Reconcile periodically while there are open orders. Failure is printed and retried at next round.
+        """
+        while True:
+            startTime = time.monotonic()
+            if self.orders:
+                try: await self.reconcile()
+                except ReconcileError as err: print("[Warning] %s" % (err,))
+            await asyncio.sleep(max(0.0, interval - (time.monotonic() - startTime)))
+
+    def start(self, interval: float = 5.0):
+        """
+        <method OrderTracker.start>
+        Start periodic reconciliation in background. Should be called in running event loop.
+        """
+        if self.__sweeper is not None and not self.__sweeper.done():
+            raise cerr.InvalidError("Order tracker is already running")
+        self.__sweeper = asyncio.ensure_future(self.run(interval))
+
+    async def stop(self):
+        """
+        <async method OrderTracker.stop>
+        Stop periodic reconciliation.
+        """
+        if self.__sweeper is not None:
+            self.__sweeper.cancel()
+            await asyncio.gather(self.__sweeper, return_exceptions = True)
+            self.__sweeper = None
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Functionality Testing
+
+if __name__ == "__main__":
+
+    # Fake connection where first order is partially filled then closed, and second one is cancelled
+    class FakeExchange: has = {"fetchClosedOrders": True}
+    class FakeConnection:
+        exchanges = {"Fake": FakeExchange()}
+        step, since = 0, None
+        async def fetchOpenOrders(self, exchange, base, quote):
+            if base == "USDT": raise ValueError("Market is down")
+            return [{"id": "A", "filled": 0.4, "status": "open"}, {"id": "B", "filled": 0, "status": "open"}] \
+                if self.step == 0 else []
+        async def _exchangeCall(self, exchange, method, symbol, since):
+            assert method == "fetchClosedOrders"
+            self.since = since
+            return [{"id": "A", "filled": 1, "average": 100.5, "status": "closed"},
+                    {"id": "B", "filled": 0, "status": "canceled"}, {"id": "D", "filled": 1, "status": "closed"}]
+
+    async def main():
+        connection = FakeConnection()
+        tracker = OrderTracker(connection)
+        events = []
+        tracker.subscribe(print)
+        tracker.subscribe(lambda event: events.append((event.kind, event.order.orderID, event.filled)))
+        tracker.record("Fake", "A", "KRW", "BTC", 100, 1, True, timestamp = 1000000)
+        tracker.record("Fake", "B", "KRW", "BTC", 90, 2, True, timestamp = 1000500)
+        await tracker.reconcile()
+        connection.step = 1
+        await tracker.reconcile()
+        print("Open:", tracker.openOrders(), "History:", list(tracker.history))
+        assert connection.since == 1000000 - 60000, "Closed orders should be fetched from exchange time minus margin"
+        assert events == [("created", "A", 0), ("created", "B", 0), ("fill", "A", Decimal("0.4")),
+                          ("fill", "A", Decimal("0.6")), ("closed", "A", 0), ("canceled", "B", 0)], events
+
+        # Failed market is raised to the caller after other markets are reconciled
+        tracker.record("Fake", "C", "USDT", "BTC", 30000, 1, True)
+        tracker.record("Fake", "D", "KRW", "BTC", 100, 1, True)
+        try:
+            await tracker.reconcile()
+            raise AssertionError("ReconcileError should be raised")
+        except ReconcileError as err:
+            assert list(err.failures) == [("Fake", "USDT", "BTC")], err.failures
+        assert tracker.get("Fake", "D").status == "closed" and tracker.get("Fake", "C").status == "open"
+
+    asyncio.run(main())
+    print("All checks passed")
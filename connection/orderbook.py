@@ -0,0 +1,380 @@
+"""
+<module AutoTrade.connection.orderbook>
+Array-backed sorted orderbook representation.
+Levels are stored in contiguous float64 arrays ordered from the best price, so best bid/ask is O(1)
+and depth and execution cost queries are O(log n) binary searches over prices or cumulative amounts and costs.
+"""
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Libraries
+
+# Standard libraries
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+from decimal import Decimal
+from itertools import accumulate
+from operator import mul
+
+# External libraries
+
+# Custom libraries
+import connection.errors as cerr
+
+# Same precision as CCXTConnection.makeDecimal
+_decimalUnit = Decimal("0.1") ** 20
+def _makeDecimal(value: float) -> Decimal: return Decimal(value).quantize(_decimalUnit)
+
+# bisect functions supporting descending sequences; bisect's key argument is not available before Python 3.10
+def _bisectLeft(values, value, descending: bool = False) -> int:
+    if not descending: return bisect_left(values, value)
+    low, high = 0, len(values)
+    while low < high:
+        middle = (low + high) // 2
+        if values[middle] > value: low = middle + 1
+        else: high = middle
+    return low
+
+def _bisectRight(values, value, descending: bool = False) -> int:
+    if not descending: return bisect_right(values, value)
+    low, high = 0, len(values)
+    while low < high:
+        middle = (low + high) // 2
+        if values[middle] >= value: low = middle + 1
+        else: high = middle
+    return low
+
+# Result of taking amount from one side; cost is sum of price * amount, slippage is the ratio of average price
+# worse than the best price(positive means worse).
+Execution = namedtuple("Execution", ["amount", "cost", "averagePrice", "worstPrice", "slippage"])
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Array orderbook
+
+class ArrayOrderbook:
+    """
+    <class ArrayOrderbook>
+    Orderbook of single market, following the repo convention "1 quote = price base" and amounts in quote.
+    Asks are ordered by ascending price and bids by descending price, so index 0 is the best level of each side.
+    Prices and amounts are float64; Use toDict() if Decimal orderbook is needed.
+    """
+
+    sides = ("asks", "bids")
+    reversedSides = {"asks": "bids", "bids": "asks"}
+
+    # If prices of each side are descending
+    _descending = {"asks": False, "bids": True}
+
+    def __init__(self, askPrices: array = None, askAmounts: array = None,
+                 bidPrices: array = None, bidAmounts: array = None,
+                 reversed: bool = False, timestamp: int = None, nonce: int = None):
+        """
+        <method ArrayOrderbook.__init__>
+        Given arrays are used without copying, and should be already sorted from the best level.
+        """
+        self.prices = {"asks": askPrices if askPrices is not None else array("d"),
+                       "bids": bidPrices if bidPrices is not None else array("d")}
+        self.amounts = {"asks": askAmounts if askAmounts is not None else array("d"),
+                        "bids": bidAmounts if bidAmounts is not None else array("d")}
+        for side in ArrayOrderbook.sides:
+            if len(self.prices[side]) != len(self.amounts[side]):
+                raise cerr.InvalidValueError("Length of %s prices and amounts are different" % (side,))
+        self.reversed = reversed
+        self.timestamp = timestamp
+        self.nonce = nonce
+        self._cumulativeAmounts = {} # {side: array}, lazily built and dropped on modification
+        self._cumulativeCosts = {} # {side: array}, same as above for price * amount
+
+    # ------------------------------------------------------------------------------------------------------------------
+    # Conversion
+
+    @staticmethod
+    def _parseSide(levels: list, side: str, assumeSorted: bool = True) -> (array, array):
+        """
+        <static method ArrayOrderbook._parseSide>
+        Convert ccxt's [[price, amount, ...], ...] into price and amount arrays in one transposition.
+        :param assumeSorted: If False then levels are sorted from the best price.
+        """
+        if not levels: return array("d"), array("d")
+        if not assumeSorted: levels = sorted(levels, key = lambda level: level[0], reverse = side == "bids")
+        columns = tuple(zip(*levels))
+        return array("d", columns[0]), array("d", columns[1])
+
+    @staticmethod
+    def fromCCXT(orderbook: dict, assumeSorted: bool = True):
+        """
+        <static method ArrayOrderbook.fromCCXT>
+        Make ArrayOrderbook from ccxt's fetch_order_book result.
+        ccxt already returns levels sorted from the best price, so no sorting is performed by default.
+        """
+        askPrices, askAmounts = ArrayOrderbook._parseSide(orderbook["asks"], "asks", assumeSorted)
+        bidPrices, bidAmounts = ArrayOrderbook._parseSide(orderbook["bids"], "bids", assumeSorted)
+        return ArrayOrderbook(askPrices, askAmounts, bidPrices, bidAmounts,
+                              timestamp = orderbook.get("timestamp"), nonce = orderbook.get("nonce"))
+
+    @staticmethod
+    def fromDict(orderbook: dict):
+        """
+        <static method ArrayOrderbook.fromDict>
+        Make ArrayOrderbook from CCXTConnection's {"asks": {price: amount}, "bids": {..}, "reversed": T/F} form.
+        """
+        arrays = {}
+        for side in ArrayOrderbook.sides:
+            levels = sorted(orderbook[side].items(), reverse = side == "bids")
+            arrays[side] = (array("d", (float(price) for price, _ in levels)),
+                            array("d", (float(amount) for _, amount in levels)))
+        return ArrayOrderbook(*arrays["asks"], *arrays["bids"], reversed = orderbook.get("reversed", False))
+
+    def toDict(self) -> dict:
+        """
+        <method ArrayOrderbook.toDict>
+        :return: {"asks": {Decimal price: Decimal amount}, "bids": {..}, "reversed": T/F}, same as
+            CCXTConnection.fetchOrderbook's default form.
+        """
+        result = {"reversed": self.reversed}
+        for side in ArrayOrderbook.sides:
+            result[side] = {_makeDecimal(price): _makeDecimal(amount)
+                            for price, amount in zip(self.prices[side], self.amounts[side])}
+        return result
+
+    def reversedBook(self):
+        """
+        <method ArrayOrderbook.reversedBook>
+        :return: Reversed orderbook, where price becomes 1/price and amount becomes price * amount.
+            Asks become bids and vice versa; Level order is kept because 1/price reverses monotonicity.
+        """
+        arrays = {}
+        for side in ArrayOrderbook.sides:
+            prices, amounts = self.prices[side], self.amounts[side]
+            arrays[ArrayOrderbook.reversedSides[side]] = (array("d", (1.0 / price for price in prices)),
+                                                          array("d", map(mul, prices, amounts)))
+        return ArrayOrderbook(*arrays["asks"], *arrays["bids"], reversed = not self.reversed,
+                              timestamp = self.timestamp, nonce = self.nonce)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    # Modification
+
+    def applyLevel(self, side: str, price: float, amount: float):
+        """
+        <method ArrayOrderbook.applyLevel>
+        Set amount of given price level in place. Zero amount removes the level.
+        """
+        prices, amounts = self.prices[side], self.amounts[side]
+        index = _bisectLeft(prices, price, ArrayOrderbook._descending[side])
+        if index < len(prices) and prices[index] == price:
+            if amount: amounts[index] = amount
+            else: del prices[index], amounts[index]
+        elif amount:
+            prices.insert(index, price)
+            amounts.insert(index, amount)
+        self._cumulativeAmounts.pop(side, None)
+        self._cumulativeCosts.pop(side, None)
+
+    def assign(self, other):
+        """
+        <method ArrayOrderbook.assign>
+        Replace all levels and attributes with given ArrayOrderbook's in place, so references to this object stay valid.
+        """
+        for side in ArrayOrderbook.sides:
+            self.prices[side][:] = other.prices[side]
+            self.amounts[side][:] = other.amounts[side]
+        self.reversed, self.timestamp, self.nonce = other.reversed, other.timestamp, other.nonce
+        self._cumulativeAmounts.clear()
+        self._cumulativeCosts.clear()
+
+    # ------------------------------------------------------------------------------------------------------------------
+    # Queries
+
+    def __len__(self): return len(self.prices["asks"]) + len(self.prices["bids"])
+
+    def __repr__(self):
+        return "<ArrayOrderbook %d asks, %d bids, best ask %s, best bid %s%s>" % (
+            len(self.prices["asks"]), len(self.prices["bids"]),
+            self.bestAsk(), self.bestBid(), ", reversed" if self.reversed else "")
+
+    def bestAsk(self) -> (float, float):
+        """
+        <method ArrayOrderbook.bestAsk>
+        :return: (price, amount) of the best ask, None if there is no ask.
+        """
+        return (self.prices["asks"][0], self.amounts["asks"][0]) if self.prices["asks"] else None
+
+    def bestBid(self) -> (float, float):
+        """
+        <method ArrayOrderbook.bestBid>
+        :return: (price, amount) of the best bid, None if there is no bid.
+        """
+        return (self.prices["bids"][0], self.amounts["bids"][0]) if self.prices["bids"] else None
+
+    def spread(self) -> float:
+        """
+        <method ArrayOrderbook.spread>
+        :return: Best ask price - best bid price, None if any side is empty.
+        """
+        if not self.prices["asks"] or not self.prices["bids"]: return None
+        return self.prices["asks"][0] - self.prices["bids"][0]
+
+    def cumulativeAmounts(self, side: str) -> array:
+        """
+        <method ArrayOrderbook.cumulativeAmounts>
+        :return: Array whose i-th value is the sum of amounts from the best level to i-th level of given side.
+        """
+        if side not in self._cumulativeAmounts:
+            self._cumulativeAmounts[side] = array("d", accumulate(self.amounts[side]))
+        return self._cumulativeAmounts[side]
+
+    def levelIndex(self, side: str, price: float) -> int:
+        """
+        <method ArrayOrderbook.levelIndex>
+        :return: Number of levels of given side whose prices are equal or better than given price.
+        """
+        return _bisectRight(self.prices[side], price, ArrayOrderbook._descending[side])
+
+    def depth(self, side: str, price: float) -> float:
+        """
+        <method ArrayOrderbook.depth>
+        :return: Total amount of given side available at equal or better price than given price.
+        """
+        index = self.levelIndex(side, price)
+        return self.cumulativeAmounts(side)[index - 1] if index else 0.0
+
+    def priceForAmount(self, side: str, amount: float) -> float:
+        """
+        <method ArrayOrderbook.priceForAmount>
+        :return: Worst price touched when taking given amount from given side, None if the book is not deep enough.
+        """
+        cumulative = self.cumulativeAmounts(side)
+        index = bisect_left(cumulative, amount)
+        return self.prices[side][index] if index < len(cumulative) else None
+
+    # ------------------------------------------------------------------------------------------------------------------
+    # Execution cost
+    #   Taking from asks is buying quote and taking from bids is selling quote. Reversed orderbooks work the same way,
+    #   either by ArrayOrderbook.reversedBook or ArrayOrderbook.fromDict(CCXTConnection.reversedOrderbook(~)).
+
+    def cumulativeCosts(self, side: str) -> array:
+        """
+        <method ArrayOrderbook.cumulativeCosts>
+        :return: Array whose i-th value is the sum of price * amount from the best level to i-th level of given side.
+        """
+        if side not in self._cumulativeCosts:
+            self._cumulativeCosts[side] = array("d", accumulate(map(mul, self.prices[side], self.amounts[side])))
+        return self._cumulativeCosts[side]
+
+    def execution(self, side: str, amount: float) -> Execution:
+        """
+        <method ArrayOrderbook.execution>
+        :return: Execution of taking given amount from given side at once, None if the book is not deep enough.
+        """
+        if amount <= 0: raise cerr.InvalidValueError("Given amount(%s) is not positive" % (amount,))
+        cumulativeAmounts, cumulativeCosts = self.cumulativeAmounts(side), self.cumulativeCosts(side)
+        index = bisect_left(cumulativeAmounts, amount)
+        if index >= len(cumulativeAmounts): return None
+        prices = self.prices[side]
+        cost = (cumulativeCosts[index - 1] + (amount - cumulativeAmounts[index - 1]) * prices[index]) if index \
+            else amount * prices[0]
+        averagePrice = cost / amount
+        slippage = (averagePrice - prices[0]) / prices[0] if side == "asks" else (prices[0] - averagePrice) / prices[0]
+        return Execution(amount, cost, averagePrice, prices[index], slippage)
+
+    def averagePrice(self, side: str, amount: float) -> float:
+        """
+        <method ArrayOrderbook.averagePrice>
+        :return: Volume weighted average price of taking given amount from given side, None if not deep enough.
+        """
+        execution = self.execution(side, amount)
+        return execution.averagePrice if execution is not None else None
+
+    def maxAmountWithin(self, side: str, slippageBps: float) -> float:
+        """
+        <method ArrayOrderbook.maxAmountWithin>
+        :param slippageBps: Allowed slippage of average price from the best price in basis points(1 = 0.01%).
+        :return: Max amount takeable from given side whose average price is within given slippage.
+            Total amount of the side if whole side is within it, 0 if the side is empty.
+        """
+        prices = self.prices[side]
+        if not prices: return 0.0
+        sign = 1.0 if side == "asks" else -1.0 # Average price gets larger for asks and smaller for bids
+        limit = prices[0] * (1 + sign * slippageBps / 10000)
+        cumulativeAmounts, cumulativeCosts = self.cumulativeAmounts(side), self.cumulativeCosts(side)
+
+        # Number of whole levels within limit; Average price is monotonic over levels
+        index, high = 0, len(prices)
+        while index < high:
+            middle = (index + high) // 2
+            if sign * cumulativeCosts[middle] / cumulativeAmounts[middle] <= sign * limit: index = middle + 1
+            else: high = middle
+        if index == len(prices): return cumulativeAmounts[-1]
+
+        # Partially take next level; Solve (cost + a * price) / (amount + a) = limit for a
+        amount, cost = (cumulativeAmounts[index - 1], cumulativeCosts[index - 1]) if index else (0.0, 0.0)
+        return amount + max(0.0, (limit * amount - cost) / (prices[index] - limit))
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Functionality Testing
+
+if __name__ == "__main__":
+
+    import random
+    from utility import TimeMeasure
+
+    # Synthetic 1000-level ccxt orderbook
+    levels, repeat = 1000, 200
+    random.seed(0)
+    rawBook = {
+        "asks": [[10000.0 + 0.5 * i, round(random.uniform(0.001, 3), 6)] for i in range(1, levels + 1)],
+        "bids": [[10000.0 - 0.5 * i, round(random.uniform(0.001, 3), 6)] for i in range(1, levels + 1)],
+        "timestamp": None, "nonce": None,
+    }
+
+    # Baseline: Decimal dict conversion as CCXTConnection.fetchOrderbook does
+    measure = TimeMeasure()
+    for _ in range(repeat):
+        dictBook = {side: {_makeDecimal(price): _makeDecimal(amount)
+                           for price, amount in rawBook[side]} for side in ArrayOrderbook.sides}
+    dictTime = measure.update() / repeat
+    for _ in range(repeat): arrayBook = ArrayOrderbook.fromCCXT(rawBook)
+    arrayTime = measure.update() / repeat
+    print("Parsing %d-level book: Decimal dict %.3f ms, ArrayOrderbook %.3f ms (x%.1f)" %
+          (levels, dictTime * 1e3, arrayTime * 1e3, dictTime / arrayTime))
+
+    print(arrayBook)
+    print("Depth of asks up to 10100:", arrayBook.depth("asks", 10100))
+    print("Depth of bids down to 9900:", arrayBook.depth("bids", 9900))
+    print("Price for 50 amount of asks:", arrayBook.priceForAmount("asks", 50))
+    print("Reversed:", arrayBook.reversedBook())
+
+    # Execution cost by cumulative arrays vs walking the Decimal dict level by level
+    def walkDict(book: dict, side: str, amount: Decimal) -> Decimal:
+        left, cost = amount, Decimal(0)
+        for price in sorted(book[side], reverse = side == "bids"):
+            taken = min(left, book[side][price])
+            cost, left = cost + taken * price, left - taken
+            if not left: return cost / amount
+    amount = 500
+    measure.update()
+    for _ in range(repeat): walkDict(dictBook, "asks", Decimal(amount))
+    walkTime = measure.update() / repeat
+    for _ in range(repeat): arrayBook.execution("asks", amount)
+    executionTime = measure.update() / repeat
+    print("Average price for %d amount: Dict walk %.3f ms, ArrayOrderbook %.4f ms" %
+          (amount, walkTime * 1e3, executionTime * 1e3))
+    print(arrayBook.execution("asks", amount), float(walkDict(dictBook, "asks", Decimal(amount))))
+    within = arrayBook.maxAmountWithin("bids", 10)
+    print("Max amount of bids within 10bps: %.6f," % (within,), arrayBook.execution("bids", within))
+    reversedBook = arrayBook.reversedBook()
+    print("Reversed book:", reversedBook.execution("bids", 1e5), reversedBook.maxAmountWithin("asks", 10))
+
+    # Execution and depth on a small book with known answers
+    smallBook = ArrayOrderbook.fromCCXT({"asks": [[100, 1], [101, 2], [103, 1]], "bids": [[99, 1], [98, 1]]})
+    assert smallBook.execution("asks", 2) == Execution(2, 201, 100.5, 101, 0.005)
+    assert smallBook.execution("asks", 4) == Execution(4, 405, 101.25, 103, 0.0125)
+    assert smallBook.execution("asks", 4.5) is None and smallBook.averagePrice("bids", 2) == 98.5
+    assert smallBook.maxAmountWithin("asks", 0) == 1 and smallBook.maxAmountWithin("asks", 10000) == 4
+    assert abs(smallBook.maxAmountWithin("asks", 50) - 2) < 1e-9 # (100 + 101) / 2 = 100.5 is 50bps worse
+    assert smallBook.maxAmountWithin("bids", 0) == 1 and ArrayOrderbook().maxAmountWithin("bids", 10) == 0
+    for side in ArrayOrderbook.sides: # Taking max amount within slippage stays within it
+        for bps in (1, 10, 100):
+            taken = arrayBook.execution(side, arrayBook.maxAmountWithin(side, bps))
+            assert taken.slippage <= bps / 10000 + 1e-12, (side, bps, taken)
+    print("All checks passed")
@@ -0,0 +1,334 @@
+"""
+<module AutoTrade.connection.orderbook_scheduler>
+Rate-aware continuous orderbook polling over CCXTConnection.
+Requests of each exchange are spread evenly over its rate budget instead of being fired all at once.
+"""
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Libraries
+
+# Standard libraries
+import asyncio
+import heapq
+import time
+from itertools import count
+
+# External libraries
+
+# Custom libraries
+from connection.orderbook import ArrayOrderbook
+import connection.errors as cerr
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Scheduled market
+
+class ScheduledMarket:
+    """
+    <class ScheduledMarket>
+    Polling state of single market.
+    """
+
+    def __init__(self, exchange: str, base: str, quote: str, rate: float, priority: int):
+        self.exchange, self.base, self.quote = exchange, base, quote
+        self.targetInterval = 1.0 / rate # Seconds between refreshes when the book keeps changing
+        self.interval = self.targetInterval # Current interval, stretched while the book doesn't change
+        self.priority = priority
+        self.nextDue = time.monotonic()
+        self.book = None # Last fetched book
+        self.fetchedTime = None # time.monotonic() of last successful fetch
+        self.latency = None # Seconds used by last successful fetch
+        self.error = None # Last exception, None if last fetch succeeded
+
+    @property
+    def market(self) -> tuple: return self.exchange, self.base, self.quote
+
+    def __repr__(self):
+        return "<ScheduledMarket %s %s/%s every %.3fs (target %.3fs), priority %d>" % (
+            self.exchange, self.quote, self.base, self.interval, self.targetInterval, self.priority)
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Scheduler
+
+class OrderbookScheduler:
+    """
+    <class OrderbookScheduler>
+    Keep orderbooks of scheduled markets fresh, respecting per-exchange request budget.
+        - Each market has target refresh rate and priority. If an exchange's budget is not enough for all due markets,
+          higher priority markets are fetched first.
+        - Requests of each exchange are issued one by one at even spacing of 1 / budget seconds.
+        - Markets whose top levels didn't change since the last fetch are polled slower, up to maxSlowdown times
+          of the target interval, and return to the target rate as soon as they change.
+    Fresh books are published to subscribers and kept in self.markets.
+    """
+
+    def __init__(self, connection, budgets: dict = None, utilization: float = 0.8, maxInFlight: int = 2,
+                 slowdownFactor: float = 1.5, maxSlowdown: float = 8.0, compareDepth: int = 10,
+                 processReversed: bool = True):
+        """
+        <method OrderbookScheduler.__init__>
+        :param connection: CCXTConnection.
+        :param budgets: {exchangeName: Orderbook requests per second}. If not given for an exchange,
+            utilization * (1000 / ccxt rateLimit in milliseconds) is used.
+        :param utilization: Ratio of exchange's request rate given to this scheduler; Rest is left for orders.
+        :param maxInFlight: Max number of orderbook requests waiting for response per exchange.
+        :param compareDepth: Number of top levels compared to decide if the book changed.
+        """
+        if not 0 < utilization <= 1: raise cerr.InvalidValueError("Utilization(%s) should be in (0, 1]" % (utilization,))
+        elif slowdownFactor < 1 or maxSlowdown < 1: raise cerr.InvalidValueError("Slowdown should not be less than 1")
+        self.connection = connection
+        self.budgets = dict(budgets) if budgets else {}
+        self.utilization = utilization
+        self.maxInFlight = maxInFlight
+        self.slowdownFactor, self.maxSlowdown = slowdownFactor, maxSlowdown
+        self.compareDepth = compareDepth
+        self.processReversed = processReversed
+
+        self.markets = {} # {(exchange, base, quote): ScheduledMarket}
+        self.subscribers = {} # {token: (callback, markets or None)}
+        self.__counter = count()
+        self.__queues = {} # {exchangeName: [(nextDue, order, ScheduledMarket), ..]} heap of waiting markets
+        self.__wakeups = {} # {exchangeName: asyncio.Event}, set when schedule changed
+        self.__loops = {} # {exchangeName: Running exchange loop task}
+        self.__inFlight = {} # {exchangeName: set of fetching tasks}
+
+    # ------------------------------------------------------------------------------------------------------------------
+    # Scheduling
+
+    def budget(self, exchangeName: str) -> float:
+        """
+        <method OrderbookScheduler.budget>
+        :return: Orderbook requests per second given to this scheduler for given exchange.
+        """
+        if exchangeName not in self.budgets:
+            rateLimit = getattr(self.connection.exchanges[exchangeName], "rateLimit", None) or 1000
+            self.budgets[exchangeName] = self.utilization * 1000.0 / rateLimit
+        return self.budgets[exchangeName]
+
+    def schedule(self, exchange: str, base: str, quote: str, rate: float = 1.0, priority: int = 0) -> ScheduledMarket:
+        """
+        <method OrderbookScheduler.schedule>
+        Add given market or change its rate and priority.
+        :param rate: Target refreshes per second.
+        :param priority: Higher priority markets are fetched first when the exchange's budget is short.
+        """
+        if exchange not in self.connection.exchanges: raise cerr.MarketNotSupported(exchange, base, quote)
+        elif rate <= 0: raise cerr.InvalidValueError("Refresh rate(%s) should be positive" % (rate,))
+        market = (exchange, base, quote)
+        if market in self.markets:
+            scheduled = self.markets[market]
+            scheduled.targetInterval = scheduled.interval = 1.0 / rate
+            scheduled.priority = priority
+        else:
+            scheduled = self.markets[market] = ScheduledMarket(exchange, base, quote, rate, priority)
+            self.__push(scheduled)
+        if exchange in self.__wakeups: self.__wakeups[exchange].set()
+        if self.__loops and exchange not in self.__loops: self.__startExchange(exchange)
+        return scheduled
+
+    def unschedule(self, exchange: str, base: str, quote: str):
+        """
+        <method OrderbookScheduler.unschedule>
+        Stop polling given market. Its queue entry is dropped lazily; Entries of a ScheduledMarket which is not
+        in self.markets anymore are stale, even if the same market is scheduled again later.
+        """
+        self.markets.pop((exchange, base, quote), None)
+
+    def __push(self, scheduled: ScheduledMarket):
+        heapq.heappush(self.__queues.setdefault(scheduled.exchange, []),
+                       (scheduled.nextDue, next(self.__counter), scheduled))
+
+    def __popReady(self, exchangeName: str, now: float) -> ScheduledMarket:
+        """
+        <method OrderbookScheduler.__popReady>
+        :return: Highest priority market among due markets of given exchange, None if nothing is due.
+        """
+        queue, ready = self.__queues.get(exchangeName, []), []
+        while queue and queue[0][0] <= now:
+            _, _, scheduled = heapq.heappop(queue)
+            if self.markets.get(scheduled.market) is scheduled and all(scheduled is not other for other in ready):
+                ready.append(scheduled)
+        if not ready: return None
+        chosen = min(ready, key = lambda scheduled: (-scheduled.priority, scheduled.nextDue))
+        for scheduled in ready:
+            if scheduled is not chosen: self.__push(scheduled)
+        return chosen
+
+    # ------------------------------------------------------------------------------------------------------------------
+    # Subscription
+
+    def subscribe(self, callback, markets = None) -> int:
+        """
+        <method OrderbookScheduler.subscribe>
+        :param callback: Called as callback(exchange, base, quote, book, changed) on every fresh book.
+            Coroutine functions are scheduled as tasks.
+        :param markets: Iterable of (exchange, base, quote) to receive. None means all markets.
+        :return: Token for unsubscribe.
+        """
+        token = next(self.__counter)
+        self.subscribers[token] = (callback, None if markets is None else frozenset(markets))
+        return token
+
+    def unsubscribe(self, token: int): self.subscribers.pop(token, None)
+
+    def __publish(self, scheduled: ScheduledMarket, changed: bool):
+        for callback, markets in tuple(self.subscribers.values()):
+            if markets is not None and scheduled.market not in markets: continue
+            try:
+                result = callback(scheduled.exchange, scheduled.base, scheduled.quote, scheduled.book, changed)
+                if asyncio.iscoroutine(result): asyncio.ensure_future(result)
+            except Exception as err:
+                print("[Warning] Orderbook subscriber raised <%s: %s>" % (type(err).__name__, err))
+
+    # ------------------------------------------------------------------------------------------------------------------
+    # Polling
+
+    def _isChanged(self, oldBook: ArrayOrderbook, newBook: ArrayOrderbook) -> bool:
+        """
+        <method OrderbookScheduler._isChanged>
+        :return: If top compareDepth levels of given books are different.
+        """
+        if oldBook is None: return True
+        depth = self.compareDepth
+        return any(oldBook.prices[side][:depth] != newBook.prices[side][:depth] or
+                   oldBook.amounts[side][:depth] != newBook.amounts[side][:depth] for side in ArrayOrderbook.sides)
+
+    async def __fetch(self, scheduled: ScheduledMarket):
+        """
+        <async method OrderbookScheduler.__fetch>
+        Fetch one book, adapt the market's interval and publish the book.
+        """
+        startTime = time.monotonic()
+        try:
+            book = await self.connection.fetchOrderbook(scheduled.exchange, scheduled.base, scheduled.quote,
+                                                        processReversed = self.processReversed, arrayForm = True)
+        except asyncio.CancelledError: raise
+        except Exception as err:
+            scheduled.error = err
+            print("[Warning] Failed to fetch orderbook of %s: <%s: %s>" % (scheduled.market, type(err).__name__, err))
+            return
+        scheduled.latency, scheduled.error = time.monotonic() - startTime, None
+        changed = self._isChanged(scheduled.book, book)
+        scheduled.interval = scheduled.targetInterval if changed else \
+            min(scheduled.interval * self.slowdownFactor, scheduled.targetInterval * self.maxSlowdown)
+        scheduled.book, scheduled.fetchedTime = book, time.monotonic()
+        self.__publish(scheduled, changed)
+
+    async def __exchangeLoop(self, exchangeName: str):
+        """
+        <async method OrderbookScheduler.__exchangeLoop>
+        Issue due requests of given exchange one per 1 / budget seconds.
+        """
+        wakeup, inFlight = self.__wakeups[exchangeName], self.__inFlight[exchangeName]
+        nextSlot = time.monotonic()
+        while True:
+            now = time.monotonic()
+            if now < nextSlot: await asyncio.sleep(nextSlot - now)
+            if len(inFlight) >= self.maxInFlight:
+                await asyncio.wait(inFlight, return_when = asyncio.FIRST_COMPLETED)
+                continue
+
+            # Pick highest priority due market, or wait until something becomes due
+            now = time.monotonic()
+            scheduled = self.__popReady(exchangeName, now)
+            if scheduled is None:
+                queue = self.__queues.get(exchangeName)
+                wakeup.clear()
+                try: await asyncio.wait_for(wakeup.wait(), timeout = queue[0][0] - now if queue else None)
+                except asyncio.TimeoutError: pass
+                continue
+
+            # Fire request and schedule next refresh of the market
+            task = asyncio.ensure_future(self.__fetch(scheduled))
+            inFlight.add(task)
+            task.add_done_callback(inFlight.discard)
+            scheduled.nextDue = max(scheduled.nextDue + scheduled.interval, now)
+            task.add_done_callback(lambda _, scheduled = scheduled: self.__reschedule(scheduled))
+            nextSlot = now + 1.0 / self.budget(exchangeName)
+
+    def __reschedule(self, scheduled: ScheduledMarket):
+        """
+        <method OrderbookScheduler.__reschedule>
+        Push the market back after its request is done, using the interval adapted by the response.
+        """
+        if self.markets.get(scheduled.market) is not scheduled: return
+        scheduled.nextDue = max(scheduled.nextDue, scheduled.fetchedTime or 0) if scheduled.error else \
+            max(scheduled.nextDue, scheduled.fetchedTime - scheduled.latency + scheduled.interval)
+        self.__push(scheduled)
+        if scheduled.exchange in self.__wakeups: self.__wakeups[scheduled.exchange].set()
+
+    # ------------------------------------------------------------------------------------------------------------------
+    # Start and stop
+
+    def __startExchange(self, exchangeName: str):
+        self.__wakeups[exchangeName] = asyncio.Event()
+        self.__inFlight[exchangeName] = set()
+        self.__loops[exchangeName] = asyncio.ensure_future(self.__exchangeLoop(exchangeName))
+
+    def start(self):
+        """
+        <method OrderbookScheduler.start>
+        Start polling of all scheduled exchanges. Should be called in running event loop.
+        """
+        for exchangeName in {scheduled.exchange for scheduled in self.markets.values()}:
+            if exchangeName not in self.__loops: self.__startExchange(exchangeName)
+
+    async def stop(self):
+        """
+        <async method OrderbookScheduler.stop>
+        Stop polling and cancel all in-flight requests.
+        """
+        tasks = list(self.__loops.values())
+        for inFlight in self.__inFlight.values(): tasks.extend(inFlight)
+        for task in tasks: task.cancel()
+        await asyncio.gather(*tasks, return_exceptions = True)
+        self.__loops.clear()
+        self.__inFlight.clear()
+        self.__wakeups.clear()
+
+    async def __aenter__(self):
+        self.start()
+        return self
+    async def __aexit__(self, exc_type, exc_val, exc_tb): await self.stop()
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Functionality Testing
+
+if __name__ == "__main__":
+
+    import random
+
+    # Fake connection whose BTC book changes every time, while DOGE book never changes
+    class FakeExchange: rateLimit = 100
+    class FakeConnection:
+        exchanges = {"Fake": FakeExchange()}
+        calls = {}
+        async def fetchOrderbook(self, exchangeName, base, quote, processReversed = False, arrayForm = True):
+            self.calls[quote] = self.calls.get(quote, 0) + 1
+            await asyncio.sleep(0.01)
+            price = 100 + (random.random() if quote == "BTC" else 0)
+            return ArrayOrderbook.fromCCXT({"asks": [[price + 1, 1]], "bids": [[price - 1, 1]]})
+
+    # Rescheduling a market leaves no duplicated queue entry
+    async def checkReschedule():
+        scheduler = OrderbookScheduler(FakeConnection())
+        for _ in range(3):
+            scheduler.schedule("Fake", "KRW", "ETH")
+            scheduler.unschedule("Fake", "KRW", "ETH")
+        scheduled = scheduler.schedule("Fake", "KRW", "ETH")
+        popReady = scheduler._OrderbookScheduler__popReady
+        assert popReady("Fake", time.monotonic() + 1) is scheduled
+        assert popReady("Fake", time.monotonic() + 1) is None, "Stale queue entry was served"
+        print("Rescheduling check passed")
+    asyncio.run(checkReschedule())
+
+    async def main():
+        connection = FakeConnection()
+        scheduler = OrderbookScheduler(connection)
+        scheduler.schedule("Fake", "KRW", "BTC", rate = 5, priority = 1)
+        scheduler.schedule("Fake", "KRW", "DOGE", rate = 5)
+        scheduler.subscribe(lambda exchange, base, quote, book, changed: None)
+        async with scheduler: await asyncio.sleep(3)
+        print("Calls in 3 seconds:", connection.calls)
+        for scheduled in scheduler.markets.values(): print(scheduled)
+
+    asyncio.run(main())
@@ -0,0 +1,223 @@
+"""
+<module AutoTrade.connection.routes>
+Cached currency conversion route index over CCXTConnection.markets.
+Route cost is total taker fee of markets on the route, so the cheapest route loses the least by fees.
+"""
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Libraries
+
+# Standard libraries
+import heapq
+from collections import namedtuple
+from math import log, exp
+
+# External libraries
+
+# Custom libraries
+import connection.errors as cerr
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Route step
+#   action is "sell" if source is quote of the market(quote -> base), "buy" if source is base(base -> quote),
+#   or "transfer" if currency moves between exchanges; Then market is None and exchange is (from, to).
+
+Step = namedtuple("Step", ["exchange", "source", "target", "action", "market"])
+Route = namedtuple("Route", ["cost", "steps"])
+
+def routeFeeRatio(route: Route) -> float:
+    """
+    <function routeFeeRatio>
+    :return: Ratio of amount lost by fees when converting along given route.
+    """
+    return 1 - exp(-route.cost)
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Route index
+
+class RouteIndex:
+    """
+    <class RouteIndex>
+    Cheapest conversion routes between currencies, on each exchange or across exchanges.
+    Per-exchange shortest path trees are built by Dijkstra on first query from each source currency and cached,
+    and only trees of that exchange are dropped when its markets change.
+    Building trees from all currencies of large exchange takes long, so eager building blocks the caller(event loop).
+    """
+
+    def __init__(self, defaultFee: float = 0.0025, transferFees: dict = None, eager: bool = False):
+        """
+        <method RouteIndex.__init__>
+        :param defaultFee: Taker fee used if market information doesn't have one.
+        :param transferFees: {currency: Ratio lost when moved between exchanges}. Default to 0.
+        :param eager: If True then trees from all currencies are built on update, otherwise on first query.
+        """
+        self.defaultFee = defaultFee
+        self.transferFees = dict(transferFees) if transferFees else {}
+        self.eager = eager
+        self.graphs = {} # {exchange: {currency: [(cost, neighbor, Step), ..]}}
+        self.trees = {} # {exchange: {source currency: {currency: (cost, hops, Step to reach it or None)}}}
+        self.__crossTrees = {} # {(source currency, source exchange): Same as above over (exchange, currency) nodes}
+
+    # ------------------------------------------------------------------------------------------------------------------
+    # Updating
+
+    def updateExchange(self, exchangeName: str, markets: dict):
+        """
+        <method RouteIndex.updateExchange>
+        Rebuild graph of given exchange, and drop its cached routes.
+        :param markets: {base: {quote: ccxt market}}, same as CCXTConnection.markets[exchangeName].
+        """
+        graph = {}
+        for base in markets:
+            for quote, market in markets[base].items():
+                if isinstance(market, dict) and market.get("active") is False: continue
+                fee = market.get("taker") if isinstance(market, dict) else None
+                cost = -log(1 - (float(fee) if fee is not None else self.defaultFee))
+                graph.setdefault(quote, []).append((cost, base, Step(exchangeName, quote, base, "sell", (base, quote))))
+                graph.setdefault(base, []).append((cost, quote, Step(exchangeName, base, quote, "buy", (base, quote))))
+        self.graphs[exchangeName] = graph
+        self.trees[exchangeName] = {}
+        self.__crossTrees.clear()
+        if self.eager:
+            for currency in graph: self.trees[exchangeName][currency] = RouteIndex._dijkstra(graph, (currency,))
+
+    def removeExchange(self, exchangeName: str):
+        """
+        <method RouteIndex.removeExchange>
+        Drop all routes of given exchange.
+        """
+        self.graphs.pop(exchangeName, None)
+        self.trees.pop(exchangeName, None)
+        self.__crossTrees.clear()
+
+    @staticmethod
+    def _dijkstra(graph: dict, sources) -> dict:
+        """
+        <static method RouteIndex._dijkstra>
+        :return: {node: (cost, hops, Step to reach it or None)} from given source nodes.
+            Ties of cost are broken by fewer hops.
+        """
+        tree = {}
+        heap = [(0.0, 0, order, source, None) for order, source in enumerate(sources)] # order: Unique tie breaker
+        order = len(heap)
+        while heap:
+            cost, hops, _, node, step = heapq.heappop(heap)
+            if node in tree: continue
+            tree[node] = (cost, hops, step)
+            for edgeCost, neighbor, edgeStep in graph.get(node, ()):
+                if neighbor not in tree:
+                    order += 1
+                    heapq.heappush(heap, (cost + edgeCost, hops + 1, order, neighbor, edgeStep))
+        return tree
+
+    # ------------------------------------------------------------------------------------------------------------------
+    # Queries
+
+    def currencies(self, exchangeName: str) -> set:
+        """
+        <method RouteIndex.currencies>
+        :return: Set of currencies tradable on given exchange.
+        """
+        return set(self.graphs.get(exchangeName, ()))
+
+    def __tree(self, exchangeName: str, source: str) -> dict:
+        if exchangeName not in self.graphs: raise cerr.InvalidError("No market information of exchange %s" % (exchangeName,))
+        trees = self.trees[exchangeName]
+        if source not in trees: trees[source] = RouteIndex._dijkstra(self.graphs[exchangeName], (source,))
+        return trees[source]
+
+    @staticmethod
+    def __walk(tree: dict, target, previousNode) -> Route:
+        """
+        <static method RouteIndex.__walk>
+        :return: Route to given target following steps of given tree.
+        """
+        steps, node = [], target
+        while tree[node][2] is not None:
+            step = tree[node][2]
+            steps.append(step)
+            node = previousNode(step)
+        steps.reverse()
+        return Route(tree[target][0], tuple(steps))
+
+    def route(self, source: str, target: str, exchangeName: str = None,
+              sourceExchange: str = None, targetExchange: str = None) -> Route:
+        """
+        <method RouteIndex.route>
+        Find the cheapest conversion route from source currency to target currency.
+        :param exchangeName: If given then only markets of this exchange are used.
+            Otherwise routes may transfer currencies between exchanges.
+        :param sourceExchange: Exchange holding source currency in cross-exchange routing. Any exchange if None.
+        :param targetExchange: Exchange where target currency is needed in cross-exchange routing. Any exchange if None.
+        :return: Route(cost, steps), None if not reachable.
+        """
+        if source == target and exchangeName is not None: return Route(0.0, ())
+        if exchangeName is not None:
+            tree = self.__tree(exchangeName, source)
+            return RouteIndex.__walk(tree, target, lambda step: step.source) if target in tree else None
+
+        # Cross-exchange routing over (exchange, currency) nodes
+        key = (source, sourceExchange)
+        if key not in self.__crossTrees:
+            sources = [(exchange, source) for exchange, graph in self.graphs.items()
+                       if source in graph and sourceExchange in (None, exchange)]
+            self.__crossTrees[key] = RouteIndex._dijkstra(self.__crossGraph(), sources)
+        tree = self.__crossTrees[key]
+        candidates = [(exchange, target) for exchange in self.graphs
+                      if (exchange, target) in tree and targetExchange in (None, exchange)]
+        if not candidates: return None
+        best = min(candidates, key = lambda node: tree[node][:2])
+        return RouteIndex.__walk(tree, best, lambda step: (step.exchange[0] if step.action == "transfer" else step.exchange,
+                                                         step.source))
+
+    def __crossGraph(self) -> dict:
+        """
+        <method RouteIndex.__crossGraph>
+        :return: Graph over (exchange, currency) nodes with transfer edges between same currencies.
+        """
+        graph, holders = {}, {}
+        for exchangeName, exchangeGraph in self.graphs.items():
+            for currency, edges in exchangeGraph.items():
+                graph[exchangeName, currency] = [(cost, (exchangeName, neighbor), step) for cost, neighbor, step in edges]
+                holders.setdefault(currency, []).append(exchangeName)
+        for currency, exchangeNames in holders.items():
+            cost = -log(1 - self.transferFees.get(currency, 0))
+            for source in exchangeNames:
+                for target in exchangeNames:
+                    if source != target:
+                        graph[source, currency].append(
+                            (cost, (target, currency), Step((source, target), currency, currency, "transfer", None)))
+        return graph
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Functionality Testing
+
+if __name__ == "__main__":
+
+    index = RouteIndex(transferFees = {"XRP": 0.0001})
+    index.updateExchange("Upbit", {"KRW": {"BTC": {"taker": 0.0005}, "XRP": {"taker": 0.0005}},
+                                   "BTC": {"ETH": {"taker": 0.0025}}})
+    index.updateExchange("Binance", {"USDT": {"BTC": {"taker": 0.001}, "XRP": {"taker": 0.001}},
+                                     "BTC": {"DOGE": {"taker": 0.001}}})
+    for args in (("ETH", "KRW", "Upbit"), ("KRW", "ETH", "Upbit"), ("KRW", "DOGE", None), ("KRW", "USDT", None)):
+        route = index.route(*args)
+        print(args, "fee %.4f%%" % (routeFeeRatio(route) * 100) if route else None)
+        for step in route.steps if route else (): print("   ", step)
+
+    # Expected routes, cache invalidation and eager building
+    route = index.route("ETH", "KRW", "Upbit")
+    assert [(step.source, step.target, step.action) for step in route.steps] == [("ETH", "BTC", "sell"), ("BTC", "KRW", "sell")]
+    assert abs(routeFeeRatio(route) - (1 - 0.9975 * 0.9995)) < 1e-12
+    assert index.route("KRW", "KRW", "Upbit") == Route(0.0, ()) and index.route("KRW", "DOGE", "Upbit") is None
+    route = index.route("KRW", "DOGE", sourceExchange = "Upbit", targetExchange = "Binance")
+    assert [(step.exchange, step.action) for step in route.steps] == \
+        [("Upbit", "buy"), (("Upbit", "Binance"), "transfer"), ("Binance", "buy")], route
+    index.updateExchange("Upbit", {"KRW": {"BTC": {"taker": 0.0005}}}) # ETH market delisted
+    assert index.route("ETH", "KRW", "Upbit") is None
+    eagerIndex = RouteIndex(transferFees = {"XRP": 0.0001}, eager = True)
+    for exchangeName, markets in (("Upbit", {"KRW": {"BTC": {"taker": 0.0005}}}),
+                                  ("Binance", {"USDT": {"BTC": {"taker": 0.001}}, "BTC": {"DOGE": {"taker": 0.001}}})):
+        eagerIndex.updateExchange(exchangeName, markets)
+    assert set(eagerIndex.trees["Binance"]) == {"USDT", "BTC", "DOGE"}
+    assert eagerIndex.route("KRW", "DOGE") == index.route("KRW", "DOGE")
+    print("All checks passed")
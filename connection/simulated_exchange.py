@@ -0,0 +1,559 @@
+"""
+<module AutoTrade.connection.simulated_exchange>
+Local simulated exchange implementing the part of ccxt async exchange interface used by CCXTConnection.
+Orderbooks are driven by replay files or PriceBase history, and user orders are matched by price-time priority.
+It is registered as "Simulated" in CCXTConnection.supportingExchanges, so connection layer and strategies
+can be load-tested deterministically without keys or network access.
+"""
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Libraries
+
+# Standard libraries
+import asyncio
+import json
+import random
+import time
+from bisect import bisect_right
+from collections import deque
+from datetime import timedelta
+from itertools import count
+
+# External libraries
+import ccxt.async_support as ccxt
+
+# Custom libraries
+import connection.errors as cerr
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Clock
+
+class SimulationClock:
+    """
+    <class SimulationClock>
+    Simulated time in epoch milliseconds. Real-time clock runs at given speed from start time,
+    and manual clock moves only by advance(), which makes runs deterministic.
+    Share one clock between simulated exchanges to keep them in sync.
+    """
+
+    def __init__(self, startTime: int = None, speed: float = 1.0, manual: bool = False):
+        self.startTime = startTime if startTime is not None else int(time.time() * 1000)
+        self.speed, self.manual = speed, manual
+        self.current = self.startTime
+        self.__origin = time.monotonic()
+
+    def now(self) -> int:
+        if self.manual: return self.current
+        return self.startTime + int((time.monotonic() - self.__origin) * 1000 * self.speed)
+
+    def advance(self, seconds: float):
+        """
+        <method SimulationClock.advance>
+        Move manual clock forward.
+        """
+        if not self.manual: raise cerr.InvalidError("Only manual clock can be advanced")
+        self.current += int(seconds * 1000)
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Book sources
+#   Books are ccxt-like {"bids": [[price, amount], ..], "asks": [[price, amount], ..], "timestamp": ms}
+#   in ccxt symbol orientation; Symbol "QUOTE/BASE" of CCXTConnection means price in BASE per QUOTE.
+
+class BookSource:
+    """
+    <class BookSource>
+    Abstract source of external market liquidity.
+    """
+
+    def symbols(self) -> list: raise NotImplementedError
+    def startTime(self) -> int: raise NotImplementedError
+    def book(self, symbol: str, timestamp: int) -> dict:
+        """
+        <method BookSource.book>
+        :return: Latest book of given symbol at given time, None if there is no data.
+        """
+        raise NotImplementedError
+
+class ReplayBookSource(BookSource):
+    """
+    <class ReplayBookSource> inherited from BookSource
+    Snapshots recorded as JSON lines like {"symbol": "BTC/KRW", "timestamp": ms, "bids": [..], "asks": [..]}.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.__books = {} # {symbol: ([timestamp, ..], [book, ..])}
+        records = []
+        with open(path) as replayFile:
+            for line in replayFile:
+                if line.strip(): records.append(json.loads(line))
+        records.sort(key = lambda record: record["timestamp"])
+        for record in records:
+            timestamps, books = self.__books.setdefault(record["symbol"], ([], []))
+            timestamps.append(record["timestamp"])
+            books.append(record)
+
+    def symbols(self) -> list: return list(self.__books)
+    def startTime(self) -> int: return min(timestamps[0] for timestamps, _ in self.__books.values())
+
+    def book(self, symbol: str, timestamp: int) -> dict:
+        if symbol not in self.__books: return None
+        timestamps, books = self.__books[symbol]
+        index = bisect_right(timestamps, timestamp) - 1
+        return books[index] if index >= 0 else None # No snapshot yet before the first one
+
+class OHLCVBookSource(BookSource):
+    """
+    <class OHLCVBookSource> inherited from BookSource
+    Synthetic books around close prices of OHLCV candles; Levels are spaced by levelStep ratio from
+    close * (1 -+ spread / 2), and each level has levelAmount(or volume / levels if not given).
+    """
+
+    def __init__(self, rows: dict, spread: float = 0.001, levels: int = 20, levelStep: float = 0.0005,
+                 levelAmount: float = None):
+        """
+        <method OHLCVBookSource.__init__>
+        :param rows: {symbol: [(timestamp in ms, open, high, low, close, volume), ..]}
+        """
+        self.spread, self.levels, self.levelStep, self.levelAmount = spread, levels, levelStep, levelAmount
+        self.__rows = {symbol: sorted((int(row[0]), *map(float, row[1:])) for row in symbolRows)
+                       for symbol, symbolRows in rows.items() if symbolRows}
+        self.__timestamps = {symbol: [row[0] for row in symbolRows] for symbol, symbolRows in self.__rows.items()}
+
+    @staticmethod
+    async def fromPriceBase(pricebase, markets, interval: timedelta, beginTime, endTime, **kwargs):
+        """
+        <static async method OHLCVBookSource.fromPriceBase>
+        :param pricebase: PriceBaseClass.
+        :param markets: [(exchange, base, quote), ..] in PriceBase; Symbol of each market is "QUOTE/BASE".
+        :param kwargs: Passed to OHLCVBookSource.__init__.
+        """
+        rows = {}
+        for exchange, base, quote in markets:
+            data = await pricebase.select(exchange, base, quote, interval, beginTime, endTime)
+            rows["%s/%s" % (quote, base)] = [(int(timestamp.timestamp() * 1000), *data[timestamp]) for timestamp in data]
+        return OHLCVBookSource(rows, **kwargs)
+
+    def symbols(self) -> list: return list(self.__rows)
+    def startTime(self) -> int: return min(timestamps[0] for timestamps in self.__timestamps.values())
+
+    def book(self, symbol: str, timestamp: int) -> dict:
+        if symbol not in self.__rows: return None
+        index = bisect_right(self.__timestamps[symbol], timestamp) - 1
+        if index < 0: return None # Before the first candle
+        rowTimestamp, _, _, _, close, volume = self.__rows[symbol][index]
+        amount = self.levelAmount if self.levelAmount is not None else max(volume, 1e-8) / self.levels
+        half = self.spread / 2
+        return {"timestamp": rowTimestamp,
+                "bids": [[close * (1 - half - self.levelStep * level), amount] for level in range(self.levels)],
+                "asks": [[close * (1 + half + self.levelStep * level), amount] for level in range(self.levels)]}
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Matching engine
+
+class _SymbolBook:
+    """
+    <class _SymbolBook>
+    External liquidity of single symbol with resting user orders in price-time priority.
+    External levels consumed by user orders stay consumed until the source gives a new book.
+    """
+
+    def __init__(self):
+        self.externalTimestamp = None
+        self.external = {"bids": [], "asks": []}
+        self.resting = {"buy": [], "sell": []} # Orders sorted by (-price, sequence) for buy, (price, sequence) for sell
+
+    def setExternal(self, book: dict) -> bool:
+        """
+        <method _SymbolBook.setExternal>
+        :return: If given book is new one.
+        """
+        if book is None or book["timestamp"] == self.externalTimestamp: return False
+        self.externalTimestamp = book["timestamp"]
+        self.external = {side: [[float(price), float(amount)] for price, amount, *_ in book[side]] for side in ("bids", "asks")}
+        return True
+
+    def rest(self, order: dict):
+        resting = self.resting[order["side"]]
+        resting.append(order)
+        resting.sort(key = (lambda order: (-order["price"], order["sequence"])) if order["side"] == "buy" else
+                     (lambda order: (order["price"], order["sequence"])))
+
+    def remove(self, order: dict):
+        if order in self.resting[order["side"]]: self.resting[order["side"]].remove(order)
+
+    def match(self, order: dict, resting: bool = False) -> list:
+        """
+        <method _SymbolBook.match>
+        Take external liquidity crossing given order's limit price, best level first.
+        :param resting: If True then given order is already resting in the book, so it is filled at its own price
+            as a maker; Otherwise it is filled at each taken level's price as a taker.
+        :return: [(price, amount), ..] of fills.
+        """
+        levels, fills = self.external["asks" if order["side"] == "buy" else "bids"], []
+        crosses = (lambda price: price <= order["price"]) if order["side"] == "buy" else (lambda price: price >= order["price"])
+        while levels and order["remaining"] > 1e-12 and crosses(levels[0][0]):
+            taken = min(levels[0][1], order["remaining"])
+            fills.append((order["price"] if resting else levels[0][0], taken))
+            order["remaining"] -= taken
+            levels[0][1] -= taken
+            if levels[0][1] <= 1e-12: levels.pop(0)
+        return fills
+
+    def view(self, limit: int = None) -> dict:
+        """
+        <method _SymbolBook.view>
+        :return: Aggregated levels of external liquidity and resting user orders.
+        """
+        result = {}
+        for side, orderSide in (("bids", "buy"), ("asks", "sell")):
+            levels = {}
+            for price, amount in self.external[side]: levels[price] = levels.get(price, 0.0) + amount
+            for order in self.resting[orderSide]: levels[order["price"]] = levels.get(order["price"], 0.0) + order["remaining"]
+            result[side] = sorted(([price, amount] for price, amount in levels.items()), reverse = side == "bids")[:limit]
+        return result
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Simulated exchange
+
+class SimulatedExchange:
+    """
+    <class SimulatedExchange>
+    ccxt-like simulated exchange. Configured by the dict CCXTConnection passes with the keys:
+        - "apiKey", "secret": Any strings; Private methods raise ccxt.AuthenticationError without apiKey.
+        - "source": BookSource, or path of replay file for ReplayBookSource. Without it, all books are empty.
+        - "symbols": Listed symbols. Default to symbols of source.
+        - "balance": Initial {currency: amount}.
+        - "fee": Taker fee ratio, charged on received currency. Default 0.001.
+        - "latency": Seconds per call, or (min, max) for uniform random latency from "seed". Default 0.
+        - "rateLimit": ccxt rateLimit in milliseconds. Default 50.
+        - "callLimit": (max calls, window seconds) in simulated time; Exceeding calls raise ccxt.RateLimitExceeded.
+            Default None.
+        - "clock": SimulationClock, or {"startTime": ms, "speed": float, "manual": T/F} for SimulationClock.__init__.
+            Default to real-time clock starting at source's start time.
+    Since every value can be plain JSON, a JSON key file of CCXTConnection.makeFromFile can configure it.
+    """
+
+    id = "simulated"
+    name = "Simulated"
+
+    def __init__(self, config: dict = None):
+        config = dict(config) if config else {}
+        self.apiKey, self.secret = config.get("apiKey"), config.get("secret")
+        self.options = config.get("options", {})
+        self.source = SimulatedExchange.makeSource(config.get("source"))
+        self.fee = config.get("fee", 0.001)
+        self.latency = config.get("latency", 0.0)
+        self.rateLimit = config.get("rateLimit", 50)
+        self.callLimit = config.get("callLimit")
+        self.random = random.Random(config.get("seed", 0))
+        self.clock = SimulatedExchange.makeClock(config.get("clock"), self.source)
+        self.has = {"createOrders": True, "cancelOrders": True, "fetchClosedOrders": True, "fetchOpenOrders": True}
+
+        symbols = config.get("symbols") or (self.source.symbols() if self.source else [])
+        self.markets, self.currencies = {}, {}
+        for symbol in symbols:
+            quote, base = symbol.split("/") # Same split as CCXTConnection: "QUOTE/BASE"
+            self.markets[symbol] = {"id": symbol.replace("/", ""), "symbol": symbol, "base": quote, "quote": base,
+                                    "active": True, "taker": self.fee, "maker": self.fee,
+                                    "precision": {}, "limits": {}, "info": {}}
+            for currency in (quote, base): self.currencies[currency] = {"id": currency, "code": currency}
+
+        self.balances = {currency: {"free": float(amount), "used": 0.0}
+                         for currency, amount in config.get("balance", {}).items()}
+        self.books = {symbol: _SymbolBook() for symbol in self.markets}
+        self.orders = {} # {order ID: ccxt order structure with "sequence"}
+        self.callCount = 0
+        self.__callTimes = deque()
+        self.__sequence = count(1)
+
+    @staticmethod
+    def makeSource(source) -> BookSource:
+        """
+        <static method SimulatedExchange.makeSource>
+        :param source: BookSource, path of replay file or None.
+        :return: BookSource or None.
+        """
+        if source is None or isinstance(source, BookSource): return source
+        elif isinstance(source, str): return ReplayBookSource(source)
+        raise cerr.InvalidTypeError("Invalid source type %s given" % (type(source),))
+
+    @staticmethod
+    def makeClock(clock, source: BookSource = None) -> SimulationClock:
+        """
+        <static method SimulatedExchange.makeClock>
+        :param clock: SimulationClock, keyword arguments of SimulationClock.__init__ or None.
+            Start time defaults to source's start time.
+        """
+        if isinstance(clock, SimulationClock): return clock
+        elif clock is not None and not isinstance(clock, dict):
+            raise cerr.InvalidTypeError("Invalid clock type %s given" % (type(clock),))
+        clock = dict(clock) if clock else {}
+        if clock.get("startTime") is None and source is not None: clock["startTime"] = source.startTime()
+        return SimulationClock(**clock)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    # Simulation internals
+
+    async def __call(self, private: bool = False):
+        """
+        <async method SimulatedExchange.__call>
+        Apply rate limit and latency of single API call, then catch books up to current simulated time.
+        """
+        self.callCount += 1
+        if self.callLimit:
+            maxCalls, window = self.callLimit
+            now = self.clock.now() # Simulated time, so manual clock runs are deterministic
+            while self.__callTimes and self.__callTimes[0] <= now - window * 1000: self.__callTimes.popleft()
+            if len(self.__callTimes) >= maxCalls: raise ccxt.RateLimitExceeded("Simulated call limit exceeded")
+            self.__callTimes.append(now)
+        if private and not self.apiKey: raise ccxt.AuthenticationError("Simulated private call requires apiKey")
+        latency = self.random.uniform(*self.latency) if isinstance(self.latency, (tuple, list)) else self.latency
+        if latency: await asyncio.sleep(latency)
+        self.__advanceBooks()
+
+    def __advanceBooks(self):
+        """
+        <method SimulatedExchange.__advanceBooks>
+        Load new external books and match resting orders against them in price-time priority.
+        """
+        if self.source is None: return
+        now = self.clock.now()
+        for symbol, symbolBook in self.books.items():
+            if symbolBook.setExternal(self.source.book(symbol, now)):
+                for side in ("buy", "sell"):
+                    for order in list(symbolBook.resting[side]):
+                        self.__fill(order, symbolBook.match(order, resting = True))
+                        if order["status"] != "open": symbolBook.remove(order)
+
+    def __symbol(self, symbol: str) -> _SymbolBook:
+        if symbol not in self.books: raise ccxt.BadSymbol("Simulated exchange does not have market %s" % (symbol,))
+        return self.books[symbol]
+
+    def __balance(self, currency: str) -> dict: return self.balances.setdefault(currency, {"free": 0.0, "used": 0.0})
+
+    def __fill(self, order: dict, fills: list):
+        """
+        <method SimulatedExchange.__fill>
+        Apply fills to order and balances. Buy reserves price * amount of quote currency, sell reserves amount.
+        """
+        market = self.markets[order["symbol"]]
+        for price, amount in fills:
+            order["filled"] += amount
+            order["cost"] += price * amount
+            if order["side"] == "buy":
+                quoteBalance = self.__balance(market["quote"])
+                quoteBalance["used"] -= order["price"] * amount
+                quoteBalance["free"] += (order["price"] - price) * amount
+                self.__balance(market["base"])["free"] += amount * (1 - self.fee)
+                order["fee"]["cost"] += amount * self.fee
+            else:
+                self.__balance(market["base"])["used"] -= amount
+                self.__balance(market["quote"])["free"] += price * amount * (1 - self.fee)
+                order["fee"]["cost"] += price * amount * self.fee
+        if order["filled"]:
+            order["average"] = order["cost"] / order["filled"]
+            order["lastTradeTimestamp"] = order["lastUpdateTimestamp"] = self.clock.now()
+        if order["remaining"] <= 1e-12:
+            order["remaining"] = 0.0
+            order["status"] = "closed"
+
+    def __release(self, order: dict):
+        """
+        <method SimulatedExchange.__release>
+        Return remaining reservation of given order to free balance.
+        """
+        market = self.markets[order["symbol"]]
+        currency, reserved = (market["quote"], order["price"] * order["remaining"]) if order["side"] == "buy" else \
+            (market["base"], order["remaining"])
+        balance = self.__balance(currency)
+        balance["used"] -= reserved
+        balance["free"] += reserved
+
+    @staticmethod
+    def __public(order: dict) -> dict:
+        result = {key: value for key, value in order.items() if key != "sequence"}
+        result["fee"] = dict(order["fee"])
+        return result
+
+    # ------------------------------------------------------------------------------------------------------------------
+    # ccxt interface: Markets and data
+
+    def milliseconds(self) -> int: return self.clock.now()
+
+    async def load_markets(self, reload: bool = False, params: dict = None) -> dict:
+        await self.__call()
+        return self.markets
+
+    def set_markets(self, markets: dict, currencies: dict = None):
+        self.markets = markets
+        if currencies is not None: self.currencies = currencies
+        for symbol in markets: self.books.setdefault(symbol, _SymbolBook())
+
+    async def fetch_order_book(self, symbol: str, limit: int = None, params: dict = None) -> dict:
+        await self.__call()
+        symbolBook = self.__symbol(symbol)
+        result = symbolBook.view(limit)
+        result.update({"symbol": symbol, "timestamp": symbolBook.externalTimestamp, "datetime": None, "nonce": None})
+        return result
+
+    async def fetch_balance(self, params: dict = None) -> dict:
+        await self.__call(private = True)
+        result = {"info": {}, "free": {}, "used": {}, "total": {}}
+        for currency, balance in self.balances.items():
+            free, used = balance["free"], balance["used"]
+            result[currency] = {"free": free, "used": used, "total": free + used}
+            result["free"][currency], result["used"][currency], result["total"][currency] = free, used, free + used
+        return result
+
+    # ------------------------------------------------------------------------------------------------------------------
+    # ccxt interface: Orders
+
+    def __createOrder(self, symbol: str, type: str, side: str, amount: float, price: float = None) -> dict:
+        symbolBook, market = self.__symbol(symbol), self.markets[symbol]
+        amount = float(amount)
+        if side not in ("buy", "sell"): raise ccxt.InvalidOrder("Invalid side %s" % (side,))
+        elif amount <= 0: raise ccxt.InvalidOrder("Non-positive amount %s" % (amount,))
+        if type == "market": # Market order is limit order at the worst external level
+            levels = symbolBook.external["asks" if side == "buy" else "bids"]
+            if not levels: raise ccxt.InvalidOrder("No liquidity for market order of %s" % (symbol,))
+            price = levels[-1][0]
+        elif price is None or float(price) <= 0: raise ccxt.InvalidOrder("Invalid price %s" % (price,))
+        price = float(price)
+
+        # Reserve
+        currency, reserved = (market["quote"], price * amount) if side == "buy" else (market["base"], amount)
+        balance = self.__balance(currency)
+        if balance["free"] < reserved - 1e-12:
+            raise ccxt.InsufficientFunds("%s %s needed but %s available" % (reserved, currency, balance["free"]))
+        balance["free"] -= reserved
+        balance["used"] += reserved
+
+        # Match immediately, then rest the remaining amount
+        sequence = next(self.__sequence)
+        now = self.clock.now()
+        order = {"id": "sim-%d" % (sequence,), "clientOrderId": None, "timestamp": now, "datetime": None,
+                 "lastTradeTimestamp": None, "lastUpdateTimestamp": now, "symbol": symbol, "type": type, "side": side, "price": price,
+                 "amount": amount, "filled": 0.0, "remaining": amount, "cost": 0.0, "average": None, "status": "open",
+                 "fee": {"cost": 0.0, "currency": market["base"] if side == "buy" else market["quote"]},
+                 "trades": [], "info": {}, "sequence": sequence}
+        self.orders[order["id"]] = order
+        self.__fill(order, symbolBook.match(order))
+        if order["status"] == "open":
+            if type == "market": # Unfilled market order remainder is cancelled
+                self.__release(order)
+                order["status"] = "canceled"
+            else: symbolBook.rest(order)
+        return SimulatedExchange.__public(order)
+
+    async def createOrder(self, symbol: str, type: str, side: str, amount: float, price: float = None,
+                          params: dict = None) -> dict:
+        await self.__call(private = True)
+        return self.__createOrder(symbol, type, side, amount, price)
+
+    async def createOrders(self, orders: list, params: dict = None) -> list:
+        await self.__call(private = True)
+        results = []
+        for order in orders:
+            try: results.append(self.__createOrder(order["symbol"], order["type"], order["side"],
+                                                   order["amount"], order.get("price")))
+            except ccxt.BaseError as err: results.append({"id": None, "status": "rejected", "info": str(err)})
+        return results
+
+    def __cancelOrder(self, orderID: str) -> dict:
+        if orderID not in self.orders: raise ccxt.OrderNotFound("Order %s not found" % (orderID,))
+        order = self.orders[orderID]
+        if order["status"] != "open": raise ccxt.OrderNotFound("Order %s is already %s" % (orderID, order["status"]))
+        self.books[order["symbol"]].remove(order)
+        self.__release(order)
+        order["status"] = "canceled"
+        order["lastUpdateTimestamp"] = self.clock.now()
+        return SimulatedExchange.__public(order)
+
+    async def cancelOrder(self, id: str, symbol: str = None, params: dict = None) -> dict:
+        await self.__call(private = True)
+        return self.__cancelOrder(id)
+
+    async def cancelOrders(self, ids: list, symbol: str = None, params: dict = None) -> list:
+        await self.__call(private = True)
+        results = []
+        for orderID in ids:
+            try: results.append(self.__cancelOrder(orderID))
+            except ccxt.OrderNotFound as err: results.append({"id": orderID, "status": "rejected", "info": str(err)})
+        return results
+
+    async def fetchOrder(self, id: str, symbol: str = None, params: dict = None) -> dict:
+        await self.__call(private = True)
+        if id not in self.orders: raise ccxt.OrderNotFound("Order %s not found" % (id,))
+        return SimulatedExchange.__public(self.orders[id])
+
+    async def fetchOpenOrders(self, symbol: str = None, since: int = None, limit: int = None, params: dict = None) -> list:
+        await self.__call(private = True)
+        return [SimulatedExchange.__public(order) for order in self.orders.values() if order["status"] == "open"
+                and symbol in (None, order["symbol"]) and (since is None or order["timestamp"] >= since)][:limit]
+
+    async def fetchClosedOrders(self, symbol: str = None, since: int = None, limit: int = None, params: dict = None) -> list:
+        await self.__call(private = True)
+        return [SimulatedExchange.__public(order) for order in self.orders.values() if order["status"] != "open"
+                and symbol in (None, order["symbol"]) and (since is None or order["timestamp"] >= since)][:limit]
+
+    async def close(self): pass
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Functionality Testing
+
+if __name__ == "__main__":
+
+    from pprint import pprint
+
+    rows = {"BTC/KRW": [(0, 0, 0, 0, 50000000, 10), (60000, 0, 0, 0, 49000000, 10)]}
+    clock = SimulationClock(0, manual = True)
+    exchange = SimulatedExchange({"apiKey": "simulated", "source": OHLCVBookSource(rows, levelAmount = 0.5),
+                                  "balance": {"KRW": 100000000}, "clock": clock, "latency": (0.001, 0.002)})
+
+    async def main():
+        book = await exchange.fetch_order_book("BTC/KRW", limit = 3)
+        print("Best ask %s, best bid %s" % (book["asks"][0], book["bids"][0]))
+        taker = await exchange.createOrder("BTC/KRW", "limit", "buy", 0.7, book["asks"][1][0]) # Crosses 2 levels
+        maker = await exchange.createOrder("BTC/KRW", "limit", "buy", 1, 49500000) # Rests
+        print("Taker:", taker["status"], taker["filled"], taker["average"])
+        print("Maker:", maker["status"], maker["filled"])
+        clock.advance(60) # Next candle drops price; Resting buy is filled on next call
+        print("Maker after 60 seconds:", (await exchange.fetchOrder(maker["id"]))["status"])
+        pprint({currency: balance for currency, balance in (await exchange.fetch_balance()).items()
+                if currency not in ("info", "free", "used", "total")})
+
+    asyncio.run(main())
+
+    # Resting orders fill at their own price, books are empty before the data starts, call limit uses simulated time
+    import os
+    import tempfile
+    replayPath = os.path.join(tempfile.mkdtemp(), "replay.jsonl")
+    with open(replayPath, "w") as replayFile:
+        for timestamp, bid, ask in ((1000, 99, 101), (2000, 90, 92)):
+            replayFile.write(json.dumps({"symbol": "BTC/KRW", "timestamp": timestamp,
+                                         "bids": [[bid, 1]], "asks": [[ask, 1]]}) + "\n")
+    assert ReplayBookSource(replayPath).book("BTC/KRW", 999) is None
+    assert OHLCVBookSource(rows).book("BTC/KRW", -1) is None
+
+    async def checkMatching():
+        clock = {"startTime": 0, "manual": True} # Plain values as in JSON key files
+        exchange = SimulatedExchange({"apiKey": "simulated", "source": replayPath, "clock": clock,
+                                      "balance": {"KRW": 1000}, "fee": 0, "callLimit": (2, 2)})
+        assert (await exchange.fetch_order_book("BTC/KRW"))["asks"] == [] # Clock at 0, before the first snapshot
+        exchange.clock.advance(1)
+        order = await exchange.createOrder("BTC/KRW", "limit", "buy", 1, 95) # Rests below ask 101
+        assert order["status"] == "open"
+        try:
+            await exchange.fetchOrder(order["id"])
+            raise AssertionError("Third call within 2 simulated seconds should be limited")
+        except ccxt.RateLimitExceeded: pass
+        exchange.clock.advance(1) # Ask drops to 92, below the resting price
+        order = await exchange.fetchOrder(order["id"])
+        assert order["status"] == "closed" and order["average"] == 95, order
+        exchange.clock.advance(2)
+        balance = await exchange.fetch_balance()
+        assert balance["KRW"] == {"free": 905, "used": 0, "total": 905} and balance["BTC"]["free"] == 1, balance
+
+    asyncio.run(checkMatching())
+    print("All checks passed")